@@ -0,0 +1,531 @@
+"""Non-interactive batch extraction over a directory or glob of PDFs.
+
+Usage:
+    python batch.py data/ --tasks revenue ipo --output results.jsonl
+
+Each (file, task) pair flows through a staged pipeline: extract, detect
+language, keyword-split, embed, retrieve, LLM. Every stage has its own
+bounded input queue and worker pool, so a slow stage applies back-pressure
+instead of letting work pile up in memory. One JSON record per (file, task)
+is written with the answer and per-stage timings.
+"""
+
+import argparse
+import glob
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, List, Optional
+
+from extraction import extract_pages, extractor_version, open_page_cache
+from llm_report import (
+    embedding_model_key,
+    initialize_embeddings,
+    initialize_qa_chain,
+    retrieve_documents,
+    split_pages,
+)
+from numeric_extractor import FAST_PATH_CONFIDENCE, extract_revenue, to_result
+from language import detect_document_language
+from page_filter import FALLBACKS, select_pages
+from metrics import Profiler, metrics
+from qa_async import AsyncQAExecutor, BackgroundLoop
+from queries import get_query, get_retrieval_queries
+from retrieval import HybridRetriever
+from schemas import output_instructions, parse_result
+
+TASKS = {"revenue": "1", "ipo": "2"}
+
+
+def _select_and_extract(pdf_path, choices, cache, top_pages, fallback):
+    """Worker entry point: prefilter pages for every task, extract the union."""
+    page_numbers = set()
+    for choice in choices:
+        selection = select_pages(
+            pdf_path, choice, top_n=top_pages, fallback=fallback, cache=cache
+        )
+        if selection.pages is None:
+            page_numbers = None
+            break
+        page_numbers.update(selection.pages)
+    if page_numbers is not None:
+        page_numbers = sorted(page_numbers)
+    return page_numbers, extract_pages(pdf_path, 1, cache, page_numbers)
+
+
+def _measured(fn, *args):
+    """Worker entry point: run ``fn`` and return its metrics with the result."""
+    metrics.reset()
+    result = fn(*args)
+    return result, metrics.snapshot()
+
+
+_DONE = object()
+
+
+class Stage:
+    """A pool of worker threads between two bounded queues.
+
+    ``fn`` receives one job dict and returns an iterable of job dicts for
+    the next stage (fan-out is allowed). Jobs that already carry an error,
+    or were answered early (``done``), skip the work and are passed
+    straight through so they still reach the output file.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[dict], Iterable[dict]],
+        workers: int,
+        inbox: queue.Queue,
+        outbox: queue.Queue,
+        profiler: Optional[Profiler] = None,
+    ):
+        self.name = name
+        self.fn = fn
+        self.inbox = inbox
+        self.outbox = outbox
+        self.profiler = profiler or Profiler(None)
+        self.threads = [
+            threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        self._remaining = workers
+        self._lock = threading.Lock()
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def _run(self):
+        with self.profiler.thread():
+            self._loop()
+
+    def _loop(self):
+        while True:
+            job = self.inbox.get()
+            if job is _DONE:
+                # Re-queue for sibling workers; the last one out closes the stage
+                self.inbox.put(_DONE)
+                with self._lock:
+                    self._remaining -= 1
+                    if self._remaining == 0:
+                        self.outbox.put(_DONE)
+                return
+
+            if job.get("error") or job.get("done"):
+                self.outbox.put(job)
+                continue
+
+            start = time.perf_counter()
+            try:
+                results = list(self.fn(job))
+            except Exception as e:
+                job["error"] = f"{self.name}: {e}"
+                job["traceback"] = traceback.format_exc()
+                results = [job]
+            elapsed = time.perf_counter() - start
+            for result in results:
+                result.setdefault("timings", {})[self.name] = round(elapsed, 4)
+                self.outbox.put(result)
+
+
+class BatchPipeline:
+    """Wire the extraction stages together and run them over many PDFs."""
+
+    def __init__(
+        self,
+        tasks: List[str],
+        window_chars: int = 1500,
+        max_docs: int = 5,
+        extract_workers: int = 2,
+        split_workers: int = 2,
+        embed_workers: int = 1,
+        retrieve_workers: int = 2,
+        llm_workers: int = 4,
+        queue_size: int = 8,
+        requests_per_minute: float = 50,
+        tokens_per_minute: float = 40000,
+        max_retries: int = 5,
+        bypass_llm_cache: bool = False,
+        fast_path: bool = True,
+        prefilter: bool = False,
+        top_pages: int = 16,
+        prefilter_fallback: str = "full",
+        cache_size: int = 64,
+        profiler: Optional[Profiler] = None,
+    ):
+        from embedding_cache import CachedEmbeddings
+        from response_cache import ResponseCache
+        from vector_store import PersistentVectorStore
+
+        self.tasks = tasks
+        self.window_chars = window_chars
+        self.max_docs = max_docs
+        self.fast_path = fast_path
+        self.prefilter = prefilter
+        self.top_pages = top_pages
+        self.prefilter_fallback = prefilter_fallback
+        self.cache_size = cache_size
+        self.page_cache = open_page_cache()
+        self.embeddings = CachedEmbeddings(
+            initialize_embeddings(None), embedding_model_key()
+        )
+        self.store = PersistentVectorStore(self.embeddings, embedding_model_key())
+        # FAISS is not safe for concurrent add/search
+        self._store_lock = threading.Lock()
+        # doc_key -> HybridRetriever over that PDF's chunks, least recent first
+        self._retrievers = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._process_pool = ProcessPoolExecutor(max_workers=extract_workers)
+        # LLM calls share one event loop so the rate limits apply globally
+        self._qa_loop = BackgroundLoop()
+        self.qa = AsyncQAExecutor(
+            initialize_qa_chain(),
+            max_concurrency=llm_workers,
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute,
+            max_retries=max_retries,
+            response_cache=ResponseCache(),
+            bypass_cache=bypass_llm_cache,
+        )
+
+        plan = [
+            ("extract", self._extract, extract_workers),
+            ("detect", self._detect, 1),
+            ("split", self._split, split_workers),
+            ("embed", self._embed, embed_workers),
+            ("retrieve", self._retrieve, retrieve_workers),
+            ("llm", self._ask, llm_workers),
+        ]
+        self.inbox = queue.Queue(maxsize=queue_size)
+        self.stages = []
+        inbox = self.inbox
+        for name, fn, workers in plan:
+            outbox = queue.Queue(maxsize=queue_size)
+            self.stages.append(Stage(name, fn, workers, inbox, outbox, profiler))
+            inbox = outbox
+        self.outbox = inbox
+
+    # ---- stages ----
+
+    def _extract(self, job):
+        # CPU-bound: run in a worker process; the page cache is shared on disk
+        if self.prefilter:
+            (job["page_numbers"], job["pages"]), snapshot = self._process_pool.submit(
+                _measured,
+                _select_and_extract,
+                job["file"],
+                [TASKS[task] for task in self.tasks],
+                self.page_cache,
+                self.top_pages,
+                self.prefilter_fallback,
+            ).result()
+        else:
+            job["page_numbers"] = None
+            job["pages"], snapshot = self._process_pool.submit(
+                _measured, extract_pages, job["file"], 1, self.page_cache
+            ).result()
+        metrics.merge(snapshot)
+        job["page_count"] = len(job["pages"])
+        yield job
+
+    def _detect(self, job):
+        detector = detect_document_language(job["pages"])
+        job["language"] = detector.language
+        job["page_languages"] = {
+            page: result.language for page, result in detector.pages.items()
+        }
+        for task in self.tasks:
+            yield dict(job, task=task, timings=dict(job.get("timings", {})))
+
+    def _split(self, job):
+        choice = TASKS[job["task"]]
+        job["query"] = get_query(language=job["language"], task=choice)
+        job["retrieval_queries"] = get_retrieval_queries(
+            language=job["language"], task=choice
+        )
+        if job["query"] is None:
+            raise ValueError(f"no query for language {job['language']!r}")
+        job["query"] += output_instructions(choice)
+
+        job["doc_key"] = self.store.document_key(
+            self.page_cache.key_for(job["file"]),
+            choice=choice,
+            window_chars=self.window_chars,
+            extractor=extractor_version(),
+            pages=job["page_numbers"],
+        )
+        if job["doc_key"] not in self.store:
+            job["docs"] = split_pages(
+                job["pages"],
+                job["file"],
+                window_chars=self.window_chars,
+                choice=choice,
+                verbose=False,
+            )
+        del job["pages"]
+
+        if self.fast_path and choice == "1":
+            docs = job.get("docs")
+            if docs is None:
+                with self._store_lock:
+                    docs = self.store.documents(job["doc_key"])
+            result = extract_revenue(docs)
+            job["numeric"] = result._asdict()
+            if result.confidence >= FAST_PATH_CONFIDENCE:
+                job["result"] = to_result(result)._asdict()
+                job["answer"] = json.dumps(job["result"], ensure_ascii=False)
+                job["pages_cited"] = [result.page] if result.page else []
+                job.pop("docs", None)
+                job["done"] = True
+        yield job
+
+    def _embed(self, job):
+        docs = job.pop("docs", None)
+        if docs:
+            job["chunks"] = len(docs)
+            # Embed outside the lock; add_documents then hits the cache
+            self.embeddings.embed_documents([doc.page_content for doc in docs])
+            with self._store_lock:
+                self.store.add_documents(job["doc_key"], docs, save=False)
+        yield job
+
+    def _retrieve(self, job):
+        doc_key = job["doc_key"]
+        retriever = self._cached(doc_key, lambda: self._retriever(doc_key))
+        job["context"] = retrieve_documents(
+            retriever,
+            job["query"],
+            max_docs=self.max_docs,
+            retrieval_queries=job["retrieval_queries"],
+        )
+        yield job
+
+    def _cached(self, key, factory):
+        with self._cache_lock:
+            if key in self._retrievers:
+                self._retrievers.move_to_end(key)
+                return self._retrievers[key]
+        # Built outside the lock; two workers racing on a new key both build
+        value = factory()
+        with self._cache_lock:
+            self._retrievers[key] = value
+            while len(self._retrievers) > self.cache_size:
+                self._retrievers.popitem(last=False)
+        return value
+
+    def _retriever(self, doc_key: str) -> HybridRetriever:
+        # The per-document index is a private copy, searched without the lock
+        with self._store_lock:
+            index = self.store.document_index(doc_key)
+            documents = self.store.documents(doc_key)
+        return HybridRetriever(index, documents, embeddings=self.embeddings)
+
+    def _ask(self, job):
+        context = job.pop("context")
+        if not context:
+            raise ValueError("no suitable documents found within token limits")
+        result = self._qa_loop.submit(self.qa.ask(context, job["query"]))
+        job["llm_attempts"] = result.attempts
+        if result.error is not None:
+            raise result.error
+        job["answer"] = result.answer
+        parsed, errors = parse_result(TASKS[job["task"]], result.answer)
+        job["result"] = parsed._asdict()
+        if errors:
+            job["field_errors"] = errors
+        job["pages_cited"] = sorted(
+            {page for doc in context for page in doc.metadata.get("pages", [])}
+        )
+        yield job
+
+    # ---- driver ----
+
+    def run(self, files: List[str], output) -> int:
+        """Process ``files`` and write one JSON line per (file, task)."""
+        for stage in self.stages:
+            stage.start()
+
+        def feed():
+            for path in files:
+                self.inbox.put({"file": path})
+            self.inbox.put(_DONE)
+
+        threading.Thread(target=feed, name="feeder", daemon=True).start()
+
+        written = 0
+        try:
+            while True:
+                job = self.outbox.get()
+                if job is _DONE:
+                    break
+                output.write(json.dumps(_record(job), ensure_ascii=False) + "\n")
+                output.flush()
+                written += 1
+                metrics.incr("records")
+                if job.get("error"):
+                    metrics.incr("errors")
+        finally:
+            self._process_pool.shutdown()
+            self._qa_loop.close()
+            with self._store_lock:
+                if self.store.index is not None:
+                    self.store.save()
+        return written
+
+
+def _record(job: dict) -> dict:
+    record = {
+        "file": job["file"],
+        "task": job.get("task"),
+        "language": job.get("language"),
+        "page_languages": job.get("page_languages"),
+        "page_count": job.get("page_count"),
+        "pages_read": (
+            len(job["page_numbers"])
+            if job.get("page_numbers") is not None
+            else job.get("page_count")
+        ),
+        "chunks": job.get("chunks"),
+        "answer": job.get("answer"),
+        "result": job.get("result"),
+        "field_errors": job.get("field_errors"),
+        "pages_cited": job.get("pages_cited"),
+        "llm_attempts": job.get("llm_attempts"),
+        "numeric": job.get("numeric"),
+        "error": job.get("error"),
+        "timings": job.get("timings", {}),
+    }
+    if job.get("error") and job.get("task") is None:
+        # Failed before fan-out: the record stands for every requested task
+        record["task"] = "*"
+    return record
+
+
+def find_pdfs(patterns: List[str]) -> List[str]:
+    """Expand directories and glob patterns into a sorted list of PDFs."""
+    files = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "**", "*.pdf")
+        files.update(
+            path
+            for path in glob.glob(pattern, recursive=True)
+            if path.lower().endswith(".pdf")
+        )
+    return sorted(files)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Run revenue/IPO extraction over many PDFs."
+    )
+    parser.add_argument("inputs", nargs="+", help="PDF directories or glob patterns")
+    parser.add_argument(
+        "--tasks", nargs="+", choices=sorted(TASKS), default=["revenue"]
+    )
+    parser.add_argument("--output", default="-", help="JSON Lines file (- = stdout)")
+    parser.add_argument("--window-chars", type=int, default=1500)
+    parser.add_argument("--max-docs", type=int, default=5)
+    parser.add_argument("--queue-size", type=int, default=8)
+    parser.add_argument("--extract-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--split-workers", type=int, default=2)
+    parser.add_argument("--embed-workers", type=int, default=1)
+    parser.add_argument("--retrieve-workers", type=int, default=2)
+    parser.add_argument("--llm-workers", type=int, default=4)
+    parser.add_argument("--requests-per-minute", type=float, default=50)
+    parser.add_argument("--tokens-per-minute", type=float, default=40000)
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument(
+        "--bypass-llm-cache",
+        action="store_true",
+        help="ignore cached LLM answers (fresh answers are still stored)",
+    )
+    parser.add_argument(
+        "--no-fast-path",
+        action="store_true",
+        help="always ask the LLM, even when revenue can be read from tables",
+    )
+    parser.add_argument(
+        "--prefilter",
+        action="store_true",
+        help="only extract the pages ranked highest by outline and content streams",
+    )
+    parser.add_argument("--top-pages", type=int, default=16)
+    parser.add_argument(
+        "--prefilter-fallback",
+        choices=FALLBACKS,
+        default="full",
+        help="pages to read when the prefilter finds nothing",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=64,
+        help="documents whose retrievers are kept in memory",
+    )
+    parser.add_argument("--metrics", help="write a JSON run report to this file")
+    parser.add_argument(
+        "--prometheus", help="write the run metrics in Prometheus text format"
+    )
+    parser.add_argument(
+        "--profile", help="write cProfile stats of every stage thread to this file"
+    )
+    args = parser.parse_args(argv)
+
+    files = find_pdfs(args.inputs)
+    if not files:
+        parser.error("no PDF files found")
+    print(
+        f"Processing {len(files)} PDFs for tasks: {', '.join(args.tasks)}",
+        file=sys.stderr,
+    )
+
+    metrics.reset()
+    profiler = Profiler(args.profile)
+    pipeline = BatchPipeline(
+        args.tasks,
+        window_chars=args.window_chars,
+        max_docs=args.max_docs,
+        extract_workers=args.extract_workers,
+        split_workers=args.split_workers,
+        embed_workers=args.embed_workers,
+        retrieve_workers=args.retrieve_workers,
+        llm_workers=args.llm_workers,
+        queue_size=args.queue_size,
+        requests_per_minute=args.requests_per_minute,
+        tokens_per_minute=args.tokens_per_minute,
+        max_retries=args.max_retries,
+        bypass_llm_cache=args.bypass_llm_cache,
+        fast_path=not args.no_fast_path,
+        prefilter=args.prefilter,
+        top_pages=args.top_pages,
+        prefilter_fallback=args.prefilter_fallback,
+        cache_size=args.cache_size,
+        profiler=profiler,
+    )
+
+    start = time.perf_counter()
+    if args.output == "-":
+        written = pipeline.run(files, sys.stdout)
+    else:
+        with open(args.output, "w", encoding="utf-8") as output:
+            written = pipeline.run(files, output)
+    print(
+        f"Wrote {written} records in {time.perf_counter() - start:.1f}s",
+        file=sys.stderr,
+    )
+    print(f"Stage timings: {metrics.summary()}", file=sys.stderr)
+    profiler.dump()
+    metrics.export(args.metrics, args.prometheus, files=len(files), tasks=args.tasks)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Compare the torch and ONNX int8 embedding backends: parity and throughput.
+
+Usage:
+    python benchmarks/bench_embeddings.py [pdf ...] [--threads 1 4]
+        [--limit 512] [--min-cosine 0.98] [--min-recall 0.9] [--model NAME]
+
+Chunks are 1500-character windows of the pages of the given PDFs
+(default: every PDF in data/). Each backend and thread count runs in a
+fresh process, so the reported peak RSS is what one worker would need
+(model load included). The ONNX vectors are then compared with the torch
+ones: per-chunk cosine similarity, and recall@k of the retrieval
+sub-queries from queries.py (the share of torch's top-k chunks ONNX also
+returns). The script exits non-zero if any chunk's cosine is below
+--min-cosine or the mean recall is below --min-recall. The ONNX model is
+exported on first use (see embedding_backends.py); --model also accepts
+a local sentence-transformers directory.
+"""
+
+import argparse
+import glob
+import multiprocessing
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np  # noqa: E402
+
+WINDOW = 1500
+
+
+def chunk_texts(pdf_paths, limit):
+    from extraction import extract_pages, open_page_cache
+
+    cache = open_page_cache()
+    texts = []
+    for pdf_path in pdf_paths:
+        try:
+            pages = extract_pages(pdf_path, workers=None, cache=cache)
+        except Exception as e:
+            print(f"{os.path.relpath(pdf_path, ROOT)}: skipped ({e})")
+            continue
+        text = "\n".join(pages)
+        texts.extend(text[i : i + WINDOW] for i in range(0, len(text), WINDOW))
+    return [text for text in texts if text.strip()][:limit]
+
+
+def run_backend(backend, model, threads, texts, queries):
+    """Embed ``texts`` in this (fresh) process; returns timings and vectors."""
+    os.environ["FRE_EXPERIMENTAL_ONNX"] = "1"
+    from embedding_backends import load_backend
+    from metrics import peak_rss_bytes
+
+    start = time.perf_counter()
+    embeddings = load_backend(model, backend, threads)
+    embeddings.embed_query("Total revenue")
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    seconds = time.perf_counter() - start
+    query_vectors = np.asarray(
+        [embeddings.embed_query(query) for query in queries], dtype=np.float32
+    )
+    return load_seconds, seconds, peak_rss_bytes(), vectors, query_vectors
+
+
+def recall_at(k, chunks, queries, other_chunks, other_queries):
+    expected = np.argsort(-(queries @ chunks.T), axis=1)[:, :k]
+    actual = np.argsort(-(other_queries @ other_chunks.T), axis=1)[:, :k]
+    return float(np.mean([len(set(e) & set(a)) / k for e, a in zip(expected, actual)]))
+
+
+def main():
+    from llm_report import EMBEDDING_MODEL_NAME
+    from queries import retrieval_queries
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pdfs", nargs="*")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--limit", type=int, default=512, help="max chunks")
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    parser.add_argument("--min-recall", type=float, default=0.9)
+    parser.add_argument("-k", type=int, default=5, help="recall@k")
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    args = parser.parse_args()
+
+    pdf_paths = args.pdfs or sorted(glob.glob(os.path.join(ROOT, "data", "*.pdf")))
+    texts = chunk_texts(pdf_paths, args.limit)
+    if not texts:
+        sys.exit("no text to embed")
+    queries = [query for group in retrieval_queries.values() for query in group]
+    print(f"{len(texts)} chunks of up to {WINDOW} characters, {len(queries)} queries\n")
+
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    print(
+        f"{'backend':<8} {'threads':>7} {'load s':>8} {'embed s':>8} "
+        f"{'chunks/s':>9} {'RSS MB':>8}"
+    )
+    for backend in ("torch", "onnx"):
+        for threads in args.threads:
+            with context.Pool(1) as pool:
+                load, seconds, rss, vectors, query_vectors = pool.apply(
+                    run_backend, (backend, args.model, threads, texts, queries)
+                )
+            results[backend, threads] = seconds, vectors, query_vectors
+            rss_mb = f"{rss / 2**20:.0f}" if rss else "n/a"
+            print(
+                f"{backend:<8} {threads:>7} {load:>8.2f} {seconds:>8.2f} "
+                f"{len(texts) / seconds:>9.1f} {rss_mb:>8}"
+            )
+
+    print()
+    failed = False
+    for threads in args.threads:
+        torch_seconds, expected, torch_queries = results["torch", threads]
+        onnx_seconds, actual, onnx_queries = results["onnx", threads]
+        # Both backends return unit vectors
+        cosines = np.sum(expected * actual, axis=1)
+        recall = recall_at(args.k, expected, torch_queries, actual, onnx_queries)
+        failed |= bool(cosines.min() < args.min_cosine or recall < args.min_recall)
+        print(
+            f"{threads} thread(s): onnx/torch speedup "
+            f"{torch_seconds / onnx_seconds:.2f}x, cosine mean {cosines.mean():.4f}, "
+            f"min {cosines.min():.4f}, recall@{args.k} {recall:.3f}"
+        )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
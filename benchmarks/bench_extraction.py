@@ -0,0 +1,70 @@
+"""Benchmark serial vs process-pool page extraction, and page prefiltering.
+
+Usage:
+    python benchmarks/bench_extraction.py [pdf] [--workers 1 2 4 8]
+        [--task 1]
+
+Defaults to data/idk.pdf. Every parallel run is checked to be identical to
+the serial output. The prefiltered run (select_pages + extraction of the
+kept pages) is checked to match the full text on every page it read.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from extraction import extract_pages  # noqa: E402
+from page_filter import select_pages  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pdf", nargs="?", default="data/idk.pdf")
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4, 8])
+    parser.add_argument("--task", default="1", choices=["1", "2"])
+    args = parser.parse_args()
+
+    pdf_path = os.path.join(ROOT, args.pdf)
+    print(f"{args.pdf} on {os.cpu_count()} CPUs")
+    print(f"{'workers':>7} {'seconds':>9} {'pages/s':>9} {'speedup':>8}")
+
+    reference = None
+    serial_seconds = None
+    for workers in args.workers:
+        start = time.perf_counter()
+        pages = extract_pages(pdf_path, workers=workers)
+        elapsed = time.perf_counter() - start
+
+        if reference is None:
+            reference = pages
+        elif pages != reference:
+            raise AssertionError(f"output with {workers} workers differs")
+        if workers == 1:
+            serial_seconds = elapsed
+
+        speedup = f"{serial_seconds / elapsed:.1f}x" if serial_seconds else "-"
+        print(f"{workers:>7} {elapsed:>9.2f} {len(pages) / elapsed:>9.1f} {speedup:>8}")
+
+    start = time.perf_counter()
+    selection = select_pages(pdf_path, args.task)
+    selected_seconds = time.perf_counter() - start
+    pages = extract_pages(pdf_path, page_numbers=selection.pages)
+    elapsed = time.perf_counter() - start
+    read = selection.pages if selection.pages is not None else range(len(pages))
+    if any(pages[i] != reference[i] for i in read):
+        raise AssertionError("prefiltered pages differ from the full extraction")
+    print(
+        f"\nprefilter (task {args.task}, {selection.reason}): kept {len(read)} of "
+        f"{selection.page_count} pages, {selected_seconds:.2f}s to select, "
+        f"{elapsed:.2f}s total, {serial_seconds / elapsed:.1f}x vs serial"
+        if serial_seconds
+        else f"\nprefilter: {elapsed:.2f}s total"
+    )
+
+
+if __name__ == "__main__":
+    main()
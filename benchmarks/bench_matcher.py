@@ -0,0 +1,96 @@
+"""Benchmark keyword scanning: one regex pass per keyword vs KeywordMatcher.
+
+Usage:
+    python benchmarks/bench_matcher.py [pdf ...]
+
+Defaults to data/idk.pdf and data/arab.pdf. The extracted text is scanned
+with growing keyword sets drawn from keywords.py, and both strategies are
+checked to return the same hits.
+"""
+
+import os
+import re
+import sys
+import time
+import unicodedata
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from keywords import ipo_keywords, revenue_keywords  # noqa: E402
+from extraction import extract_pages, fix_arabic  # noqa: E402
+from matcher import KeywordMatcher  # noqa: E402
+
+DEFAULT_PDFS = ["data/idk.pdf", "data/arab.pdf"]
+REPEATS = 5
+
+
+def keyword_pool():
+    """All known phrases as (category, lang, phrase) in a stable order."""
+    pool = []
+    for keywords in (revenue_keywords, ipo_keywords):
+        for category, languages in keywords.items():
+            for lang, entries in languages.items():
+                pool.extend((category, lang, entry["phrase"]) for entry in entries)
+    return pool
+
+
+def process(pool):
+    return [
+        (
+            category,
+            lang,
+            phrase,
+            fix_arabic(unicodedata.normalize("NFC", phrase)).lower(),
+        )
+        for category, lang, phrase in pool
+    ]
+
+
+def scan_per_keyword(entries, text_lower):
+    hits = []
+    for category, lang, original, processed in entries:
+        for match in re.finditer(re.escape(processed), text_lower):
+            hits.append((category, lang, original, match.start()))
+    return hits
+
+
+def scan_single_pass(entries, text_lower):
+    return KeywordMatcher(entries).find_all(text_lower)
+
+
+def best_of(fn, *args):
+    best = float("inf")
+    result = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def load_text(pdf_path):
+    return "".join(extract_pages(pdf_path)).lower()
+
+
+def main(pdf_paths):
+    entries = process(keyword_pool())
+    for pdf_path in pdf_paths:
+        text_lower = load_text(os.path.join(ROOT, pdf_path))
+        print(f"\n{pdf_path}: {len(text_lower):,} characters")
+        print(
+            f"{'keywords':>8} {'per-keyword ms':>15} {'single-pass ms':>15} {'speedup':>8}"
+        )
+        for count in range(1, len(entries) + 1):
+            subset = entries[:count]
+            slow, expected = best_of(scan_per_keyword, subset, text_lower)
+            fast, actual = best_of(scan_single_pass, subset, text_lower)
+            if sorted(expected) != sorted(actual):
+                raise AssertionError(f"hit mismatch with {count} keywords")
+            print(
+                f"{count:>8} {slow * 1000:>15.2f} {fast * 1000:>15.2f} {slow / fast:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or DEFAULT_PDFS)
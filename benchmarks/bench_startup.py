@@ -0,0 +1,78 @@
+"""Benchmark cold-start costs: module import time and first-use latency.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--skip-models]
+
+Import time is measured in fresh interpreters. First-use latency compares
+the first and second call of each lazily loaded resource (token encoder,
+embedding model) in this process; --skip-models limits it to the encoder.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); import llm_report; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def import_times(runs):
+    times = []
+    for _ in range(runs):
+        output = subprocess.check_output(
+            [sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, text=True
+        )
+        times.append(float(output.strip().splitlines()[-1]))
+    return times
+
+
+def first_and_second(fn):
+    start = time.perf_counter()
+    fn()
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    fn()
+    return first, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--skip-models", action="store_true")
+    args = parser.parse_args()
+
+    times = import_times(args.runs)
+    print(
+        f"import llm_report: median {statistics.median(times) * 1000:.1f} ms, "
+        f"max {max(times) * 1000:.1f} ms over {args.runs} runs"
+    )
+
+    import llm_report
+
+    checks = [("count_tokens", lambda: llm_report.count_tokens("Total revenue"))]
+    if not args.skip_models:
+        checks.append(
+            (
+                "embed_query",
+                lambda: llm_report.initialize_embeddings(None).embed_query(
+                    "Total revenue"
+                ),
+            )
+        )
+
+    print(f"{'resource':<14} {'first ms':>10} {'warm ms':>10}")
+    for name, fn in checks:
+        first, warm = first_and_second(fn)
+        print(f"{name:<14} {first * 1000:>10.1f} {warm * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
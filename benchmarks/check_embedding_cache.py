@@ -0,0 +1,134 @@
+"""Check that CachedEmbeddings returns each text's own vector.
+
+Usage:
+    python benchmarks/check_embedding_cache.py
+
+The wrapped model is a deterministic hash embedding, so the vector every
+text should get is known. The cache directory is shared by two instances
+opened side by side (as the service and a batch run would), by several
+processes appending at once, and by a reopen after a half-written
+append. Failures are printed and the script exits non-zero.
+"""
+
+import hashlib
+import multiprocessing
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np  # noqa: E402
+
+from embedding_cache import CachedEmbeddings  # noqa: E402
+
+DIM = 8
+MODEL = "hash-embeddings"
+
+
+class HashEmbeddings:
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return (
+            np.frombuffer(digest[: 4 * DIM], dtype=np.uint32)
+            .astype(np.float32)
+            .tolist()
+        )
+
+
+def open_cache(cache_dir):
+    return CachedEmbeddings(HashEmbeddings(), MODEL, cache_dir=cache_dir)
+
+
+def wrong(cache, texts):
+    expected = HashEmbeddings().embed_documents(texts)
+    got = cache.embed_documents(texts)
+    return [text for text, a, b in zip(texts, expected, got) if a != b]
+
+
+def check_two_instances(cache_dir):
+    first, second = open_cache(cache_dir), open_cache(cache_dir)
+    problems = []
+    for name, cache, texts in (
+        ("A", first, ["aaaa"]),
+        ("B", second, ["bb"]),
+        ("A", first, ["bb", "cc"]),
+        ("B", second, ["aaaa", "cc", "dd"]),
+    ):
+        problems += [
+            f"instance {name} got the wrong vector for {t!r}"
+            for t in wrong(cache, texts)
+        ]
+    reopened = open_cache(cache_dir)
+    problems += [
+        f"reopened cache: wrong vector for {t!r}"
+        for t in wrong(reopened, ["aaaa", "bb", "cc", "dd"])
+    ]
+    if reopened.stats()["cached_vectors"] != 4:
+        problems.append(f"{reopened.stats()['cached_vectors']} vectors stored, not 4")
+    return problems
+
+
+def _worker(args):
+    cache_dir, worker = args
+    cache = open_cache(cache_dir)
+    texts = [f"text {i}" for i in range(worker, 400, 3)] + ["shared"]
+    for start in range(0, len(texts), 7):
+        if wrong(cache, texts[start : start + 7]):
+            return False
+    return True
+
+
+def check_processes(cache_dir):
+    with multiprocessing.Pool(4) as pool:
+        ok = pool.map(_worker, [(cache_dir, worker) for worker in range(4)])
+    problems = [
+        f"worker {i} read a wrong vector" for i, good in enumerate(ok) if not good
+    ]
+    texts = [f"text {i}" for i in range(400)] + ["shared"]
+    problems += [
+        f"after the workers: wrong vector for {t!r}"
+        for t in wrong(open_cache(cache_dir), texts)
+    ]
+    return problems
+
+
+def check_torn_append(cache_dir):
+    cache = open_cache(cache_dir)
+    wrong(cache, ["one", "two"])
+    # A writer that died after writing half a vector and no key
+    with open(os.path.join(cache.path, "vectors.f32"), "ab") as f:
+        f.write(b"\0" * (2 * DIM))
+    problems = [
+        f"after a torn append: wrong vector for {t!r}"
+        for t in wrong(open_cache(cache_dir), ["one", "three", "two"])
+    ]
+    problems += [
+        f"second instance: wrong vector for {t!r}"
+        for t in wrong(cache, ["three", "four"])
+    ]
+    return problems
+
+
+def main():
+    failures = 0
+    for name, check in (
+        ("two instances on one directory", check_two_instances),
+        ("concurrent processes", check_processes),
+        ("half-written append", check_torn_append),
+    ):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            problems = check(cache_dir)
+        print(f"{'ok' if not problems else 'FAIL':<5} {name}")
+        for problem in problems[:5]:
+            print(f"        {problem}")
+        failures += bool(problems)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
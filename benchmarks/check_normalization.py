@@ -0,0 +1,74 @@
+"""Check the fast normalization against the original fix_arabic output.
+
+Usage:
+    python benchmarks/check_normalization.py [pdf ...]
+
+Defaults to every PDF in data/. For each page, the "visual" mode must be
+identical to the legacy arabic_reshaper + python-bidi output after folding
+presentation forms back to base letters. Mismatching lines are printed
+and the script exits non-zero; timings for both modes are reported.
+"""
+
+import glob
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PyPDF2 import PdfReader  # noqa: E402
+
+from normalization import _reorder_line, fold, legacy_fix, visual_order  # noqa: E402
+
+
+def raw_pages(pdf_path):
+    return [page.extract_text() or "" for page in PdfReader(pdf_path).pages]
+
+
+def compare(pdf_path):
+    try:
+        pages = raw_pages(pdf_path)
+    except Exception as e:
+        print(f"{pdf_path}: skipped ({e})")
+        return 0
+
+    start = time.perf_counter()
+    legacy = [legacy_fix(text) for text in pages]
+    legacy_seconds = time.perf_counter() - start
+
+    _reorder_line.cache_clear()
+    start = time.perf_counter()
+    visual = [visual_order(text) for text in pages]
+    visual_seconds = time.perf_counter() - start
+
+    mismatches = 0
+    for number, (expected, actual) in enumerate(zip(legacy, visual), start=1):
+        expected = fold(expected)
+        if expected == actual:
+            continue
+        mismatches += 1
+        for old, new in zip(expected.split("\n"), actual.split("\n")):
+            if old != new:
+                print(
+                    f"  page {number}:\n    legacy {old[:120]!r}\n    visual {new[:120]!r}"
+                )
+                break
+
+    print(
+        f"{os.path.relpath(pdf_path, ROOT)}: {len(pages)} pages, "
+        f"{mismatches} mismatching, legacy {legacy_seconds * 1000:.0f} ms, "
+        f"visual {visual_seconds * 1000:.0f} ms "
+        f"({legacy_seconds / visual_seconds:.1f}x)"
+    )
+    return mismatches
+
+
+def main(pdf_paths):
+    pdf_paths = pdf_paths or sorted(glob.glob(os.path.join(ROOT, "data", "*.pdf")))
+    failures = sum(compare(path) for path in pdf_paths)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,167 @@
+"""Check the table reader of numeric_extractor on hand-made statement rows.
+
+Usage:
+    python benchmarks/check_numeric.py
+
+Each case is a chunk as split_pages produces it (page text in display
+order) with the revenue figures it must yield. Failures are printed and
+the script exits non-zero. Readings without a unit header must also stay
+below FAST_PATH_CONFIDENCE.
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from numeric_extractor import FAST_PATH_CONFIDENCE, extract_revenue  # noqa: E402
+
+
+def chunk(text, page=1, page_starts=None):
+    metadata = {"page": page, "pages": [page]}
+    if page_starts:
+        metadata["page_starts"] = page_starts
+    return SimpleNamespace(page_content=text, metadata=metadata)
+
+
+CASES = [
+    (
+        # Display order: the label is on the right, columns run right to left
+        "arabic table, digits-only header",
+        chunk(
+            "قائمة الدخل (ريال سعودي)\n"
+            "2022 2023\n"
+            "1,100,000 1,200,000 تاداريلإا يلامجا"
+        ),
+        {"period": "2023", "revenue": 1_200_000, "comparative_revenue": 1_100_000},
+    ),
+    (
+        "arabic table, header with label",
+        chunk(
+            "قائمة الدخل (ريال سعودي)\n"
+            "2022 2023 نايبلا\n"
+            "1,100,000 1,200,000 تاداريلإا يلامجا"
+        ),
+        {"period": "2023", "revenue": 1_200_000, "comparative_revenue": 1_100_000},
+    ),
+    (
+        "arabic-indic digits and separators",
+        chunk("ريال سعودي\n" "2022 2023\n" "١٬١٠٠٬٠٠٠ ١٬٢٠٠٬٠٠٠٫٥ تاداريلإا يلامجا"),
+        {"period": "2023", "revenue": 1_200_000.5, "comparative_revenue": 1_100_000},
+    ),
+    (
+        "english table in thousands",
+        chunk(
+            "Consolidated statement of income (SAR in thousands)\n"
+            "2023 2022\n"
+            "Total revenue 1,200,000 1,100,000"
+        ),
+        {"period": "2023", "revenue": 1_200_000_000, "currency": "SAR"},
+    ),
+    (
+        "english table in millions",
+        chunk("USD (in millions)\n2023 2022\nRevenue 4,210 3,980"),
+        {"period": "2023", "revenue": 4_210_000_000, "currency": "USD"},
+    ),
+    (
+        "row page within a multi-page chunk",
+        chunk(
+            "Revenue growth was strong.\n"
+            "Income statement, SAR '000\n"
+            "2023 2022\n"
+            "Total revenue 1,200,000 1,100,000",
+            page=7,
+            page_starts=[(0, 7), (27, 8)],
+        ),
+        {"period": "2023", "revenue": 1_200_000_000, "page": 8},
+    ),
+    (
+        "unit glued to the currency",
+        chunk("Income statement (SAR'000)\n2023 2022\nRevenue 1,200,000 1,100,000"),
+        {"period": "2023", "revenue": 1_200_000_000, "currency": "SAR"},
+    ),
+    (
+        "unit glued to the short currency",
+        chunk("SR'000\n2023 2022\nTotal revenue 980,000 910,000"),
+        {"period": "2023", "revenue": 980_000_000, "currency": "SAR"},
+    ),
+    (
+        "english table in billions",
+        chunk("In billions of CHF\n2024 2023\nTotal sales 91.4 93.0"),
+        {"period": "2024", "revenue": 91_400_000_000, "currency": "CHF"},
+    ),
+    (
+        # Nestle's L'Oreal note: another company's figures in billions, below
+        # the group's own table in millions
+        "associate table under an earlier unit header",
+        chunk(
+            "Income from associates and joint ventures\n"
+            "In millions of CHF\n"
+            "2024 2023\n"
+            "Share of results 1 500 1 143\n"
+            "As at December 31, 2024, the market value of the shares held "
+            "amounts to CHF 34.6 billion (2023: CHF 45.1 billion).\n"
+            "Summarized financial information of L'Oréal\n"
+            "In billions of CHF\n"
+            "2024 2023\n"
+            "Total assets 53.0 48.3\n"
+            "Total sales 41.4 40.0\n"
+            "Profit from continuing operations 6.1 6.0",
+            page=75,
+        ),
+        {"revenue": None, "confidence": 0.0},
+    ),
+]
+
+# Readings without a unit header must never skip the LLM, even when
+# several chunks agree on them
+UNSCALED = [
+    (
+        # The unit printed above another table must not carry over
+        "unit header of an earlier table",
+        [
+            chunk(
+                "In millions of SAR\n2023 2022\nNet profit 1,234 1,111\n"
+                "Segment information\n2023 2022\n"
+                "Total revenue 1,200,000 1,100,000",
+                page=page,
+            )
+            for page in (4, 5, 6)
+        ],
+    ),
+    (
+        "no unit header",
+        [
+            chunk("SAR\n2023 2022\nTotal revenue 1,200,000 1,100,000", page=page)
+            for page in (4, 5, 6)
+        ],
+    ),
+]
+
+
+def main():
+    failures = 0
+    for name, doc, expected in CASES:
+        result = extract_revenue([doc])._asdict()
+        wrong = {
+            key: (result[key], value)
+            for key, value in expected.items()
+            if result[key] != value
+        }
+        status = "ok" if not wrong else "FAIL"
+        print(f"{status:<5} {name} (confidence {result['confidence']:.2f})")
+        for key, (actual, value) in wrong.items():
+            print(f"        {key}: got {actual!r}, expected {value!r}")
+        failures += bool(wrong)
+    for name, docs in UNSCALED:
+        confidence = extract_revenue(docs).confidence
+        low = confidence < FAST_PATH_CONFIDENCE
+        print(f"{'ok' if low else 'FAIL':<5} {name} (confidence {confidence:.2f})")
+        failures += not low
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Check that the page prefilter keeps every page a full scan finds hits on.
+
+Usage:
+    python benchmarks/check_prefilter.py [pdf ...] [--top-pages 16]
+
+Defaults to every PDF in data/. For each PDF and task the keyword hits of
+a full extraction (the pages split_pages would build chunks from) are
+compared with page_filter.select_pages; missed pages are printed and the
+script exits non-zero if any keyword page was dropped. Selection times, cold and with the score cache
+warm, are reported as well.
+"""
+
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from extraction import extract_pages, fix_arabic, open_page_cache  # noqa: E402
+from keyword_registry import keyword_set  # noqa: E402
+from page_filter import select_pages  # noqa: E402
+from text_cache import PageTextCache  # noqa: E402
+
+
+def hit_pages(pages, choice):
+    matcher = keyword_set(choice, transform=fix_arabic).matcher
+    return {
+        index
+        for index, text in enumerate(pages)
+        if next(iter(matcher.finditer(text.lower())), None) is not None
+    }
+
+
+def check(pdf_path, top_pages, cache, selections):
+    name = os.path.relpath(pdf_path, ROOT)
+    try:
+        pages = extract_pages(pdf_path, workers=None, cache=cache)
+    except Exception as e:
+        print(f"{name}: skipped ({e})")
+        return 0
+
+    missed_total = 0
+    for choice, task in (("1", "revenue"), ("2", "ipo")):
+        expected = hit_pages(pages, choice)
+        start = time.perf_counter()
+        selection = select_pages(pdf_path, choice, top_n=top_pages, cache=selections)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        select_pages(pdf_path, choice, top_n=top_pages, cache=selections)
+        warm = time.perf_counter() - start
+
+        kept = (
+            set(range(len(pages))) if selection.pages is None else set(selection.pages)
+        )
+        missed = sorted(expected - kept)
+        missed_total += len(missed)
+        print(
+            f"{name} {task}: {len(kept)}/{len(pages)} pages kept ({selection.reason}), "
+            f"{len(expected) - len(missed)}/{len(expected)} hit pages, "
+            f"select {cold * 1000:.0f} ms cold, {warm * 1000:.1f} ms warm"
+        )
+        if missed:
+            print(f"  missed pages: {', '.join(str(i + 1) for i in missed)}")
+    return missed_total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pdfs", nargs="*")
+    parser.add_argument("--top-pages", type=int, default=16)
+    args = parser.parse_args()
+
+    pdf_paths = args.pdfs or sorted(glob.glob(os.path.join(ROOT, "data", "*.pdf")))
+    cache = open_page_cache()
+    with tempfile.TemporaryDirectory() as score_dir:
+        # A separate cache without the full texts, so the selection is ranked
+        selections = PageTextCache(score_dir)
+        missed = sum(
+            check(path, args.top_pages, cache, selections) for path in pdf_paths
+        )
+    if missed:
+        print(f"FAIL: the prefilter dropped {missed} keyword page(s)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
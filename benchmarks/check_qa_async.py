@@ -0,0 +1,159 @@
+"""Check AsyncQAExecutor retries, ordering and pacing against the fake server.
+
+Usage:
+    python benchmarks/check_qa_async.py
+
+Questions go to fake_llm_server through the anthropic client with its own
+retries turned off, and the server answers some of them with scripted
+429/529 errors first. Every result must come back in input order with its
+own answer and the expected attempt count, a question whose errors
+outlast max_retries must come back as the error, and the server must see
+exactly the attempts reported. TokenBucket pacing is timed on its own
+and as the executor's requests-per-minute limit. Failures are printed and
+the script exits non-zero.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import anthropic  # noqa: E402
+from langchain.schema import Document  # noqa: E402
+
+from fake_llm_server import FakeMessagesHandler, serve  # noqa: E402
+from llm_report import QA_MODEL_NAME  # noqa: E402
+from qa_async import AsyncQAExecutor, TokenBucket, status_code  # noqa: E402
+
+PORT = 8091
+MAX_RETRIES = 3
+# (question, scripted errors, expected attempts, expected error status)
+CASES = [
+    ("question-0", [], 1, None),
+    ("question-1", [429], 2, None),
+    ("question-2", [529, 429], 3, None),
+    ("question-3", [], 1, None),
+    ("question-4", [529], 2, None),
+    ("question-5", [429] * (MAX_RETRIES + 1), MAX_RETRIES + 1, 429),
+]
+
+
+class MessagesChain:
+    """The QA chain's arun() signature over one Messages API call."""
+
+    def __init__(self, base_url):
+        # Retries are the executor's job; the client must surface every error
+        self.client = anthropic.AsyncAnthropic(
+            base_url=base_url, api_key="fake", max_retries=0
+        )
+
+    async def arun(self, input_documents, question, callbacks=None):
+        context = "\n\n".join(doc.page_content for doc in input_documents)
+        message = await self.client.messages.create(
+            model=QA_MODEL_NAME,
+            max_tokens=256,
+            messages=[{"role": "user", "content": f"{context}\n\n{question}"}],
+        )
+        return message.content[0].text
+
+
+def answer_for(question):
+    return json.dumps({"question": question})
+
+
+def check_executor():
+    server = serve(
+        PORT,
+        errors={question: errors for question, errors, _, _ in CASES},
+        answers={question: answer_for(question) for question, *_ in CASES},
+    )
+    try:
+        executor = AsyncQAExecutor(
+            MessagesChain(f"http://127.0.0.1:{PORT}"),
+            max_concurrency=3,
+            requests_per_minute=600,
+            tokens_per_minute=1_000_000,
+            max_retries=MAX_RETRIES,
+            base_delay=0.05,
+            max_delay=0.2,
+        )
+        docs = [Document(page_content="Total revenue 1,200,000", metadata={})]
+        results = executor.run([(docs, question) for question, *_ in CASES])
+    finally:
+        server.shutdown()
+
+    problems = []
+    for (question, _, attempts, error_status), result in zip(CASES, results):
+        expected = None if error_status else answer_for(question)
+        if result.answer != expected:
+            problems.append(f"{question}: answer {result.answer!r}")
+        if result.attempts != attempts:
+            problems.append(f"{question}: {result.attempts} attempts, not {attempts}")
+        got_status = status_code(result.error) if result.error else None
+        if got_status != error_status:
+            problems.append(f"{question}: error {result.error!r}")
+    sent = sum(result.attempts for result in results)
+    if FakeMessagesHandler.requests_seen != sent:
+        problems.append(
+            f"server saw {FakeMessagesHandler.requests_seen} requests, "
+            f"results report {sent}"
+        )
+    return problems
+
+
+async def _drain(bucket, count, amount=1.0):
+    start = time.perf_counter()
+    await asyncio.gather(*(bucket.acquire(amount) for _ in range(count)))
+    return time.perf_counter() - start
+
+
+def check_bucket():
+    problems = []
+    # 10 tokens a second, 2 up front: 7 acquisitions wait for 5 refills
+    elapsed = asyncio.run(_drain(TokenBucket(600, capacity=2), 7))
+    if not 0.45 <= elapsed < 1.5:
+        problems.append(f"7 tokens at 10/s from 2 took {elapsed:.2f}s, not ~0.5s")
+    # A request larger than the bucket drains it instead of waiting forever
+    elapsed = asyncio.run(_drain(TokenBucket(600, capacity=2), 1, amount=50))
+    if elapsed > 0.1:
+        problems.append(f"an oversized request waited {elapsed:.2f}s")
+    return problems
+
+
+def check_pacing():
+    # Once the executor's request bucket is empty, 120 requests a minute
+    # means one every half second
+    executor = AsyncQAExecutor(None, requests_per_minute=120)
+
+    async def paced():
+        _, requests, _ = executor._limits()
+        requests.tokens = 0
+        return await _drain(requests, 6)
+
+    elapsed = asyncio.run(paced())
+    if not 2.9 <= elapsed < 4.5:
+        return [f"6 requests at 120/min took {elapsed:.2f}s, not ~3s"]
+    return []
+
+
+def main():
+    failures = 0
+    for name, check in (
+        ("retries and order", check_executor),
+        ("token bucket", check_bucket),
+        ("executor pacing", check_pacing),
+    ):
+        problems = check()
+        print(f"{'ok' if not problems else 'FAIL':<5} {name}")
+        for problem in problems:
+            print(f"        {problem}")
+        failures += bool(problems)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
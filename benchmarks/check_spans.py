@@ -0,0 +1,83 @@
+"""Check the context spans merge_windows builds under a length cap.
+
+Usage:
+    python benchmarks/check_spans.py
+
+Hits are drawn at random over a fixed-length text (seeded, so every run
+sees the same cases). With a cap, the spans must be ordered, must never
+overlap, must stay within the cap, and every hit must be listed by a span
+that contains at least part of it. Failures are printed and the script exits
+non-zero.
+"""
+
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from spans import merge_windows  # noqa: E402
+
+TEXT_LEN = 20_000
+ROUNDS = 500
+SEED = 0
+
+
+def random_hits(rng):
+    hits = []
+    for _ in range(rng.randint(1, 40)):
+        start = rng.randrange(TEXT_LEN - 30)
+        length = rng.randint(3, 30)
+        hits.append(("revenue", "en", f"kw{length}", start, start + length))
+    return hits
+
+
+def problems(hits, window_chars, max_span_chars):
+    spans = merge_windows(hits, window_chars, TEXT_LEN, max_span_chars)
+    found = []
+    longest_hit = max(end - start for *_, start, end in hits)
+    for previous, span in zip(spans, spans[1:]):
+        if span["start"] < previous["end"]:
+            found.append(
+                f"overlap {previous['start']}-{previous['end']} / "
+                f"{span['start']}-{span['end']}"
+            )
+    for span in spans:
+        if span["end"] - span["start"] > max(max_span_chars, longest_hit):
+            found.append(f"span {span['start']}-{span['end']} exceeds the cap")
+    listed = {}
+    for span in spans:
+        for match in span["matches"]:
+            listed[match] = span
+    for hit in hits:
+        span = listed.get(hit[:3] + (hit[3],))
+        if span is None:
+            found.append(f"hit at {hit[3]} is in no span")
+        elif hit[4] <= span["start"] or hit[3] >= span["end"]:
+            found.append(f"hit at {hit[3]} lies outside its span")
+    return found
+
+
+def main():
+    rng = random.Random(SEED)
+    failures = 0
+    for round_no in range(ROUNDS):
+        hits = random_hits(rng)
+        window_chars = rng.choice([0, 50, 200, 800])
+        max_span_chars = rng.choice([100, 500, 1500, 4000])
+        found = problems(hits, window_chars, max_span_chars)
+        if found:
+            failures += 1
+            print(
+                f"FAIL  round {round_no} (window {window_chars}, "
+                f"cap {max_span_chars})"
+            )
+            for problem in found[:5]:
+                print(f"        {problem}")
+    print(f"{ROUNDS - failures}/{ROUNDS} rounds ok")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Local stand-in for the Anthropic Messages API.
+
+Usage:
+    python benchmarks/fake_llm_server.py [--port 8089] [--latency 0.5]
+        [--error-rate 0.2] [--answer '{"revenue": 1000, "currency": "SAR"}']
+
+Point the QA chain at it with ANTHROPIC_BASE_URL=http://127.0.0.1:8089
+(any ANTHROPIC_API_KEY value is accepted). A share of requests can be
+answered with 429/529 errors to exercise retries and rate limiting, and
+serve() can script the errors and answers for prompts containing a given
+marker, so retry counts are deterministic.
+Streaming requests get the answer back as server-sent events in small
+text deltas.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeMessagesHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    error_rate = 0.0
+    answer = json.dumps({"revenue": 1000000, "currency": "SAR", "period": "2023-12-31"})
+    chunk_chars = 8
+    # prompt marker -> statuses to fail with, in order, before answering
+    errors = {}
+    # prompt marker -> answer text replacing ``answer``
+    answers = {}
+    requests_seen = 0
+    _lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        with self._lock:
+            type(self).requests_seen += 1
+
+        prompt = json.dumps(request.get("messages", []))
+        time.sleep(self.latency)
+        status = self._scripted_error(prompt)
+        if status is None and random.random() < self.error_rate:
+            status = random.choice([429, 529])
+        if status is not None:
+            error_type = "rate_limit_error" if status == 429 else "overloaded_error"
+            self._send(
+                status,
+                {"type": "error", "error": {"type": error_type, "message": "fake"}},
+                {"retry-after": "1"},
+            )
+            return
+
+        answer = next(
+            (text for marker, text in self.answers.items() if marker in prompt),
+            self.answer,
+        )
+        message = {
+            "id": f"msg_fake_{self.requests_seen}",
+            "type": "message",
+            "role": "assistant",
+            "model": request.get("model", "fake"),
+            "content": [{"type": "text", "text": answer}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {
+                "input_tokens": len(prompt) // 4,
+                "output_tokens": len(answer) // 4,
+            },
+        }
+        if request.get("stream"):
+            self._stream(message)
+        else:
+            self._send(200, message)
+
+    def _scripted_error(self, prompt):
+        with self._lock:
+            for marker, statuses in self.errors.items():
+                if marker in prompt and statuses:
+                    return statuses.pop(0)
+        return None
+
+    def _stream(self, message):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        def event(name, payload):
+            self.wfile.write(f"event: {name}\ndata: {json.dumps(payload)}\n\n".encode())
+            self.wfile.flush()
+
+        text = message["content"][0]["text"]
+        usage = message["usage"]
+        event(
+            "message_start",
+            {
+                "type": "message_start",
+                "message": dict(
+                    message,
+                    content=[],
+                    stop_reason=None,
+                    usage={"input_tokens": usage["input_tokens"], "output_tokens": 0},
+                ),
+            },
+        )
+        event(
+            "content_block_start",
+            {
+                "type": "content_block_start",
+                "index": 0,
+                "content_block": {"type": "text", "text": ""},
+            },
+        )
+        for i in range(0, len(text), self.chunk_chars):
+            event(
+                "content_block_delta",
+                {
+                    "type": "content_block_delta",
+                    "index": 0,
+                    "delta": {
+                        "type": "text_delta",
+                        "text": text[i : i + self.chunk_chars],
+                    },
+                },
+            )
+        event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        event(
+            "message_delta",
+            {
+                "type": "message_delta",
+                "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                "usage": {"output_tokens": usage["output_tokens"]},
+            },
+        )
+        event("message_stop", {"type": "message_stop"})
+
+
+def serve(
+    port=8089, latency=0.0, error_rate=0.0, answer=None, errors=None, answers=None
+):
+    """Start the fake server on a daemon thread and return it.
+
+    ``errors`` maps a prompt marker to the statuses (429, 529, ...) the
+    first requests containing it get; ``answers`` maps a marker to the
+    answer its prompts get instead of ``answer``.
+    """
+    FakeMessagesHandler.latency = latency
+    FakeMessagesHandler.error_rate = error_rate
+    FakeMessagesHandler.errors = {k: list(v) for k, v in (errors or {}).items()}
+    FakeMessagesHandler.answers = dict(answers or {})
+    FakeMessagesHandler.requests_seen = 0
+    if answer is not None:
+        FakeMessagesHandler.answer = answer
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeMessagesHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--answer")
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency, args.error_rate, args.answer)
+    print(f"Fake Messages API on http://127.0.0.1:{args.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,446 @@
+"""Benchmark every offline stage of llm_report.py over the sample PDFs.
+
+Usage:
+    python benchmarks/suite.py [pdf ...] [--tasks 1 2] [--repeat 3]
+        [--output results.json] [--save-baseline benchmarks/baseline.json]
+        [--compare [benchmarks/baseline.json]] [--tolerance 0.25]
+        [--min-seconds 0.01]
+
+Defaults to every PDF in data/. Per PDF the suite times page extraction,
+both text normalization modes, keyword splitting per task, count_tokens,
+embedding, the FAISS build and similarity_search. Embeddings are a
+deterministic feature hash and the LLM answer is the fake server's
+default one, streamed through the JSON parser, so nothing touches the
+network and repeated runs do the same work.
+
+Each stage runs once under tracemalloc for its peak Python allocation,
+then ``--repeat`` more times for timing. The report gives the median and
+minimum seconds, throughput (pages/s, chunks/s or queries/s) and the
+process's peak RSS. A stage whose dependency is missing or whose input
+failed is recorded as skipped, with the reason, instead of failing the
+whole run.
+
+``--save-baseline`` stores the results, and refuses to (exit status 1)
+while any stage is skipped: a baseline must time every stage. The
+tiktoken encoding is read from .cache/tiktoken (see resources.py), so
+count_tokens only needs the network once. ``--compare`` reports the
+median-time ratio of every stage against a stored baseline (by default
+benchmarks/baseline.json, committed with the repository). The exit
+status is 1 when the baseline file is missing or when any stage is
+slower than ``1 + tolerance`` times its baseline. Stages that cannot be
+compared (measured in one run and skipped or absent in the other, as
+when a dependency or network access is only available on one machine)
+are listed as warnings. Stages faster than ``--min-seconds`` in both
+runs are listed but never flagged, since their timings are mostly noise.
+Baselines are only meaningful on the machine that recorded them; the
+committed one records its environment, so re-record it with
+``--save-baseline benchmarks/baseline.json`` on the machine that runs
+the comparison.
+"""
+
+import argparse
+import gc
+import glob
+import hashlib
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from extraction import extract_pages  # noqa: E402
+from fake_llm_server import FakeMessagesHandler  # noqa: E402
+from language import detect_document_language  # noqa: E402
+from metrics import metrics, peak_rss_bytes  # noqa: E402
+from normalization import _reorder_line, legacy_fix, visual_order  # noqa: E402
+from queries import get_retrieval_queries  # noqa: E402
+from retrieval import tokenize  # noqa: E402
+from schemas import StreamingJSONParser  # noqa: E402
+
+EMBEDDING_DIM = 384  # all-MiniLM-L6-v2, the model llm_report uses
+SEARCH_K = 20
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+
+def hash_embedding(text: str, dim: int = EMBEDDING_DIM):
+    """Deterministic unit vector from hashed search tokens."""
+    vector = [0.0] * dim
+    for token in tokenize(text):
+        digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dim
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def fake_embeddings():
+    """LangChain Embeddings backed by hash_embedding."""
+    from langchain_core.embeddings import Embeddings
+
+    class HashEmbeddings(Embeddings):
+        def embed_documents(self, texts):
+            return [hash_embedding(text) for text in texts]
+
+        def embed_query(self, text):
+            return hash_embedding(text)
+
+    return HashEmbeddings()
+
+
+def measure(fn, repeat: int, setup=None) -> dict:
+    """Time ``fn`` ``repeat`` times after one traced run for peak memory.
+
+    ``setup`` runs untimed before every call (to clear caches). The return
+    value of the traced run is kept in ``result``.
+    """
+    if setup:
+        setup()
+    gc.collect()
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {
+        "median_seconds": round(statistics.median(times), 5) if times else None,
+        "min_seconds": round(min(times), 5) if times else None,
+        "peak_alloc_mb": round(peak / 2**20, 2),
+        "result": result,
+    }
+
+
+def _throughput(stats: dict, items: int, unit: str) -> dict:
+    seconds = stats["median_seconds"]
+    stats[unit] = round(items / seconds, 2) if seconds else None
+    stats["items"] = items
+    return stats
+
+
+def bench_pdf(pdf_path: str, tasks, repeat: int) -> dict:
+    from PyPDF2 import PdfReader
+
+    stages = {}
+
+    def run(name, fn, items=None, unit=None, setup=None):
+        try:
+            stats = measure(fn, repeat, setup)
+        except Exception as e:
+            stages[name] = {"skipped": f"{type(e).__name__}: {e}"}
+            return None
+        result = stats.pop("result")
+        if items is not None:
+            _throughput(stats, items(result), unit)
+        stages[name] = stats
+        return result
+
+    def skip(name, reason):
+        stages[name] = {"skipped": reason}
+
+    raw = [page.extract_text() or "" for page in PdfReader(pdf_path).pages]
+
+    def extract():
+        metrics.reset()
+        return extract_pages(pdf_path, workers=1)
+
+    pages = run(
+        "extract",
+        extract,
+        lambda r: len(r),
+        "pages_per_second",
+        _reorder_line.cache_clear,
+    )
+    if pages is not None:
+        # Where the last run's extraction time went
+        stages["extract"]["breakdown"] = {
+            name: round(stats["seconds"], 5)
+            for name, stats in metrics.report()["stages"].items()
+            if name in ("pdf_parse", "normalize")
+        }
+    run(
+        "normalize_visual",
+        lambda: [visual_order(text) for text in raw],
+        lambda r: len(r),
+        "pages_per_second",
+        _reorder_line.cache_clear,
+    )
+    run(
+        "normalize_legacy",
+        lambda: [legacy_fix(text) for text in raw],
+        lambda r: len(r),
+        "pages_per_second",
+    )
+    if pages is None:
+        return stages
+
+    language = detect_document_language(pages).language
+    embeddings = None
+    for task in tasks:
+        suffix = f"_task{task}"
+        docs = run(
+            "split" + suffix,
+            lambda: _split(pages, pdf_path, task),
+            lambda r: len(r),
+            "chunks_per_second",
+        )
+        if docs is None:
+            for name in ("count_tokens", "embed", "faiss_build", "similarity_search"):
+                skip(name + suffix, "no chunks (split skipped)")
+            continue
+        texts = [doc.page_content for doc in docs]
+
+        def count():
+            from llm_report import count_tokens
+
+            return sum(count_tokens(text) for text in texts)
+
+        run("count_tokens" + suffix, count, lambda r: len(texts), "chunks_per_second")
+
+        if embeddings is None:
+            try:
+                embeddings = fake_embeddings()
+            except ImportError as e:
+                embeddings = e
+        if isinstance(embeddings, ImportError):
+            for name in ("embed", "faiss_build", "similarity_search"):
+                skip(name + suffix, f"ImportError: {embeddings}")
+            continue
+
+        vectors = run(
+            "embed" + suffix,
+            lambda: embeddings.embed_documents(texts),
+            lambda r: len(r),
+            "chunks_per_second",
+        )
+        if vectors is None:
+            continue
+        index = run(
+            "faiss_build" + suffix,
+            lambda: _build_index(docs, vectors, embeddings),
+            lambda r: len(texts),
+            "chunks_per_second",
+        )
+        queries = get_retrieval_queries(language=language, task=task) or []
+        if index is None or not queries:
+            skip("similarity_search" + suffix, "no index or no retrieval queries")
+            continue
+        run(
+            "similarity_search" + suffix,
+            lambda: [
+                index.similarity_search_with_relevance_scores(query, k=SEARCH_K)
+                for query in queries
+            ],
+            lambda r: len(queries),
+            "queries_per_second",
+        )
+    return stages
+
+
+def _split(pages, pdf_path, task):
+    from llm_report import split_pages
+
+    return split_pages(pages, pdf_path, choice=task, verbose=False)
+
+
+def _build_index(docs, vectors, embeddings):
+    from langchain_community.vectorstores import FAISS
+
+    return FAISS.from_embeddings(
+        list(zip([doc.page_content for doc in docs], vectors)),
+        embeddings,
+        metadatas=[doc.metadata for doc in docs],
+    )
+
+
+def bench_answer_parse(repeat: int) -> dict:
+    """Stream the fake LLM answer through the JSON parser, 8 chars a token."""
+    answer = FakeMessagesHandler.answer
+    size = FakeMessagesHandler.chunk_chars
+    chunks = [answer[i : i + size] for i in range(0, len(answer), size)]
+    rounds = 1000
+
+    def parse():
+        for _ in range(rounds):
+            parser = StreamingJSONParser("1")
+            for chunk in chunks:
+                for _ in parser.feed(chunk):
+                    pass
+        return rounds
+
+    stats = measure(parse, repeat)
+    stats.pop("result")
+    return _throughput(stats, rounds, "answers_per_second")
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "commit": commit,
+        "text_mode": os.getenv("FRE_TEXT_MODE", "visual"),
+    }
+
+
+def compare(
+    results: dict, baseline: dict, tolerance: float, min_seconds: float = 0.0
+) -> int:
+    """Print current vs baseline medians.
+
+    Stages measured in only one of the runs are printed as warnings and do
+    not count: which stages run depends on the machine's dependencies and
+    network access, not on the code under test.
+
+    Returns:
+        The number of stages slower than ``1 + tolerance`` times the baseline
+    """
+    regressions = 0
+    warnings = 0
+    print(f"\n{'pdf':<14} {'stage':<26} {'baseline':>9} {'now':>9} {'ratio':>6}")
+    old_pdfs = baseline.get("pdfs", {})
+    for pdf in sorted(set(old_pdfs) - set(results["pdfs"])):
+        warnings += 1
+        print(f"{pdf:<14} {'(all)':<26} {'':>9} {'':>9} {'':>6}  warning: not run")
+    for pdf, stages in results["pdfs"].items():
+        old_stages = old_pdfs.get(pdf, {})
+        for stage in list(stages) + [s for s in old_stages if s not in stages]:
+            old = old_stages.get(stage, {})
+            before = old.get("median_seconds")
+            now = stages.get(stage, {}).get("median_seconds")
+            if before is None and now is None:
+                continue
+            if before is None or now is None:
+                warnings += 1
+                problem = "not in baseline" if before is None else "skipped now"
+                print(
+                    f"{pdf:<14} {stage:<26} {'':>9} {'':>9} {'':>6}  warning: {problem}"
+                )
+                continue
+            ratio = now / before if before else float("inf")
+            flag = ""
+            if max(before, now) < min_seconds:
+                pass
+            elif ratio > 1 + tolerance:
+                regressions += 1
+                flag = "  REGRESSION"
+            elif ratio < 1 - tolerance:
+                flag = "  faster"
+            print(
+                f"{pdf:<14} {stage:<26} {before:>9.4f} {now:>9.4f} {ratio:>6.2f}{flag}"
+            )
+    if warnings:
+        print(f"{warnings} stage(s) measured in only one of the runs, not compared")
+    return regressions
+
+
+def _print_stages(pdf: str, stages: dict):
+    print(f"\n{pdf}")
+    for stage, stats in stages.items():
+        if "skipped" in stats:
+            print(f"  {stage:<26} skipped ({stats['skipped'][:70]})")
+            continue
+        rate = next(
+            (
+                f"{stats[k]:>9.1f} {k[:-11]}/s"
+                for k in stats
+                if k.endswith("_per_second")
+            ),
+            "",
+        )
+        print(
+            f"  {stage:<26} {stats['median_seconds']:>9.4f}s "
+            f"{stats['peak_alloc_mb']:>8.1f} MB {rate}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pdfs", nargs="*")
+    parser.add_argument("--tasks", nargs="+", default=["1", "2"], choices=["1", "2"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write the results JSON here")
+    parser.add_argument("--save-baseline", help="store the results as a baseline")
+    parser.add_argument(
+        "--compare",
+        nargs="?",
+        const=DEFAULT_BASELINE,
+        help=f"baseline JSON to compare against (default: {DEFAULT_BASELINE})",
+    )
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--min-seconds", type=float, default=0.01)
+    args = parser.parse_args()
+    if args.compare and not os.path.exists(args.compare):
+        parser.error(
+            f"baseline {args.compare} not found; record one with --save-baseline"
+        )
+
+    pdf_paths = args.pdfs or sorted(glob.glob(os.path.join(ROOT, "data", "*.pdf")))
+    results = {"environment": environment(), "repeat": args.repeat, "pdfs": {}}
+    for pdf_path in pdf_paths:
+        name = os.path.basename(pdf_path)
+        try:
+            stages = bench_pdf(pdf_path, args.tasks, args.repeat)
+        except Exception as e:
+            stages = {"open": {"skipped": f"{type(e).__name__}: {e}"}}
+        results["pdfs"][name] = stages
+        _print_stages(name, stages)
+    results["pdfs"]["(fake llm)"] = {"answer_parse": bench_answer_parse(args.repeat)}
+    _print_stages("(fake llm)", results["pdfs"]["(fake llm)"])
+
+    results["peak_rss_mb"] = round((peak_rss_bytes() or 0) / 2**20, 1)
+    print(f"\npeak RSS {results['peak_rss_mb']} MB")
+
+    skipped = [
+        f"{name}/{stage}: {stats['skipped']}"
+        for name, stages in results["pdfs"].items()
+        for stage, stats in stages.items()
+        if "skipped" in stats
+    ]
+    if args.save_baseline and skipped:
+        print(f"\nnot saving {args.save_baseline}; skipped stage(s):")
+        for line in skipped:
+            print(f"  {line[:100]}")
+    for path in (args.output, None if skipped else args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2, ensure_ascii=False)
+            print(f"wrote {path}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_seconds)
+        if regressions:
+            print(f"{regressions} stage(s) slower than {1 + args.tolerance:.2f}x")
+            sys.exit(1)
+    if args.save_baseline and skipped:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
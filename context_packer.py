@@ -0,0 +1,143 @@
+import math
+from typing import List, Optional, Sequence, Tuple
+
+from resources import get_encoding
+
+
+def doc_tokens(doc, encoding_name: str = "cl100k_base") -> int:
+    """Token count of a chunk, kept in its metadata.
+
+    PersistentVectorStore counts every chunk as it is indexed and saves the
+    count with the docstore, so retrieved chunks are never re-tokenized.
+    Splitting does not count, so the offline numeric fast path never needs
+    the tokenizer; chunks that were never indexed are counted here once.
+    """
+    cached = doc.metadata.get("token_count")
+    if cached is None:
+        cached = len(get_encoding(encoding_name).encode(doc.page_content))
+        doc.metadata["token_count"] = cached
+    return cached
+
+
+def knapsack(
+    weights: Sequence[int],
+    values: Sequence[float],
+    capacity: int,
+    max_items: Optional[int] = None,
+) -> List[int]:
+    """Indices of the 0/1 knapsack solution maximizing total value.
+
+    ``max_items`` additionally caps how many items are taken.
+    """
+    limited = max_items is not None and max_items < len(weights)
+    # best[k][c]: best value using at most k items and capacity c; without a
+    # cap a single row holds the plain 0/1 table
+    slots = max_items if limited else 1
+    best = [[0.0] * (capacity + 1) for _ in range(slots + 1)]
+    taken = []
+    for weight, value in zip(weights, values):
+        row = [[False] * (capacity + 1) for _ in range(slots + 1)]
+        for k in range(slots, 0, -1):
+            current = best[k]
+            fewer = best[k - 1] if limited else current
+            for c in range(capacity, weight - 1, -1):
+                candidate = fewer[c - weight] + value
+                if candidate > current[c]:
+                    current[c] = candidate
+                    row[k][c] = True
+        taken.append(row)
+
+    chosen = []
+    k, c = slots, capacity
+    for i in range(len(weights) - 1, -1, -1):
+        if k and taken[i][k][c]:
+            chosen.append(i)
+            c -= weights[i]
+            k -= 1 if limited else 0
+    return sorted(chosen)
+
+
+def trim_document(doc, max_tokens: int, encoding_name: str = "cl100k_base"):
+    """Copy of ``doc`` cut down to ``max_tokens`` by dropping both edges.
+
+    Keyword chunks are centred on their match, so the middle is kept. The
+    trailing "Category: ... | Page: ..." footer is preserved.
+    """
+    from langchain.schema import Document
+
+    encoding = get_encoding(encoding_name)
+    body, separator, footer = doc.page_content.rpartition("\n\n")
+    if not separator or "Category:" not in footer:
+        body, footer = doc.page_content, ""
+    footer_text = f"\n\n{footer}" if footer else ""
+
+    body_tokens = encoding.encode(body)
+    keep = max_tokens - len(encoding.encode(footer_text))
+    if keep <= 0:
+        return None
+    start = max(0, (len(body_tokens) - keep) // 2)
+    trimmed = encoding.decode(body_tokens[start : start + keep]) + footer_text
+
+    metadata = dict(doc.metadata)
+    metadata["trimmed"] = True
+    metadata["token_count"] = len(encoding.encode(trimmed))
+    return Document(page_content=trimmed, metadata=metadata)
+
+
+def pack_context(
+    candidates: Sequence[Tuple[object, float]],
+    budget: int,
+    granularity: int = 32,
+    min_trim_tokens: int = 128,
+    encoding_name: str = "cl100k_base",
+    max_docs: Optional[int] = None,
+) -> List[object]:
+    """Choose the set of chunks that carries the most relevance per budget.
+
+    Each chunk's relevance is scaled by its ``keyword_weight`` metadata
+    (the weight of the strongest keyword it was built around, 1.0 when
+    absent), so chunks around weak keywords such as "Cost of revenue"
+    lose out to equally relevant ones around the answer's own keywords.
+
+    Args:
+        candidates: ``(document, relevance)`` pairs, most relevant first
+        budget: Maximum total tokens for the selected documents
+        max_docs: Maximum number of selected documents, the trimmed one
+            included (None = only the budget limits them)
+        granularity: Token bucket size used to keep the knapsack table small;
+            weights are rounded up so the budget is never exceeded
+        min_trim_tokens: Smallest leftover budget worth filling with a
+            trimmed chunk
+        encoding_name: tiktoken encoding used for counting
+
+    Returns:
+        Selected documents in relevance order; at most one of them is a
+        trimmed copy filling the leftover budget
+    """
+    if not candidates or budget <= 0:
+        return []
+
+    tokens = [doc_tokens(doc, encoding_name) for doc, _ in candidates]
+    weights = [max(1, math.ceil(count / granularity)) for count in tokens]
+    # Relevance scores can be zero or negative; keep every value positive so
+    # the solver still prefers filling the budget over leaving it empty.
+    values = [
+        (max(score, 0.0) + 1e-6) * doc.metadata.get("keyword_weight", 1.0)
+        for doc, score in candidates
+    ]
+
+    chosen = knapsack(weights, values, budget // granularity, max_docs)
+    selected = [candidates[i][0] for i in chosen]
+
+    remaining = budget - sum(tokens[i] for i in chosen)
+    room = max_docs is None or len(selected) < max_docs
+    if room and remaining >= min_trim_tokens:
+        chosen_set = set(chosen)
+        for i, (doc, _) in enumerate(candidates):
+            if i not in chosen_set:
+                trimmed = trim_document(doc, remaining, encoding_name)
+                if trimmed is not None:
+                    selected.append(trimmed)
+                break
+
+    return selected
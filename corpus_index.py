@@ -0,0 +1,443 @@
+"""Archive-wide vector index with a SQLite metadata side table.
+
+Usage:
+    python corpus_index.py add data/*.pdf [--tasks revenue ipo] [--year 2024]
+    python corpus_index.py search "offer price" [--category offering]
+        [--language English] [--year 2024] [--source data/x.pdf] [-k 5]
+    python corpus_index.py rebuild [--index ivf]
+
+Unlike vector_store.PersistentVectorStore (a flat FAISS index searched
+one document at a time), chunks of every filing go into one HNSW or IVF index
+whose ids are rows of a metadata table. Filters on source, category,
+language, keyword, year or doc_key are resolved in SQLite first and the
+vector search only considers the matching ids.
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from metrics import metrics
+
+DEFAULT_CORPUS_DIR = os.path.join(".cache", "corpus")
+INDEX_TYPES = ("hnsw", "ivf")
+# Filter keys stored once per chunk, and those a merged span can hold several of
+_COLUMNS = ("doc_key", "source", "year")
+_TAGS = {"category": "categories", "language": "languages", "keyword": "keywords"}
+_YEAR = re.compile(r"(?<!\d)(19[89]\d|20[0-4]\d)(?!\d)")
+
+
+def infer_year(texts: Iterable[str]) -> Optional[int]:
+    """Filing year: the latest year mentioned in at least two chunks.
+
+    Prospectuses and reports quote several historical years; the latest
+    one that recurs is the offering or reporting year. Falls back to the
+    latest year mentioned at all.
+    """
+    counts = Counter()
+    for text in texts:
+        counts.update({int(year) for year in _YEAR.findall(text)})
+    if not counts:
+        return None
+    recurring = [year for year, count in counts.items() if count >= 2]
+    return max(recurring or counts)
+
+
+class CorpusIndex:
+    """Chunks of many PDFs in one ANN index, pre-filtered by metadata.
+
+    Vectors are appended to a float32 file whose row number is the chunk
+    id used by FAISS and by the ``chunks`` table, so the ANN index can be
+    rebuilt (or switched between HNSW and IVF) without re-embedding.
+    A filter is turned into the list of matching ids; when it matches at
+    most ``exact_limit`` chunks their vectors are scored directly (exact
+    and a few milliseconds), otherwise the ANN search runs with an
+    IDSelector so unrelated filings are never visited.
+
+    HNSW accepts vectors incrementally. IVF is trained on the first batch
+    added; call rebuild() once the archive is loaded to retrain it with
+    ``4 * sqrt(n)`` lists.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        path: Optional[str] = None,
+        index_type: str = "hnsw",
+        hnsw_m: int = 32,
+        ef_search: int = 128,
+        nlist: int = 1024,
+        nprobe: int = 16,
+        exact_limit: int = 20000,
+    ):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(
+                f"index_type must be one of {INDEX_TYPES}, got {index_type!r}"
+            )
+        self.embeddings = embeddings
+        self.path = path or os.getenv("FRE_CORPUS_DIR", DEFAULT_CORPUS_DIR)
+        self.index_type = index_type
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.exact_limit = exact_limit
+        os.makedirs(self.path, exist_ok=True)
+        self._index_path = os.path.join(self.path, "index.faiss")
+        self._vectors_path = os.path.join(self.path, "vectors.f32")
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(
+            os.path.join(self.path, "metadata.sqlite"), check_same_thread=False
+        )
+        self._create_tables()
+        self._dim = self._setting("dim", int)
+        self.index = None
+        if os.path.exists(self._index_path):
+            import faiss
+
+            self.index = faiss.read_index(self._index_path)
+            self.index_type = self._setting("index_type", str) or self.index_type
+
+    # ---- storage ----
+
+    def _create_tables(self):
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT);"
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " doc_key TEXT PRIMARY KEY, source TEXT, year INTEGER, chunks INTEGER);"
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " id INTEGER PRIMARY KEY, doc_key TEXT NOT NULL, source TEXT,"
+            " year INTEGER, page_content TEXT NOT NULL, metadata TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS chunks_doc_key ON chunks (doc_key);"
+            "CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source);"
+            "CREATE INDEX IF NOT EXISTS chunks_year ON chunks (year);"
+            "CREATE TABLE IF NOT EXISTS tags ("
+            " field TEXT NOT NULL, value TEXT NOT NULL, id INTEGER NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS tags_lookup ON tags (field, value, id);"
+        )
+        self._conn.commit()
+
+    def _setting(self, key: str, cast):
+        row = self._conn.execute(
+            "SELECT value FROM settings WHERE key = ?", (key,)
+        ).fetchone()
+        return cast(row[0]) if row else None
+
+    def _set(self, key: str, value) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO settings VALUES (?, ?)", (key, str(value))
+        )
+
+    def _vectors(self) -> np.ndarray:
+        if self._dim is None or not os.path.exists(self._vectors_path):
+            return np.zeros((0, self._dim or 0), dtype=np.float32)
+        return np.memmap(self._vectors_path, dtype=np.float32, mode="r").reshape(
+            -1, self._dim
+        )
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()
+        return count
+
+    def __contains__(self, doc_key: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM documents WHERE doc_key = ?", (doc_key,)
+            ).fetchone()
+        return row is not None
+
+    # ---- building ----
+
+    def _new_index(self, train: np.ndarray):
+        import faiss
+
+        if self.index_type == "hnsw":
+            index = faiss.index_factory(
+                self._dim, f"IDMap2,HNSW{self.hnsw_m},Flat", faiss.METRIC_INNER_PRODUCT
+            )
+        else:
+            # IVF needs ~39 training points per list
+            nlist = max(1, min(self.nlist, len(train) // 39))
+            index = faiss.index_factory(
+                self._dim, f"IVF{nlist},Flat", faiss.METRIC_INNER_PRODUCT
+            )
+            index.train(train)
+        return index
+
+    def add_documents(
+        self, doc_key: str, docs: Sequence, year: Optional[int] = None
+    ) -> bool:
+        """Embed and index one PDF's chunks unless ``doc_key`` is present.
+
+        Args:
+            doc_key: Key of the PDF and chunking (see PersistentVectorStore)
+            docs: Chunks from split_pages, with their metadata
+            year: Filing year; inferred from the chunk texts when omitted
+
+        Returns:
+            True if the chunks were added, False if already indexed
+        """
+        if doc_key in self or not docs:
+            return False
+        vectors = np.asarray(
+            self.embeddings.embed_documents([doc.page_content for doc in docs]),
+            dtype=np.float32,
+        )
+        if year is None:
+            year = infer_year(doc.page_content for doc in docs)
+        source = docs[0].metadata.get("source")
+
+        with self._lock:
+            # Another thread may have added the same PDF while we embedded
+            if doc_key in self:
+                return False
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+                self._set("dim", self._dim)
+            start = len(self._vectors())
+            ids = np.arange(start, start + len(docs), dtype=np.int64)
+            if self.index is None:
+                self.index = self._new_index(vectors)
+                self._set("index_type", self.index_type)
+            self.index.add_with_ids(vectors, ids)
+            with open(self._vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+
+            for chunk_id, doc in zip(ids.tolist(), docs):
+                metadata = dict(doc.metadata, doc_key=doc_key, year=year)
+                self._conn.execute(
+                    "INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        chunk_id,
+                        doc_key,
+                        metadata.get("source"),
+                        year,
+                        doc.page_content,
+                        json.dumps(metadata, ensure_ascii=False, default=str),
+                    ),
+                )
+                self._conn.executemany(
+                    "INSERT INTO tags VALUES (?, ?, ?)",
+                    [
+                        (field, str(value), chunk_id)
+                        for field, plural in _TAGS.items()
+                        for value in set(metadata.get(plural) or [metadata.get(field)])
+                        if value is not None
+                    ],
+                )
+            self._conn.execute(
+                "INSERT INTO documents VALUES (?, ?, ?, ?)",
+                (doc_key, source, year, len(docs)),
+            )
+            self._conn.commit()
+        return True
+
+    def save(self) -> None:
+        """Write the ANN index (metadata and vectors are already on disk)."""
+        import faiss
+
+        with self._lock:
+            if self.index is not None:
+                faiss.write_index(self.index, self._index_path + ".tmp")
+                os.replace(self._index_path + ".tmp", self._index_path)
+            self._conn.commit()
+
+    def rebuild(self, index_type: Optional[str] = None) -> None:
+        """Rebuild the ANN index from the stored vectors, no re-embedding.
+
+        IVF gets ``4 * sqrt(n)`` lists trained on every stored vector.
+        """
+        with self._lock:
+            self.index_type = index_type or self.index_type
+            vectors = np.ascontiguousarray(self._vectors())
+            if not len(vectors):
+                return
+            if self.index_type == "ivf":
+                self.nlist = int(4 * math.sqrt(len(vectors)))
+            self.index = self._new_index(vectors)
+            self.index.add_with_ids(vectors, np.arange(len(vectors), dtype=np.int64))
+            self._set("index_type", self.index_type)
+            self.save()
+
+    # ---- search ----
+
+    def _matching_ids(self, filters: Dict) -> Optional[np.ndarray]:
+        """Chunk ids matching every filter (values may be lists); None = all."""
+        clauses, params = [], []
+        for field, wanted in filters.items():
+            if wanted is None:
+                continue
+            values = (
+                list(wanted) if isinstance(wanted, (list, tuple, set)) else [wanted]
+            )
+            marks = ", ".join("?" * len(values))
+            if field in _COLUMNS:
+                clauses.append(f"{field} IN ({marks})")
+                params.extend(values)
+            elif field in _TAGS:
+                clauses.append(
+                    f"id IN (SELECT id FROM tags WHERE field = ? AND value IN ({marks}))"
+                )
+                params.extend([field] + [str(value) for value in values])
+            else:
+                raise ValueError(f"cannot filter on {field!r}")
+        if not clauses:
+            return None
+        rows = self._conn.execute(
+            f"SELECT id FROM chunks WHERE {' AND '.join(clauses)}", params
+        ).fetchall()
+        return np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+
+    def _exact(self, vector: np.ndarray, ids: np.ndarray, k: int):
+        scores = self._vectors()[ids] @ vector
+        top = np.argsort(-scores)[:k]
+        return ids[top], scores[top]
+
+    def _ann(self, vector: np.ndarray, k: int, ids: Optional[np.ndarray]):
+        import faiss
+
+        selector = None
+        if ids is not None:
+            selector = faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids))
+        if self.index_type == "hnsw":
+            params = faiss.SearchParametersHNSW(sel=selector, efSearch=self.ef_search)
+        else:
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=self.nprobe)
+        scores, found = self.index.search(vector[None, :], k, params=params)
+        keep = found[0] >= 0
+        return found[0][keep], scores[0][keep]
+
+    def search_by_vector(
+        self, vector: Sequence[float], k: int = 4, **filters
+    ) -> List[Tuple[object, float]]:
+        """``(Document, cosine similarity)`` pairs for the best ``k`` chunks.
+
+        Keyword filters: doc_key, source, year, category, language, keyword;
+        each takes one value or a list of accepted values.
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock, metrics.stage("corpus_search"):
+            if self.index is None:
+                return []
+            ids = self._matching_ids(filters)
+            if ids is not None and len(ids) == 0:
+                return []
+            if ids is not None and len(ids) <= self.exact_limit:
+                found, scores = self._exact(vector, ids, k)
+            else:
+                found, scores = self._ann(vector, k, ids)
+            return list(zip(self._documents(found.tolist()), scores.tolist()))
+
+    def _documents(self, ids: List[int]) -> List:
+        from langchain.schema import Document
+
+        if not ids:
+            return []
+        marks = ", ".join("?" * len(ids))
+        rows = dict(
+            (row[0], row[1:])
+            for row in self._conn.execute(
+                f"SELECT id, page_content, metadata FROM chunks WHERE id IN ({marks})",
+                ids,
+            )
+        )
+        return [
+            Document(page_content=rows[i][0], metadata=json.loads(rows[i][1]))
+            for i in ids
+        ]
+
+    def search(self, query: str, k: int = 4, **filters) -> List[Tuple[object, float]]:
+        return self.search_by_vector(self.embeddings.embed_query(query), k, **filters)
+
+    # Vector-store interface used by retrieve_documents and HybridRetriever;
+    # ``filter`` is a dict of the keyword filters above
+
+    def similarity_search_with_relevance_scores(
+        self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs
+    ):
+        return self.search(query, k, **(filter or {}))
+
+    def similarity_search_with_score_by_vector(
+        self, embedding, k: int = 4, filter: Optional[dict] = None, **kwargs
+    ):
+        return self.search_by_vector(embedding, k, **(filter or {}))
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs
+    ):
+        return [doc for doc, _ in self.search(query, k, **(filter or {}))]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def main(argv=None):
+    from embedding_cache import CachedEmbeddings
+    from extraction import extract_pages, extractor_version, open_page_cache
+    from llm_report import embedding_model_key, initialize_embeddings, split_pages
+    from vector_store import PersistentVectorStore
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="index PDFs")
+    add.add_argument("pdfs", nargs="+")
+    add.add_argument("--tasks", nargs="+", choices=["revenue", "ipo"], default=["ipo"])
+    add.add_argument("--year", type=int, help="filing year (default: inferred)")
+    search = commands.add_parser("search", help="filtered similarity search")
+    search.add_argument("query")
+    search.add_argument("-k", type=int, default=5)
+    for field in ("source", "category", "language", "keyword"):
+        search.add_argument(f"--{field}", nargs="+")
+    search.add_argument("--year", type=int, nargs="+")
+    rebuild = commands.add_parser("rebuild", help="rebuild the ANN index")
+    rebuild.add_argument("--index", choices=INDEX_TYPES)
+    args = parser.parse_args(argv)
+
+    embeddings = CachedEmbeddings(initialize_embeddings(None), embedding_model_key())
+    corpus = CorpusIndex(embeddings)
+    if args.command == "add":
+        cache = open_page_cache()
+        for pdf_path in args.pdfs:
+            pages = extract_pages(pdf_path, workers=None, cache=cache)
+            for task in args.tasks:
+                choice = "1" if task == "revenue" else "2"
+                doc_key = PersistentVectorStore.document_key(
+                    cache.key_for(pdf_path),
+                    choice=choice,
+                    window_chars=1500,
+                    extractor=extractor_version(),
+                    pages=None,
+                )
+                docs = split_pages(pages, pdf_path, choice=choice, verbose=False)
+                added = corpus.add_documents(doc_key, docs, year=args.year)
+                print(f"{pdf_path} ({task}): {len(docs) if added else 0} chunks added")
+        corpus.save()
+    elif args.command == "search":
+        filters = {
+            field: getattr(args, field)
+            for field in ("source", "category", "language", "keyword", "year")
+        }
+        for doc, score in corpus.search(args.query, args.k, **filters):
+            meta = doc.metadata
+            print(
+                f"{score:.3f}  {meta.get('source')} p.{meta.get('page')} "
+                f"[{meta.get('category')}, {meta.get('year')}] "
+                f"{doc.page_content[:100]!r}"
+            )
+    else:
+        corpus.rebuild(args.index)
+        print(f"Rebuilt {corpus.index_type} index over {len(corpus)} chunks")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""Embedding backends: sentence-transformers on PyTorch, or ONNX Runtime int8.
+
+Usage:
+    python embedding_backends.py export [--model NAME] [--no-quantize]
+
+The ONNX backend runs the same transformer exported to ONNX with its
+weights dynamically quantized to int8, plus the mean pooling and L2
+normalization sentence-transformers applies. At run time it only needs
+onnxruntime and tokenizers. Pick the backend with FRE_EMBEDDING_BACKEND
+(torch or onnx) and the number of inference threads with
+FRE_EMBEDDING_THREADS; the exported model lives in FRE_ONNX_DIR.
+
+The ONNX backend is experimental and also needs FRE_EXPERIMENTAL_ONNX=1:
+its parity with the torch vectors has only been measured on a randomly
+initialised model of the same architecture, not on the released weights.
+Run benchmarks/bench_embeddings.py against the real model first.
+"""
+
+import argparse
+import inspect
+import json
+import os
+import re
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+BACKENDS = ("torch", "onnx")
+DEFAULT_ONNX_DIR = os.path.join(".cache", "onnx")
+_INPUTS = ("input_ids", "attention_mask", "token_type_ids")
+
+
+def backend_name(backend: Optional[str] = None) -> str:
+    """The requested backend, or FRE_EMBEDDING_BACKEND (default "torch")."""
+    backend = backend or os.getenv("FRE_EMBEDDING_BACKEND", "torch")
+    if backend not in BACKENDS:
+        raise ValueError(
+            f"embedding backend must be one of {BACKENDS}, got {backend!r}"
+        )
+    if backend == "onnx" and not os.getenv("FRE_EXPERIMENTAL_ONNX"):
+        raise ValueError(
+            "the onnx embedding backend is experimental: set FRE_EXPERIMENTAL_ONNX=1"
+            " once benchmarks/bench_embeddings.py shows parity with torch"
+        )
+    return backend
+
+
+def thread_count(threads: Optional[int] = None) -> Optional[int]:
+    """The requested thread count, or FRE_EMBEDDING_THREADS; None = library default."""
+    if threads is None and os.getenv("FRE_EMBEDDING_THREADS"):
+        threads = int(os.environ["FRE_EMBEDDING_THREADS"])
+    return threads
+
+
+def model_key(model_name: str, backend: Optional[str] = None) -> str:
+    """Name under which vectors of this model and backend are cached and indexed.
+
+    int8 vectors are close to, but not the same as, the float ones, so
+    they get their own embedding cache and vector store.
+    """
+    backend = backend_name(backend)
+    return model_name if backend == "torch" else f"{model_name}@onnx-int8"
+
+
+def onnx_model_dir(model_name: str, root: Optional[str] = None) -> str:
+    root = root or os.getenv("FRE_ONNX_DIR", DEFAULT_ONNX_DIR)
+    return os.path.join(root, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+
+
+def export_onnx(model_name: str, out_dir: str, quantize: bool = True) -> str:
+    """Export a sentence-transformers model to ONNX (needs torch once).
+
+    Writes ``model.onnx`` (and ``model.int8.onnx`` when quantizing), the
+    fast tokenizer and a ``config.json`` with the model's sequence limit.
+
+    Returns:
+        Path of the model file OnnxEmbeddings should load
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(out_dir, exist_ok=True)
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0]
+    transformer.tokenizer.save_pretrained(out_dir)
+
+    sample = transformer.tokenizer(["Total revenue"], return_tensors="pt")
+    names = [name for name in _INPUTS if name in sample]
+    float_path = os.path.join(out_dir, "model.onnx")
+    # Recent torch defaults to the dynamo exporter (needs onnxscript); the
+    # TorchScript one handles this model and its dynamic axes
+    legacy = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        legacy["dynamo"] = False
+
+    class Encoder(torch.nn.Module):
+        # Keyword call: transformers' forward() signatures differ by version
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(names, inputs))).last_hidden_state
+
+    with torch.no_grad():
+        torch.onnx.export(
+            Encoder(transformer.auto_model.eval()),
+            tuple(sample[name] for name in names),
+            float_path,
+            input_names=names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                **{name: {0: "batch", 1: "sequence"} for name in names},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=14,
+            **legacy,
+        )
+
+    model_path = float_path
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        model_path = os.path.join(out_dir, "model.int8.onnx")
+        quantize_dynamic(float_path, model_path, weight_type=QuantType.QInt8)
+
+    with open(os.path.join(out_dir, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "model_name": model_name,
+                "model_file": os.path.basename(model_path),
+                "max_seq_length": st_model.max_seq_length,
+            },
+            f,
+            indent=2,
+        )
+    return model_path
+
+
+class OnnxEmbeddings(Embeddings):
+    """Normalized mean-pooled embeddings from an exported ONNX model.
+
+    Texts are tokenized, sorted by token count and batched so each batch
+    is only padded to its own longest text; results are returned in the
+    input order. Batches are small: once sorted they lose little
+    throughput, and ONNX Runtime's memory arena grows with the largest
+    batch (about 350 MB peak RSS at 8 chunks, 1 GB at 32). ``threads``
+    sets ONNX Runtime's intra-op thread count, so several worker
+    processes can share a machine without oversubscribing it.
+    """
+
+    def __init__(
+        self, model_dir: str, threads: Optional[int] = None, batch_size: int = 8
+    ):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, "config.json"), encoding="utf-8") as f:
+            config = json.load(f)
+        self.batch_size = batch_size
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(config["max_seq_length"])
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = (
+            onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        options.inter_op_num_threads = 1
+        threads = thread_count(threads)
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, config["model_file"]),
+            options,
+            providers=["CPUExecutionProvider"],
+        )
+        self._inputs = [inp.name for inp in self.session.get_inputs()]
+
+    @classmethod
+    def from_pretrained(
+        cls, model_name: str, threads: Optional[int] = None, **kwargs
+    ) -> "OnnxEmbeddings":
+        """Load the exported model, exporting and quantizing it on first use."""
+        model_dir = onnx_model_dir(model_name)
+        if not os.path.exists(os.path.join(model_dir, "config.json")):
+            export_onnx(model_name, model_dir)
+        return cls(model_dir, threads=threads, **kwargs)
+
+    def _run(self, encodings) -> np.ndarray:
+        width = max(len(encoding.ids) for encoding in encodings)
+        arrays = {name: np.zeros((len(encodings), width), np.int64) for name in _INPUTS}
+        for row, encoding in enumerate(encodings):
+            length = len(encoding.ids)
+            arrays["input_ids"][row, :length] = encoding.ids
+            arrays["attention_mask"][row, :length] = 1
+            arrays["token_type_ids"][row, :length] = encoding.type_ids
+        (hidden,) = self.session.run(
+            ["last_hidden_state"], {name: arrays[name] for name in self._inputs}
+        )
+        mask = arrays["attention_mask"][:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled / np.maximum(norms, 1e-12)
+
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        """Embeddings of ``texts`` as a float32 array, one row per text."""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        encodings = self.tokenizer.encode_batch(list(texts))
+        order = np.argsort([len(encoding.ids) for encoding in encodings], kind="stable")
+        vectors = None
+        for start in range(0, len(order), self.batch_size):
+            rows = order[start : start + self.batch_size]
+            batch = self._run([encodings[i] for i in rows])
+            if vectors is None:
+                vectors = np.empty((len(texts), batch.shape[1]), dtype=np.float32)
+            vectors[rows] = batch
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_array([text])[0].tolist()
+
+
+def load_backend(
+    model_name: str, backend: Optional[str] = None, threads: Optional[int] = None
+) -> Embeddings:
+    """A fresh embeddings object for ``model_name`` on the given backend.
+
+    Both return L2-normalized vectors; the torch backend runs on MPS when
+    available.
+    """
+    backend = backend_name(backend)
+    threads = thread_count(threads)
+    if backend == "onnx":
+        return OnnxEmbeddings.from_pretrained(model_name, threads=threads)
+
+    import torch
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    if threads:
+        torch.set_num_threads(threads)
+    # Check if MPS is available (for Apple Silicon Macs)
+    device = "mps" if torch.backends.mps.is_available() else "cpu"
+    return HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs={"device": device},
+        encode_kwargs={"normalize_embeddings": True},
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="export and quantize a model")
+    export.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    export.add_argument("--out", help="output directory (default: FRE_ONNX_DIR)")
+    export.add_argument("--no-quantize", action="store_true")
+    args = parser.parse_args()
+
+    path = export_onnx(
+        args.model,
+        args.out or onnx_model_dir(args.model),
+        quantize=not args.no_quantize,
+    )
+    print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from metrics import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: one writer per cache directory
+    fcntl = None
+
+DEFAULT_CACHE_DIR = os.path.join(".cache", "embeddings")
+
+_DIGEST_SIZE = hashlib.sha256().digest_size
+
+
+def _size(path: str) -> int:
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+class CachedEmbeddings(Embeddings):
+    """Content-addressed cache in front of another embeddings object.
+
+    Vectors are keyed by SHA-256 of the model name plus the normalized text
+    and stored as rows of a float32 file that is read through
+    ``np.memmap``; a parallel file holds the row digests and is loaded into
+    a dict on start-up. Only cache misses are sent to the wrapped model, in
+    batches of ``batch_size``. A lock guards the lookups and the appends but
+    not the model call, so threads sharing the cache are not serialized
+    behind one another's inference. Processes sharing the directory (the
+    service next to a batch run) append under a file lock and number their
+    rows from the files on disk, and pick up each other's rows on a miss.
+    """
+
+    def __init__(
+        self,
+        base: Embeddings,
+        model_name: str,
+        cache_dir: Optional[str] = None,
+        batch_size: int = 64,
+    ):
+        self.base = base
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+
+        root = cache_dir or os.getenv("FRE_EMBEDDING_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.path = os.path.join(root, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+        os.makedirs(self.path, exist_ok=True)
+        self._vectors_path = os.path.join(self.path, "vectors.f32")
+        self._keys_path = os.path.join(self.path, "keys.bin")
+        self._dim_path = os.path.join(self.path, "dim")
+        self._lock_path = os.path.join(self.path, "lock")
+
+        self._lock = threading.Lock()
+        self._rows: Dict[bytes, int] = {}
+        # Rows of the files read so far (duplicate keys count once in _rows)
+        self._count = 0
+        self._dim = None
+        self._vectors = None
+        self._load()
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool = True):
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _load(self):
+        with self._file_lock():
+            if not self._refresh():
+                return
+            # Drop any half-written tail so the two files stay row-aligned
+            for path, row_size in self._row_files():
+                with open(path, "ab") as f:
+                    f.truncate(self._count * row_size)
+
+    def _refresh(self) -> bool:
+        """Read the rows appended since the last call, by any process.
+
+        Returns False while the cache holds no vectors yet.
+        """
+        if self._dim is None:
+            if not os.path.exists(self._dim_path):
+                return False
+            with open(self._dim_path) as f:
+                self._dim = int(f.read())
+        count = min(
+            _size(self._keys_path) // _DIGEST_SIZE,
+            _size(self._vectors_path) // (4 * self._dim),
+        )
+        if count > self._count:
+            with open(self._keys_path, "rb") as f:
+                f.seek(self._count * _DIGEST_SIZE)
+                keys = f.read((count - self._count) * _DIGEST_SIZE)
+            for row in range(self._count, count):
+                offset = (row - self._count) * _DIGEST_SIZE
+                self._rows.setdefault(keys[offset : offset + _DIGEST_SIZE], row)
+            self._count = count
+            self._map()
+        return True
+
+    def _row_files(self):
+        # Vectors first: a row only counts once its key is written too
+        return [
+            (self._vectors_path, 4 * self._dim),
+            (self._keys_path, _DIGEST_SIZE),
+        ]
+
+    def _map(self):
+        self._vectors = np.memmap(
+            self._vectors_path,
+            dtype=np.float32,
+            mode="r",
+            shape=(self._count, self._dim),
+        )
+
+    def _key(self, text: str, kind: str) -> bytes:
+        normalized = " ".join(unicodedata.normalize("NFC", text).split())
+        payload = f"{self.model_name}\0{kind}\0{normalized}".encode("utf-8")
+        return hashlib.sha256(payload).digest()
+
+    def _append(self, keys: List[bytes], vectors: List[List[float]]):
+        with self._file_lock():
+            # Another process may have appended since: number the new rows
+            # after its rows and skip the texts it already stored
+            self._refresh()
+            fresh = [(k, v) for k, v in zip(keys, vectors) if k not in self._rows]
+            if not fresh:
+                return
+            array = np.asarray([v for _, v in fresh], dtype=np.float32)
+            if self._dim is None:
+                self._dim = array.shape[1]
+                with open(self._dim_path, "w") as f:
+                    f.write(str(self._dim))
+            data = {
+                self._vectors_path: array.tobytes(),
+                self._keys_path: b"".join(k for k, _ in fresh),
+            }
+            for path, row_size in self._row_files():
+                with open(path, "ab") as f:
+                    # Cut a tail left by a writer that died mid-append
+                    f.truncate(self._count * row_size)
+                    f.write(data[path])
+            for row, (key, _) in enumerate(fresh, start=self._count):
+                self._rows[key] = row
+            self._count += len(fresh)
+            self._map()
+
+    def _embed(self, texts: List[str], kind: str) -> List[List[float]]:
+        keys = [self._key(text, kind) for text in texts]
+
+        with self._lock:
+            if any(key not in self._rows for key in keys):
+                with self._file_lock(exclusive=False):
+                    self._refresh()
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in self._rows and key not in missing:
+                    missing[key] = text
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        metrics.incr("embedding_cache_hits", len(texts) - len(missing))
+        metrics.incr("embeddings_computed", len(missing))
+
+        # The model runs outside the lock so other threads can keep reading
+        # the cache; a text embedded by two threads at once is stored once.
+        pending = list(missing.items())
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start : start + self.batch_size]
+            batch_texts = [text for _, text in batch]
+            with metrics.stage("embed"):
+                if kind == "query":
+                    vectors = [self.base.embed_query(t) for t in batch_texts]
+                else:
+                    vectors = self.base.embed_documents(batch_texts)
+            with self._lock:
+                self._append([key for key, _ in batch], vectors)
+
+        with self._lock:
+            return [self._vectors[self._rows[key]].tolist() for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(list(texts), "document")
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text], "query")[0]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "cached_vectors": len(self._rows),
+        }
@@ -0,0 +1,210 @@
+import hashlib
+import os
+import unicodedata
+from array import array
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Sequence
+
+from PyPDF2 import PdfReader
+
+from metrics import Metrics, metrics
+from normalization import current_mode, normalize_text
+from text_cache import PageTextCache
+
+# Bump whenever page processing changes so cached page texts are rebuilt
+EXTRACTOR_VERSION = "2"
+
+
+def extractor_version() -> str:
+    """EXTRACTOR_VERSION qualified by the FRE_TEXT_MODE in effect."""
+    return f"{EXTRACTOR_VERSION}-{current_mode()}"
+
+
+def fix_arabic(text):
+    """Fix Arabic text display issues (see normalization.normalize_text)."""
+    return normalize_text(text)
+
+
+def iter_page_texts(pdf_path: str) -> Iterator[str]:
+    """Yield the processed text of each page, one page at a time.
+
+    Args:
+        pdf_path: Path to the PDF file
+
+    Yields:
+        NFC-normalized, Arabic-fixed text of each page in order
+    """
+    reader = PdfReader(pdf_path)
+    for page in reader.pages:
+        yield _process_page(page)
+
+
+def _process_page(page, recorder: Metrics = metrics) -> str:
+    with recorder.stage("pdf_parse"):
+        raw = page.extract_text()
+    with recorder.stage("normalize"):
+        text = unicodedata.normalize("NFC", fix_arabic(raw))
+    recorder.incr("pages_extracted")
+    recorder.incr("chars_extracted", len(text))
+    return text
+
+
+def _extract_page_range(pdf_path: str, start: int, stop: int):
+    """Worker entry point: open the PDF and process pages ``[start, stop)``.
+
+    Returns the page texts and a metrics snapshot for the parent to merge.
+    """
+    recorder = Metrics()
+    reader = PdfReader(pdf_path)
+    texts = [_process_page(reader.pages[i], recorder) for i in range(start, stop)]
+    return texts, recorder.snapshot()
+
+
+def _extract_page_list(pdf_path: str, indices: List[int]):
+    """Worker entry point: open the PDF and process the pages in ``indices``."""
+    recorder = Metrics()
+    reader = PdfReader(pdf_path)
+    texts = [_process_page(reader.pages[i], recorder) for i in indices]
+    return texts, recorder.snapshot()
+
+
+def _page_ranges(page_count: int, shards: int):
+    size, extra = divmod(page_count, shards)
+    start = 0
+    for shard in range(shards):
+        stop = start + size + (1 if shard < extra else 0)
+        if stop > start:
+            yield start, stop
+        start = stop
+
+
+def extract_pages(
+    pdf_path: str,
+    workers: Optional[int] = 1,
+    cache: Optional[PageTextCache] = None,
+    page_numbers: Optional[Sequence[int]] = None,
+) -> List[str]:
+    """Extract the processed text of every page of a PDF.
+
+    Args:
+        pdf_path: Path to the PDF file
+        workers: Number of worker processes; 1 extracts serially in this
+            process, None uses one worker per CPU
+        cache: Optional page text cache; a hit skips PyPDF2 entirely
+        page_numbers: Optional 0-based pages to extract (see
+            page_filter.select_pages); every other page comes back as ""
+            so offsets and page numbers stay aligned
+
+    Returns:
+        List of page texts in page order. The parallel path produces exactly
+        the same output as the serial one.
+    """
+    with metrics.stage("extract"):
+        return _extract_cached(pdf_path, workers, cache, page_numbers)
+
+
+def _extract_cached(pdf_path, workers, cache, page_numbers) -> List[str]:
+    if page_numbers is not None:
+        return _extract_selected(pdf_path, workers, cache, sorted(set(page_numbers)))
+    if cache is None:
+        return _extract_pages(pdf_path, workers)
+
+    key = cache.key_for(pdf_path)
+    pages = cache.get(key)
+    if pages is None:
+        pages = _extract_pages(pdf_path, workers)
+        cache.put(key, pages)
+    else:
+        metrics.incr("page_cache_hits")
+    return pages
+
+
+def _extract_selected(pdf_path, workers, cache, indices: List[int]) -> List[str]:
+    key = None
+    if cache is not None:
+        key = cache.key_for(pdf_path)
+        # A full extraction already on disk beats re-reading any page
+        pages = cache.get(key)
+        if pages is not None:
+            metrics.incr("page_cache_hits")
+            wanted = set(indices)
+            return [text if i in wanted else "" for i, text in enumerate(pages)]
+        digest = hashlib.sha1(",".join(map(str, indices)).encode()).hexdigest()[:16]
+        key = f"{key}-sel{digest}"
+        pages = cache.get(key)
+        if pages is not None:
+            metrics.incr("page_cache_hits")
+            return pages
+
+    page_count = len(PdfReader(pdf_path).pages)
+    indices = [i for i in indices if 0 <= i < page_count]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(indices)) or 1
+    if workers <= 1:
+        texts, snapshot = _extract_page_list(pdf_path, indices)
+        metrics.merge(snapshot)
+    else:
+        shards = [indices[i :: workers * 4] for i in range(workers * 4)]
+        shards = [shard for shard in shards if shard]
+        texts_by_page = {}
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for shard, (chunk, snapshot) in zip(
+                shards,
+                executor.map(_extract_page_list, [pdf_path] * len(shards), shards),
+            ):
+                texts_by_page.update(zip(shard, chunk))
+                metrics.merge(snapshot)
+        texts = [texts_by_page[i] for i in indices]
+
+    pages = [""] * page_count
+    for i, text in zip(indices, texts):
+        pages[i] = text
+    if key is not None:
+        cache.put(key, pages)
+    return pages
+
+
+def open_page_cache(cache_dir: Optional[str] = None, **kwargs) -> PageTextCache:
+    """Page text cache tied to the current extractor version and text mode."""
+    return PageTextCache(cache_dir, version=extractor_version(), **kwargs)
+
+
+def _extract_pages(pdf_path: str, workers: Optional[int]) -> List[str]:
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        return list(iter_page_texts(pdf_path))
+
+    page_count = len(PdfReader(pdf_path).pages)
+    workers = min(workers, page_count) or 1
+    # A few shards per worker keeps the pool busy when some pages are heavier
+    ranges = list(_page_ranges(page_count, workers * 4))
+    pages = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map() returns results in submission order, so pages stay in order
+        for chunk, snapshot in executor.map(
+            _extract_page_range,
+            [pdf_path] * len(ranges),
+            [start for start, _ in ranges],
+            [stop for _, stop in ranges],
+        ):
+            pages.extend(chunk)
+            metrics.merge(snapshot)
+    return pages
+
+
+def build_page_offsets(pages: List[str]) -> array:
+    """Character offset at which each page starts in ``"".join(pages)``."""
+    offsets = array("q")
+    position = 0
+    for page_text in pages:
+        offsets.append(position)
+        position += len(page_text)
+    return offsets
+
+
+def page_for_offset(offsets: array, position: int) -> int:
+    """1-based page number containing character ``position``."""
+    return max(1, bisect_right(offsets, position))
@@ -0,0 +1,127 @@
+import unicodedata
+from functools import lru_cache
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from keywords import get_keywords, get_outline_keywords
+from matcher import KeywordEntry, KeywordMatcher, get_matcher
+from normalization import current_mode, normalize_text
+
+DEFAULT_WEIGHT = 1.0
+
+
+class KeywordSet(NamedTuple):
+    entries: List[KeywordEntry]
+    matcher: KeywordMatcher
+    # (category, lang, original phrase) -> weight
+    weights: Dict[Tuple[str, str, str], float]
+
+
+def validate_keywords(keywords) -> None:
+    """Check the ``{category: {lang: [{"phrase", "weight"?}]}}`` shape.
+
+    Raises:
+        ValueError: naming the first offending category/language/entry
+    """
+    if not isinstance(keywords, dict) or not keywords:
+        raise ValueError("keywords must be a non-empty {category: {lang: [...]}} dict")
+    for category, languages in keywords.items():
+        if not isinstance(languages, dict):
+            raise ValueError(
+                f"category {category!r} must map languages to entry lists, "
+                f"got {type(languages).__name__}"
+            )
+        for lang, entries in languages.items():
+            if not isinstance(entries, list):
+                raise ValueError(f"{category}/{lang}: expected a list of entries")
+            for entry in entries:
+                if not isinstance(entry, dict):
+                    raise ValueError(
+                        f"{category}/{lang}: entries must be dicts with a "
+                        f"'phrase', got {entry!r}"
+                    )
+                phrase = entry.get("phrase")
+                if not isinstance(phrase, str) or not phrase.strip():
+                    raise ValueError(f"{category}/{lang}: missing phrase in {entry!r}")
+                weight = entry.get("weight", DEFAULT_WEIGHT)
+                if not isinstance(weight, (int, float)) or weight <= 0:
+                    raise ValueError(
+                        f"{category}/{lang}: weight of {phrase!r} must be positive"
+                    )
+
+
+# ``mode`` only keys the caches below: transforms such as fix_arabic give a
+# different phrase under each FRE_TEXT_MODE.
+@lru_cache(maxsize=None)
+def _process_phrase(
+    phrase: str, transform: Optional[Callable[[str], str]], mode: str
+) -> str:
+    normalized = unicodedata.normalize("NFC", phrase)
+    return (transform(normalized) if transform else normalized).lower()
+
+
+def _build(
+    keywords: dict, transform: Optional[Callable[[str], str]], mode: str = ""
+) -> KeywordSet:
+    validate_keywords(keywords)
+
+    entries = []
+    weights = {}
+    for category, languages in keywords.items():
+        for lang, keyword_list in languages.items():
+            for entry in keyword_list:
+                phrase = entry["phrase"]
+                entries.append(
+                    (category, lang, phrase, _process_phrase(phrase, transform, mode))
+                )
+                weights[(category, lang, phrase)] = float(
+                    entry.get("weight", DEFAULT_WEIGHT)
+                )
+    return KeywordSet(entries, get_matcher(entries), weights)
+
+
+def keyword_set(
+    task: str, transform: Optional[Callable[[str], str]] = None
+) -> KeywordSet:
+    """Validated, processed and compiled keywords for ``task``.
+
+    The NFC + ``transform`` + lowercase form of every phrase and the
+    compiled matcher are built once per (task, transform, FRE_TEXT_MODE)
+    and reused by every later call, for the revenue and IPO tasks alike.
+    """
+    return _keyword_set(task, transform, current_mode())
+
+
+@lru_cache(maxsize=16)
+def _keyword_set(
+    task: str, transform: Optional[Callable[[str], str]], mode: str
+) -> KeywordSet:
+    return _build(get_keywords(task=task), transform, mode)
+
+
+def _section_keywords(task: str) -> dict:
+    return {
+        **get_outline_keywords(task),
+        **{f"text:{category}": langs for category, langs in get_keywords(task).items()},
+    }
+
+
+@lru_cache(maxsize=4)
+def outline_keyword_set(task: str) -> KeywordSet:
+    """Section-title keywords plus the task keywords, in logical text order."""
+    return _build(_section_keywords(task), None)
+
+
+def stream_form(text: str) -> str:
+    """Display-order, folded ``text`` with all whitespace removed.
+
+    Content streams draw glyphs in display order and break lines and words
+    wherever the layout does, so raw stream text is only comparable with
+    phrases in this form.
+    """
+    return "".join(normalize_text(text, "visual").split())
+
+
+@lru_cache(maxsize=4)
+def stream_keyword_set(task: str) -> KeywordSet:
+    """outline_keyword_set's phrases in stream_form, for raw page content."""
+    return _build(_section_keywords(task), stream_form)
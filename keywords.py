@@ -1,13 +1,17 @@
+# Every task shares one shape: {category: {language: [{"phrase", "weight"}]}}.
+# "weight" (default 1.0) ranks how strongly a hit points at the answer; it is
+# copied onto the chunks built around the hit. keyword_registry validates
+# this structure and caches the processed forms.
 revenue_keywords = {
     "revenue": {
         "English": [
             {"phrase": "Revenue"},
             {"phrase": "Total revenue"},
             {"phrase": "Net revenue"},
-            {"phrase": "Gross revenue"},
-            {"phrase": "Sales"},
-            {"phrase": "Cost of revenue"},
-            {"phrase": "Revenue from operations"},
+            {"phrase": "Gross revenue", "weight": 0.8},
+            {"phrase": "Sales", "weight": 0.8},
+            {"phrase": "Cost of revenue", "weight": 0.3},
+            {"phrase": "Revenue from operations", "weight": 0.9},
         ],
         "Arabic": [
             {"phrase": "ملخص المعلومات المالية"},  # arab.pdf, pru.pdf
@@ -15,26 +19,89 @@ revenue_keywords = {
     },
 }
 
-# IPO‐only keyword list
+# IPO keywords, grouped by what the hit tells us about the offering
 ipo_keywords = {
-    "English": [
-        "IPO",
-        "Initial Public Offering",
-    ],
-    "Arabic": [
-        "نشرة الإصدار",
-        "النشرة الأولية",
-        "النشرة النهائية",
-        "نشرة الإصدار التكميلية",
-        "سعر الطرح",
-        "أسهم الطرح",
-        "إجمالي العرض",
-        "متحصلات الطرح",
-        "استخدام متحصلات الطرح",
-        "بناء سجل الأوامر",
-        "فترة الحظر",
-        "موافقة الهيئة",
-    ],
+    "offering": {
+        "English": [
+            {"phrase": "IPO", "weight": 0.6},
+            {"phrase": "Initial Public Offering", "weight": 0.8},
+        ],
+        "Arabic": [
+            {"phrase": "سعر الطرح"},
+            {"phrase": "أسهم الطرح"},
+            {"phrase": "إجمالي العرض"},
+            {"phrase": "بناء سجل الأوامر", "weight": 0.7},
+        ],
+    },
+    "prospectus": {
+        "Arabic": [
+            {"phrase": "نشرة الإصدار", "weight": 0.5},
+            {"phrase": "النشرة الأولية", "weight": 0.5},
+            {"phrase": "النشرة النهائية", "weight": 0.5},
+            {"phrase": "نشرة الإصدار التكميلية", "weight": 0.5},
+        ],
+    },
+    "proceeds": {
+        "Arabic": [
+            {"phrase": "متحصلات الطرح", "weight": 0.8},
+            {"phrase": "استخدام متحصلات الطرح", "weight": 0.8},
+        ],
+    },
+    "regulatory": {
+        "Arabic": [
+            {"phrase": "فترة الحظر", "weight": 0.5},
+            {"phrase": "موافقة الهيئة", "weight": 0.5},
+        ],
+    },
+}
+
+
+# Section and table titles worth reading, matched against the PDF outline
+# before any page text is extracted (logical order, so no fix_arabic).
+# Statement sections outweigh single tables: the income statement sits a
+# few pages into them.
+outline_keywords = {
+    "1": {
+        "financials": {
+            "English": [
+                {"phrase": "revenue"},
+                {"phrase": "sales", "weight": 0.8},
+                {"phrase": "income statement", "weight": 2.0},
+                {"phrase": "statement of profit or loss", "weight": 2.0},
+                {"phrase": "financial statements", "weight": 2.0},
+                {"phrase": "financial information", "weight": 0.8},
+                {"phrase": "financial highlights", "weight": 0.8},
+                {"phrase": "results of operations", "weight": 0.6},
+            ],
+            "Arabic": [
+                {"phrase": "إيرادات"},
+                {"phrase": "الإيرادات"},
+                {"phrase": "مبيعات", "weight": 0.8},
+                {"phrase": "قائمة الدخل", "weight": 2.0},
+                {"phrase": "الأرباح أو الخسائر", "weight": 2.0},
+                {"phrase": "القوائم المالية", "weight": 2.0},
+                {"phrase": "المعلومات المالية", "weight": 0.8},
+            ],
+        },
+    },
+    "2": {
+        "offering": {
+            "English": [
+                {"phrase": "offer"},
+                {"phrase": "subscription", "weight": 0.8},
+                {"phrase": "use of proceeds"},
+                {"phrase": "underwrit", "weight": 0.6},
+                {"phrase": "summary of the offering"},
+            ],
+            "Arabic": [
+                {"phrase": "الطرح"},
+                {"phrase": "الاكتتاب", "weight": 0.8},
+                {"phrase": "متحصلات"},
+                {"phrase": "الأسهم المطروحة"},
+                {"phrase": "متعهد التغطية", "weight": 0.6},
+            ],
+        },
+    },
 }
 
 
@@ -43,3 +110,7 @@ def get_keywords(task: str):
         return revenue_keywords
     else:
         return ipo_keywords
+
+
+def get_outline_keywords(task: str):
+    return outline_keywords["1" if task == "1" else "2"]
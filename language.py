@@ -0,0 +1,167 @@
+import unicodedata
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from langdetect import DetectorFactory, LangDetectException, detect_langs
+
+from metrics import metrics
+
+# langdetect is randomized; a fixed seed makes routing reproducible
+DetectorFactory.seed = 0
+
+# Pages with fewer letters than this carry no usable signal (title pages,
+# scanned pages, page numbers)
+MIN_PAGE_LETTERS = 40
+# Share of one script above which a page is decided without langdetect
+SCRIPT_MARGIN = 0.8
+DEFAULT_LANGUAGE = "English"
+
+
+def _is_arabic(code: int) -> bool:
+    return (
+        0x0600 <= code <= 0x06FF
+        or 0x0750 <= code <= 0x077F
+        or 0xFB50 <= code <= 0xFDFF  # presentation forms A (fix_arabic output)
+        or 0xFE70 <= code <= 0xFEFF  # presentation forms B
+    )
+
+
+def script_counts(text: str) -> Tuple[int, int]:
+    """``(arabic letters, latin letters)`` in ``text``."""
+    arabic = latin = 0
+    for char in text:
+        if not char.isalpha():
+            continue
+        code = ord(char)
+        if _is_arabic(code):
+            arabic += 1
+        elif code < 0x0250:
+            latin += 1
+    return arabic, latin
+
+
+def _langdetect(text: str) -> Tuple[Optional[str], float]:
+    try:
+        # NFKC folds the presentation forms langdetect does not know
+        best = detect_langs(unicodedata.normalize("NFKC", text))[0]
+    except (LangDetectException, IndexError):
+        return None, 0.0
+    return ("Arabic" if best.lang == "ar" else "English"), best.prob
+
+
+class PageLanguage(NamedTuple):
+    language: Optional[str]
+    confidence: float
+    arabic: int
+    latin: int
+    method: str
+
+
+def page_language(text: str, use_langdetect: bool = True) -> PageLanguage:
+    """Language of a single page: script ratio first, langdetect if mixed."""
+    arabic, latin = script_counts(text)
+    letters = arabic + latin
+    if letters < MIN_PAGE_LETTERS:
+        return PageLanguage(None, 0.0, arabic, latin, "empty")
+    ratio = arabic / letters
+    if ratio >= SCRIPT_MARGIN:
+        return PageLanguage("Arabic", ratio, arabic, latin, "script")
+    if ratio <= 1 - SCRIPT_MARGIN:
+        return PageLanguage("English", 1 - ratio, arabic, latin, "script")
+    if not use_langdetect:
+        return PageLanguage(None, 0.0, arabic, latin, "mixed")
+    language, confidence = _langdetect(text)
+    return PageLanguage(language, confidence, arabic, latin, "langdetect")
+
+
+class LanguageDetector:
+    """Decide a document's language from its pages as they are produced.
+
+    Pages are classified by script ratio alone and recorded in ``pages``
+    (1-based page number -> PageLanguage). The letters of every page add
+    up as evidence; once one script holds at least ``threshold`` of at
+    least ``min_letters`` letters, ``done`` is set and further pages can
+    be skipped. Only a document that stays ambiguous is handed to
+    langdetect, in finish().
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        min_letters: int = 400,
+        sample_chars: int = 5000,
+    ):
+        self.threshold = threshold
+        self.min_letters = min_letters
+        self.sample_chars = sample_chars
+        self.pages: Dict[int, PageLanguage] = {}
+        self.arabic = 0
+        self.latin = 0
+        self.done = False
+        self.method = "script"
+        self._decided: Optional[str] = None
+        self._sample = ""
+        self._mixed_sample = ""
+
+    def feed(self, page_number: int, text: str) -> bool:
+        """Classify one page; returns True once the language is decided."""
+        result = page_language(text, use_langdetect=False)
+        self.pages[page_number] = result
+        self.arabic += result.arabic
+        self.latin += result.latin
+        if len(self._sample) < self.sample_chars:
+            self._sample += text[: self.sample_chars - len(self._sample)]
+        if result.method == "mixed" and len(self._mixed_sample) < self.sample_chars:
+            self._mixed_sample += text[: self.sample_chars - len(self._mixed_sample)]
+        self.done = (
+            self.arabic + self.latin >= self.min_letters
+            and self.confidence >= self.threshold
+        )
+        return self.done
+
+    def finish(self) -> str:
+        """Settle an undecided document and return its language.
+
+        Below the threshold, langdetect looks at the mixed-script pages (or
+        everything when none were mixed). With no readable letters at all
+        the result is DEFAULT_LANGUAGE, so routing never gets "Unknown".
+        """
+        if self.done or self._decided is not None:
+            return self.language
+        if self.arabic + self.latin:
+            language, _ = _langdetect(self._mixed_sample or self._sample)
+            if language is not None:
+                self._decided = language
+                self.method = "langdetect"
+        return self.language
+
+    @property
+    def language(self) -> str:
+        if self._decided is not None:
+            return self._decided
+        if not self.arabic + self.latin:
+            return DEFAULT_LANGUAGE
+        return "Arabic" if self.arabic >= self.latin else "English"
+
+    @property
+    def confidence(self) -> float:
+        """Share of the letters seen so far in the leading script."""
+        total = self.arabic + self.latin
+        return max(self.arabic, self.latin) / total if total else 0.0
+
+
+@metrics.timed("language")
+def detect_document_language(
+    pages: Iterable[str], threshold: float = 0.9, min_letters: int = 400
+) -> LanguageDetector:
+    """Feed pages (a list or a lazy stream) until the language is decided.
+
+    Empty strings (pages skipped by the prefilter) are passed over without
+    being classified. The returned detector holds ``language``,
+    ``confidence`` and the per-page map of every page it looked at.
+    """
+    detector = LanguageDetector(threshold, min_letters)
+    for page_number, text in enumerate(pages, start=1):
+        if text and detector.feed(page_number, text):
+            break
+    detector.finish()
+    return detector
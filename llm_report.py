@@ -1,25 +1,38 @@
 # ==================== IMPORTS ====================
 
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain.chains.question_answering import load_qa_chain
-from langchain_openai import OpenAI, ChatOpenAI
-from langchain_community.embeddings import HuggingFaceEmbeddings
-import re
-from PyPDF2 import PdfReader
-import arabic_reshaper
-from bidi.algorithm import get_display
+# Heavy dependencies (torch, langchain, model clients) are imported inside the
+# functions that need them so that importing this module stays cheap.
+from bisect import bisect_right
+from collections import Counter
+import json
 import os
 from dotenv import load_dotenv
-import tiktoken
-from langchain.schema import Document
-import unicodedata
-from queries import get_query
-from keywords import get_keywords
-from langdetect import detect, LangDetectException
-from langchain_anthropic import ChatAnthropic
-import torch
+from typing import Any, Callable, List, Optional
+from queries import get_query, get_retrieval_queries
+from keyword_registry import keyword_set
+from context_packer import doc_tokens, pack_context
+from extraction import (
+    build_page_offsets,
+    extract_pages,
+    extractor_version,
+    fix_arabic,
+    open_page_cache,
+    page_for_offset,
+)
+from language import LanguageDetector, detect_document_language
+from metrics import metrics, profiled
+from page_filter import select_pages
+from numeric_extractor import FAST_PATH_CONFIDENCE, extract_revenue, to_result
+from retrieval import HybridRetriever, multi_query_search
+from spans import hit_windows, merge_windows, unique
+from resources import get_encoding, registry
+from schemas import (
+    StreamingJSONParser,
+    output_instructions,
+    parse_result,
+    streaming_handler,
+)
+from text_cache import PageTextCache
 
 # ==================== LANGUAGE DETECTION ====================
 load_dotenv()
@@ -37,10 +50,9 @@ def detect_language(text: str) -> str:
     Returns:
         'Arabic' if the text is primarily Arabic, 'English' otherwise
     """
-    try:
-        return "Arabic" if detect(text) == "ar" else "English"
-    except LangDetectException:
-        return "Unknown"
+    detector = LanguageDetector()
+    detector.feed(1, text)
+    return detector.finish()
 
 
 # ==================== ENVIRONMENT SETUP ====================
@@ -57,101 +69,187 @@ def load_environment():
 
 
 def count_tokens(text: str, model: str = "cl100k_base") -> int:
-    encoding = tiktoken.get_encoding(model)
-    return len(encoding.encode(text))
+    return len(get_encoding(model).encode(text))
 
 
-def fix_arabic(text):
-    """Fix Arabic text display issues."""
-    if not text:
-        return ""
-    reshaped = arabic_reshaper.reshape(text)
-    return get_display(reshaped)
+def prompt_tokens(query: str, docs) -> int:
+    """Tokens sent for ``query`` over ``docs`` (chunk counts reused if known)."""
+    return count_tokens(query) + sum(doc_tokens(doc) for doc in docs)
 
 
 # ==================== LOADING AND SPLITTING ====================
 
 
-def load_and_split_pdf(pdf_path: str, window_chars: int = 1500, choice: str = "1"):
+def load_and_split_pdf(
+    pdf_path: str,
+    window_chars: int = 1500,
+    choice: str = "1",
+    merge: bool = True,
+    max_span_chars: Optional[int] = None,
+    workers: Optional[int] = 1,
+    cache: Optional[PageTextCache] = None,
+    prefilter: bool = False,
+    top_pages: int = 16,
+    fallback: str = "full",
+):
     """Load PDF and extract keyword matches with context.
 
     Args:
         pdf_path: Path to the PDF file
         window_chars: Number of characters to include around keyword matches
         choice: User's choice ('1' for revenue, '2' for IPO)
+        merge: Merge overlapping or adjacent match windows into one document
+        max_span_chars: Optional cap on the length of a merged span
+        workers: Number of processes used for page extraction (None = all CPUs)
+        cache: Optional page text cache shared across runs
+        prefilter: Only extract the pages page_filter.select_pages ranks
+            highest for this task (plus their neighbours)
+        top_pages: Number of best-scoring pages kept by the prefilter
+        fallback: Prefilter behaviour when no page scores ("full" or "head")
 
     Returns:
         List of Document objects containing keyword matches with context
     """
-    # Load and extract text
-    reader = PdfReader(pdf_path)
-    text = ""
-    for i, doc in enumerate(reader.pages):
-        page_text = fix_arabic(doc.extract_text())
-        text += page_text
+    page_numbers = None
+    if prefilter:
+        selection = select_pages(
+            pdf_path, choice, top_n=top_pages, fallback=fallback, cache=cache
+        )
+        page_numbers = selection.pages
+        if page_numbers is not None:
+            print(f"Prefilter kept {len(page_numbers)} of {selection.page_count} pages")
+    pages = extract_pages(
+        pdf_path, workers=workers, cache=cache, page_numbers=page_numbers
+    )
+    return split_pages(
+        pages,
+        pdf_path,
+        window_chars=window_chars,
+        choice=choice,
+        merge=merge,
+        max_span_chars=max_span_chars,
+    )
+
 
-    print(f"Total extracted text length: {len(text)} characters")
+@metrics.timed("split")
+def split_pages(
+    pages: List[str],
+    pdf_path: str,
+    window_chars: int = 1500,
+    choice: str = "1",
+    merge: bool = True,
+    max_span_chars: Optional[int] = None,
+    verbose: bool = True,
+):
+    """Extract keyword matches with context from already extracted pages.
+
+    Args:
+        pages: Processed page texts, as returned by extract_pages
+        pdf_path: Path of the PDF the pages came from (stored as the source)
+        window_chars: Number of characters to include around keyword matches
+        choice: User's choice ('1' for revenue, '2' for IPO)
+        merge: Merge overlapping or adjacent match windows into one document
+        max_span_chars: Optional cap on the length of a merged span
+        verbose: Print match statistics
+
+    Returns:
+        List of Document objects containing keyword matches with context
+    """
+    from langchain.schema import Document
+
+    # Remember where each page starts so matches can be mapped to pages
+    page_offsets = build_page_offsets(pages)
+    text = "".join(pages)
+
+    if verbose:
+        print(f"Total extracted text length: {len(text)} characters")
 
-    # Normalize text for comparison
-    text = unicodedata.normalize("NFC", text)
     text_lower = text.lower()
 
-    # Select appropriate keywords based on choice
-    keywords = get_keywords(task=choice)
-
-    # Pre-process keywords for consistent comparison
-    processed_keywords = []
-    for category, languages in keywords.items():
-        for lang, keyword_list in languages.items():
-            for keyword_entry in keyword_list:
-                # Normalize and reshape each keyword
-                normalized_key = unicodedata.normalize("NFC", keyword_entry["phrase"])
-                processed_key = fix_arabic(normalized_key)
-                processed_keywords.append(
-                    (category, lang, keyword_entry["phrase"], processed_key.lower())
-                )
-
-    # Find keyword matches with context
-    documents = []
-    total_matches = 0
-    for category, lang, original_key, processed_key in processed_keywords:
-        matches = list(re.finditer(re.escape(processed_key), text_lower))
-        if matches:
+    # Keywords for the chosen task, processed like the page text and compiled once
+    keywords = keyword_set(choice, transform=fix_arabic)
+
+    # Find keyword matches in a single pass over the text
+    with metrics.stage("keyword_scan"):
+        hits = list(keywords.matcher.finditer(text_lower))
+    total_matches = len(hits)
+    metrics.incr("keyword_matches", total_matches)
+    if verbose:
+        counts = Counter((category, lang, key) for category, lang, key, _, _ in hits)
+        for (category, lang, original_key), count in counts.items():
             print(
-                f"Found {len(matches)} matches for keyword: {original_key} ({category} - {lang})"
-            )
-            total_matches += len(matches)
-
-        for match in matches:
-            start = max(0, match.start() - window_chars)
-            end = min(len(text), match.end() + window_chars)
-            context = (
-                text[start:end].strip()
-                + "\n\n"
-                + f"Category: {category} | Language: {lang}"
+                f"Found {count} matches for keyword: {original_key} ({category} - {lang})"
             )
-            # Create document for each match
-            doc = Document(
-                page_content=context,
-                metadata={
-                    "category": category,
-                    "language": lang,
-                    "keyword": original_key,
-                    "match_position": match.start(),
-                    "source": pdf_path,
-                },
-            )
-            documents.append(doc)
 
-    print(f"Total keyword matches found: {total_matches}")
-    print(f"Created {len(documents)} documents with context")
+    # Turn the hits into context spans, merging overlapping windows
+    if merge:
+        spans = merge_windows(hits, window_chars, len(text), max_span_chars)
+    else:
+        spans = hit_windows(hits, window_chars, len(text))
 
-    if not documents:
-        print(
-            "Warning: No keyword matches found in the PDF. Check if the keywords match the document content."
+    documents = []
+    for span in spans:
+        matches = span["matches"]
+        categories = unique(category for category, _, _, _ in matches)
+        languages = unique(lang for _, lang, _, _ in matches)
+        span_pages = unique(
+            page_for_offset(page_offsets, position) for _, _, _, position in matches
+        )
+        body = text[span["start"] : span["end"]]
+        lead = len(body) - len(body.lstrip())
+        # Where each page begins in page_content, for readers of single rows
+        page_starts = [(0, page_for_offset(page_offsets, span["start"] + lead))]
+        first = bisect_right(page_offsets, span["start"] + lead)
+        for page, offset in enumerate(page_offsets[first:], start=first + 1):
+            if offset >= span["end"]:
+                break
+            page_starts.append((offset - span["start"] - lead, page))
+        context = (
+            body.strip()
+            + "\n\n"
+            + f"Category: {', '.join(categories)} | Language: {', '.join(languages)}"
+            + f" | Page: {', '.join(str(page) for page in span_pages)}"
+        )
+        # Create one document per span
+        doc = Document(
+            page_content=context,
+            metadata={
+                "category": categories[0],
+                "language": languages[0],
+                "keyword": matches[0][2],
+                "match_position": matches[0][3],
+                "categories": categories,
+                "languages": languages,
+                "keywords": unique(keyword for _, _, keyword, _ in matches),
+                "match_positions": [position for _, _, _, position in matches],
+                "keyword_weight": max(
+                    keywords.weights[(category, lang, keyword)]
+                    for category, lang, keyword, _ in matches
+                ),
+                "span_start": span["start"],
+                "span_end": span["end"],
+                "page": span_pages[0],
+                "pages": span_pages,
+                "page_starts": page_starts,
+                "source": pdf_path,
+            },
         )
+        documents.append(doc)
+
+    metrics.incr("chunks", len(documents))
+    if verbose:
+        print(f"Total keyword matches found: {total_matches}")
+        print(f"Created {len(documents)} documents with context")
+
+    if not documents:
+        if verbose:
+            print(
+                "Warning: No keyword matches found in the PDF. Check if the keywords match the document content."
+            )
         # Create a single document with the first 1000 characters as fallback
-        doc = Document(page_content=text[:1000], metadata={"source": pdf_path})
+        doc = Document(
+            page_content=text[:1000], metadata={"source": pdf_path, "page": 1}
+        )
         documents.append(doc)
 
     return documents
@@ -159,62 +257,161 @@ def load_and_split_pdf(pdf_path: str, window_chars: int = 1500, choice: str = "1
 
 # ==================== INITIALIZERS ====================
 
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+QA_MODEL_NAME = "claude-opus-4-20250514"
+QA_TEMPERATURE = 0
+
+
+def embedding_model_key(backend: Optional[str] = None) -> str:
+    """Model name for the embedding cache and vector store of a backend."""
+    from embedding_backends import model_key
 
-def initialize_embeddings(api_key: str):
+    return model_key(EMBEDDING_MODEL_NAME, backend)
+
+
+def initialize_embeddings(api_key: str, backend: Optional[str] = None):
     """Initialize HuggingFace embeddings.
 
     Args:
         api_key: Not used for HuggingFace embeddings, kept for compatibility
+        backend: "torch" or "onnx" (int8 ONNX Runtime); defaults to
+            FRE_EMBEDDING_BACKEND, then "torch"
 
     Returns:
-        HuggingFaceEmbeddings instance
+        Embeddings instance, shared by every caller in the process
     """
-    # Check if MPS is available (for Apple Silicon Macs)
+    from embedding_backends import backend_name, load_backend
 
-    device = "mps" if torch.backends.mps.is_available() else "cpu"
-
-    return HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2",
-        model_kwargs={"device": device},
-        encode_kwargs={"normalize_embeddings": True},
+    backend = backend_name(backend)
+    return registry.get(
+        ("embeddings", EMBEDDING_MODEL_NAME, backend),
+        lambda: load_backend(EMBEDDING_MODEL_NAME, backend),
     )
 
 
 def initialize_qa_chain():
-    return load_qa_chain(
-        ChatAnthropic(model_name="claude-opus-4-20250514", temperature=0, verbose=True),
-        chain_type="stuff",
-    )
+    def load():
+        from langchain.chains.question_answering import load_qa_chain
+        from langchain_anthropic import ChatAnthropic
+
+        # ANTHROPIC_BASE_URL points the client at a proxy or a local fake server
+        client_kwargs = {}
+        if os.getenv("ANTHROPIC_BASE_URL"):
+            client_kwargs["anthropic_api_url"] = os.getenv("ANTHROPIC_BASE_URL")
+
+        return load_qa_chain(
+            ChatAnthropic(
+                model_name=QA_MODEL_NAME,
+                temperature=QA_TEMPERATURE,
+                # Tokens reach callbacks as they arrive; see schemas.streaming_handler
+                streaming=True,
+                verbose=True,
+                **client_kwargs,
+            ),
+            chain_type="stuff",
+        )
+
+    return registry.get(("qa_chain", QA_MODEL_NAME), load)
 
 
 # ==================== QA FUNCTION ====================
 
 
-def ask_question(docsearch, chain, query: str, max_docs: int = 5):
-    try:
-        docs = docsearch.similarity_search(query, k=max_docs)
+# Token budget for the documents passed to the QA chain
+MAX_MODEL_TOKENS = 25000
+RESERVED_FOR_RESPONSE = 512
+MAX_CONTEXT_TOKENS = MAX_MODEL_TOKENS - RESERVED_FOR_RESPONSE
 
-        # Filter docs to fit in token budget
-        MAX_MODEL_TOKENS = 25000
-        RESERVED_FOR_RESPONSE = 512
-        MAX_CONTEXT_TOKENS = MAX_MODEL_TOKENS - RESERVED_FOR_RESPONSE
 
-        selected_docs = []
-        total_tokens = 0
+# Candidates fetched per requested document before packing the budget
+OVERFETCH_FACTOR = 4
 
-        for doc in docs:
-            tokens = count_tokens(doc.page_content)
-            if total_tokens + tokens > MAX_CONTEXT_TOKENS:
-                break
-            selected_docs.append(doc)
-            total_tokens += tokens
-            if len(selected_docs) >= max_docs:
-                break
+
+@metrics.timed("retrieve")
+def retrieve_documents(
+    docsearch,
+    query: str,
+    max_docs: int = 5,
+    search_kwargs: Optional[dict] = None,
+    retrieval_queries: Optional[List[str]] = None,
+):
+    """Fetch the most relevant documents that fit the token budget.
+
+    ``max_docs * OVERFETCH_FACTOR`` candidates are retrieved and at most
+    ``max_docs`` of them are packed into MAX_CONTEXT_TOKENS by relevance,
+    trimming one chunk to fill what is left; ``max_docs`` is a hard cap on
+    the chunks sent, the budget only decides which ones fit.
+    When ``retrieval_queries`` are given they drive the search instead of
+    ``query``, which is then only meant for the LLM.
+    """
+    candidates_k = max_docs * OVERFETCH_FACTOR
+    if retrieval_queries:
+        candidates = multi_query_search(
+            docsearch, retrieval_queries, k=candidates_k, search_kwargs=search_kwargs
+        )
+    else:
+        candidates = docsearch.similarity_search_with_relevance_scores(
+            query, k=candidates_k, **(search_kwargs or {})
+        )
+    return pack_context(candidates, MAX_CONTEXT_TOKENS, max_docs=max_docs)
+
+
+def ask_question(
+    docsearch,
+    chain,
+    query: str,
+    max_docs: int = 5,
+    search_kwargs: Optional[dict] = None,
+    response_cache=None,
+    bypass_cache: bool = False,
+    retrieval_queries: Optional[List[str]] = None,
+    task: Optional[str] = None,
+    on_field: Optional[Callable[[str, Any], None]] = None,
+):
+    """Answer ``query`` from the best chunks of ``docsearch``.
+
+    With ``task``, the model is asked for the task's JSON schema and the
+    streamed answer is parsed as it arrives; ``on_field`` receives each
+    validated field as soon as it completes (cached answers are replayed
+    through the same parser). Use schemas.parse_result on the returned
+    text for the typed record.
+    """
+    if task is not None:
+        query = query + output_instructions(task)
+    try:
+        selected_docs = retrieve_documents(
+            docsearch, query, max_docs, search_kwargs, retrieval_queries
+        )
 
         if not selected_docs:
             return "Error: No suitable documents found within token limits."
 
-        return chain.run(input_documents=selected_docs, question=query)
+        # Identical query + context → identical answer; bypass still refreshes
+        cache_key = None
+        if response_cache is not None:
+            cache_key = response_cache.key_for(
+                QA_MODEL_NAME, QA_TEMPERATURE, query, selected_docs
+            )
+            if not bypass_cache:
+                cached = response_cache.get(cache_key)
+                if cached is not None:
+                    metrics.incr("llm_cache_hits")
+                    if task is not None and on_field is not None:
+                        for field, value in StreamingJSONParser(task).feed(cached):
+                            on_field(field, value)
+                    return cached
+
+        callbacks = [streaming_handler(task, on_field)] if task is not None else None
+        metrics.incr("llm_calls")
+        metrics.incr("tokens_sent", prompt_tokens(query, selected_docs))
+        with metrics.stage("llm"):
+            answer = chain.run(
+                input_documents=selected_docs, question=query, callbacks=callbacks
+            )
+        metrics.incr("tokens_received", count_tokens(answer))
+        if cache_key is not None:
+            response_cache.put(cache_key, answer)
+        return answer
 
     except Exception as e:
         if "token" in str(e).lower():
@@ -226,6 +423,26 @@ def ask_question(docsearch, chain, query: str, max_docs: int = 5):
 
 
 def main():
+    """Interactive run over one PDF.
+
+    Stage timings are printed at the end. FRE_METRICS and FRE_METRICS_PROM
+    name files for the JSON report and a Prometheus text dump;
+    FRE_PROFILE names a cProfile stats file for the whole run.
+    """
+    metrics.reset()
+    try:
+        with profiled(os.getenv("FRE_PROFILE")):
+            _run()
+    finally:
+        print(f"\nStage timings: {metrics.summary()}")
+        metrics.export(os.getenv("FRE_METRICS"), os.getenv("FRE_METRICS_PROM"))
+
+
+def _run():
+    from embedding_cache import CachedEmbeddings
+    from response_cache import ResponseCache
+    from vector_store import PersistentVectorStore
+
     api_key = load_environment()
 
     # Use a Saudi IPO prospectus
@@ -248,36 +465,102 @@ def main():
             print("\nExiting...")
             return
 
-    # Load the PDF and get a sample of text for language detection
-    reader = PdfReader(pdf_path)
-    sample_text = ""
-    for i, page in enumerate(reader.pages):
-        if i < 2:  # Check first two pages
-            sample_text += fix_arabic(page.extract_text())
-        else:
-            break
-
-    # Detect language
-    language = detect_language(sample_text)
-    print(f"\nDetected language: {language}")
+    # FRE_PREFILTER=1 ranks pages from the outline and content streams and
+    # extracts only the likely sections
+    cache = open_page_cache()
+    page_numbers = None
+    if os.getenv("FRE_PREFILTER"):
+        selection = select_pages(
+            pdf_path,
+            choice,
+            fallback=os.getenv("FRE_PREFILTER_FALLBACK", "full"),
+            cache=cache,
+        )
+        page_numbers = selection.pages
+        if page_numbers is not None:
+            print(f"Reading {len(page_numbers)} of {selection.page_count} pages")
+
+    # Load the pages once (or from the page cache) and sample them for language detection
+    pages = extract_pages(pdf_path, cache=cache, page_numbers=page_numbers)
+    # Detect language page by page, stopping as soon as it is clear
+    detector = detect_document_language(pages)
+    language = detector.language
+    print(
+        f"\nDetected language: {language} ({detector.confidence:.0%} of letters, "
+        f"{len(detector.pages)} pages checked)"
+    )
 
     # Select appropriate query based on choice and language
     query = get_query(language=language, task=choice)
 
-    docs = load_and_split_pdf(pdf_path, choice=choice)
-    print(f"Created {len(docs)} documents from PDF")
+    docs = None
+    if choice == "1":
+        # Revenue usually sits in a statement table next to the keyword hits;
+        # read it directly and only fall back to the LLM when unsure
+        docs = split_pages(pages, pdf_path, window_chars=1500, choice=choice)
+        result = extract_revenue(docs)
+        if result.confidence >= FAST_PATH_CONFIDENCE:
+            record = json.dumps(
+                to_result(result)._asdict(), indent=2, ensure_ascii=False
+            )
+            print(f"\nResults (read from tables):\n{record}")
+            return
+        print(f"Table extraction confidence {result.confidence:.2f}; asking the LLM")
+
+    embeddings = CachedEmbeddings(initialize_embeddings(api_key), embedding_model_key())
+    store = PersistentVectorStore(embeddings, embedding_model_key())
+    doc_key = store.document_key(
+        cache.key_for(pdf_path),
+        choice=choice,
+        window_chars=1500,
+        extractor=extractor_version(),
+        pages=page_numbers,
+    )
+
+    if doc_key in store:
+        print("Using cached vector index for this PDF")
+    else:
+        if docs is None:
+            docs = split_pages(pages, pdf_path, window_chars=1500, choice=choice)
+        print(f"Created {len(docs)} documents from PDF")
 
-    if not docs:
-        print("Error: No documents could be created from the PDF")
-        return
+        if not docs:
+            print("Error: No documents could be created from the PDF")
+            return
 
-    embeddings = initialize_embeddings(api_key)
-    docsearch = FAISS.from_documents(docs, embeddings)
+        store.add_documents(doc_key, docs)
+
+    # Fuse vector search with BM25 over this PDF's chunks
+    docsearch = HybridRetriever(
+        store.document_index(doc_key), store.documents(doc_key), embeddings=embeddings
+    )
     chain = initialize_qa_chain()
 
     print("\nProcessing your request...")
-    answer = ask_question(docsearch, chain, query)
-    print(f"\nResults:\n{answer}")
+
+    def show_field(field, value):
+        print(f"  {field}: {value}")
+
+    answer = ask_question(
+        docsearch,
+        chain,
+        query,
+        response_cache=ResponseCache(),
+        bypass_cache=bool(os.getenv("FRE_BYPASS_LLM_CACHE")),
+        retrieval_queries=get_retrieval_queries(language=language, task=choice),
+        task=choice,
+        on_field=show_field,
+    )
+    if answer.startswith("Error:"):
+        print(f"\n{answer}")
+    else:
+        result, errors = parse_result(choice, answer)
+        print(
+            f"\nResults:\n{json.dumps(result._asdict(), indent=2, ensure_ascii=False)}"
+        )
+        if errors:
+            print(f"Invalid fields: {errors}")
+    print(f"Embedding cache: {embeddings.stats()}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,79 @@
+import re
+from functools import lru_cache
+from typing import Dict, Iterator, List, Tuple
+
+# (category, lang, original phrase, processed phrase)
+KeywordEntry = Tuple[str, str, str, str]
+
+
+class KeywordMatcher:
+    """Find every keyword hit in a text with a single regex pass.
+
+    All phrases are compiled into one alternation (longest first), so the
+    regex engine walks the text once instead of once per keyword. Every
+    position the engine stops at is resolved against the phrases sharing
+    its first character, longest first, and the search resumes one
+    character later. Hits of different phrases that overlap ("revenue"
+    inside "total revenue") are therefore all reported, as a separate
+    ``re.finditer`` per keyword would report them. A phrase that overlaps
+    itself is not: "00" in "000" is reported at 0 and 1, where
+    ``re.finditer`` resumes after each match and only finds it at 0.
+    """
+
+    def __init__(self, entries: List[KeywordEntry]):
+        self.entries = [entry for entry in entries if entry[3]]
+
+        # processed phrase -> every (category, lang, original) that produced it
+        self._by_phrase: Dict[str, List[Tuple[str, str, str]]] = {}
+        for category, lang, original, processed in self.entries:
+            self._by_phrase.setdefault(processed, []).append((category, lang, original))
+
+        # first character -> candidate phrases, longest first
+        self._by_first_char: Dict[str, List[str]] = {}
+        for phrase in sorted(self._by_phrase, key=len, reverse=True):
+            self._by_first_char.setdefault(phrase[0], []).append(phrase)
+
+        if self._by_phrase:
+            alternation = "|".join(
+                re.escape(phrase)
+                for phrase in sorted(self._by_phrase, key=len, reverse=True)
+            )
+            self._pattern = re.compile(alternation)
+        else:
+            self._pattern = None
+
+    def finditer(self, text_lower: str) -> Iterator[Tuple[str, str, str, int, int]]:
+        """Yield ``(category, lang, keyword, start, end)`` for every hit.
+
+        Hits are produced in position order. ``text_lower`` must already be
+        normalized the same way as the processed keywords.
+        """
+        if self._pattern is None:
+            return
+        search = self._pattern.search
+        match = search(text_lower)
+        while match is not None:
+            pos = match.start()
+            for phrase in self._by_first_char[text_lower[pos]]:
+                if text_lower.startswith(phrase, pos):
+                    end = pos + len(phrase)
+                    for category, lang, original in self._by_phrase[phrase]:
+                        yield category, lang, original, pos, end
+            match = search(text_lower, pos + 1)
+
+    def find_all(self, text_lower: str) -> List[Tuple[str, str, str, int]]:
+        """Return ``(category, lang, keyword, position)`` tuples for all hits."""
+        return [
+            (category, lang, keyword, start)
+            for category, lang, keyword, start, _ in self.finditer(text_lower)
+        ]
+
+
+@lru_cache(maxsize=32)
+def _compile(entries: Tuple[KeywordEntry, ...]) -> KeywordMatcher:
+    return KeywordMatcher(list(entries))
+
+
+def get_matcher(entries: List[KeywordEntry]) -> KeywordMatcher:
+    """Return a compiled matcher for ``entries``, cached per keyword set."""
+    return _compile(tuple(entries))
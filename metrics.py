@@ -0,0 +1,257 @@
+import cProfile
+import functools
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_bytes(children: bool = False) -> Optional[int]:
+    """High-water resident set size of this process (or its reaped children)."""
+    if resource is None:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Metrics:
+    """Stage timings and counters for one run of the pipeline.
+
+    ``stage(name)`` times a block; the same name may be entered many times
+    and from many threads, and accumulates calls, total and slowest
+    seconds. After each stage the process's peak RSS is sampled, so the
+    report shows which stage raised the memory high-water mark. Stages
+    timed in worker processes come back as ``snapshot()`` dicts and are
+    folded in with ``merge()``; their seconds add up across workers, so
+    they can exceed the wall time of the enclosing stage.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started = time.time()
+            self._start = time.perf_counter()
+            self.stages: Dict[str, Dict[str, float]] = {}
+            self.counters: Dict[str, float] = {}
+            self.peak_rss: Dict[str, int] = {}
+
+    def observe(self, name: str, seconds: float) -> None:
+        """Record one timed call of stage ``name``."""
+        rss = peak_rss_bytes()
+        with self._lock:
+            stats = self.stages.setdefault(
+                name, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0}
+            )
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+            if rss is not None:
+                self.peak_rss[name] = max(self.peak_rss.get(name, 0), rss)
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def timed(self, name: Optional[str] = None):
+        """Decorator timing every call of a function as a stage."""
+
+        def decorate(fn):
+            stage_name = name or fn.__name__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.stage(stage_name):
+                    return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorate
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self) -> dict:
+        """Picklable copy of the stages and counters, for merge()."""
+        with self._lock:
+            return {
+                "stages": {name: dict(stats) for name, stats in self.stages.items()},
+                "counters": dict(self.counters),
+            }
+
+    def merge(self, snapshot: dict) -> None:
+        with self._lock:
+            for name, other in snapshot.get("stages", {}).items():
+                stats = self.stages.setdefault(
+                    name, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0}
+                )
+                stats["calls"] += other["calls"]
+                stats["seconds"] += other["seconds"]
+                stats["max_seconds"] = max(stats["max_seconds"], other["max_seconds"])
+            for name, value in snapshot.get("counters", {}).items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self, **extra) -> dict:
+        """The run as a JSON-serialisable dict; ``extra`` keys are added as is."""
+        with self._lock:
+            stages = {
+                name: {
+                    "calls": int(stats["calls"]),
+                    "seconds": round(stats["seconds"], 4),
+                    "max_seconds": round(stats["max_seconds"], 4),
+                    "peak_rss_mb": _mb(self.peak_rss.get(name)),
+                }
+                for name, stats in self.stages.items()
+            }
+            counters = dict(self.counters)
+        return {
+            "started": self.started,
+            "wall_seconds": round(time.perf_counter() - self._start, 4),
+            "peak_rss_mb": _mb(peak_rss_bytes()),
+            "children_peak_rss_mb": _mb(peak_rss_bytes(children=True)),
+            "stages": stages,
+            "counters": counters,
+            **extra,
+        }
+
+    def summary(self) -> str:
+        """One line of stage timings, slowest first."""
+        with self._lock:
+            stages = sorted(
+                self.stages.items(), key=lambda item: item[1]["seconds"], reverse=True
+            )
+        return ", ".join(f"{name} {stats['seconds']:.2f}s" for name, stats in stages)
+
+    def write_report(self, path: str, **extra) -> dict:
+        report = self.report(**extra)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        return report
+
+    def prometheus(self, prefix: str = "fre") -> str:
+        """The report in the Prometheus text exposition format."""
+        report = self.report()
+        lines = []
+        # Every sample of a metric follows its TYPE line, one metric at a time
+        for field, metric, kind in (
+            ("seconds", "stage_seconds_total", "counter"),
+            ("calls", "stage_calls_total", "counter"),
+            ("max_seconds", "stage_max_seconds", "gauge"),
+        ):
+            lines.append(f"# TYPE {prefix}_{metric} {kind}")
+            for name, stats in sorted(report["stages"].items()):
+                label = f'{{stage="{_escape(name)}"}}'
+                lines.append(f"{prefix}_{metric}{label} {stats[field]}")
+        for name, value in sorted(report["counters"].items()):
+            metric = f"{prefix}_{_metric_name(name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        rss = peak_rss_bytes()
+        if rss is not None:
+            lines.append(f"# TYPE {prefix}_peak_rss_bytes gauge")
+            lines.append(f"{prefix}_peak_rss_bytes {rss}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str, prefix: str = "fre") -> None:
+        # Written atomically so a node_exporter textfile collector never
+        # reads half a file
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus(prefix))
+        os.replace(tmp_path, path)
+
+    def export(
+        self,
+        report_path: Optional[str] = None,
+        prometheus_path: Optional[str] = None,
+        **extra,
+    ) -> None:
+        """Write whichever of the JSON report and Prometheus dump is requested."""
+        if report_path:
+            self.write_report(report_path, **extra)
+        if prometheus_path:
+            self.write_prometheus(prometheus_path)
+
+
+def _mb(value: Optional[int]) -> Optional[float]:
+    return None if value is None else round(value / 2**20, 1)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+class Profiler:
+    """cProfile over one or more threads, merged into a single stats file.
+
+    cProfile only sees the thread that enabled it, so each worker thread
+    runs its loop inside ``with profiler.thread():``; dump() merges them.
+    A profiler created with ``path=None`` does nothing.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._profiles = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def thread(self):
+        if self.path is None:
+            yield
+            return
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+
+    def dump(self) -> None:
+        """Write the merged stats (load them with ``pstats`` or snakeviz)."""
+        if self.path is None or not self._profiles:
+            return
+        with self._lock:
+            stats = pstats.Stats(self._profiles[0])
+            for profile in self._profiles[1:]:
+                stats.add(profile)
+        stats.dump_stats(self.path)
+
+
+@contextmanager
+def profiled(path: Optional[str]):
+    """Profile the calling thread for the duration of the block."""
+    profiler = Profiler(path)
+    try:
+        with profiler.thread():
+            yield profiler
+    finally:
+        profiler.dump()
+
+
+# Process-wide collector used by the pipeline modules
+metrics = Metrics()
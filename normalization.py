@@ -0,0 +1,184 @@
+import os
+import re
+import unicodedata
+from functools import lru_cache
+
+MODES = ("visual", "legacy")
+DEFAULT_MODE = "visual"
+
+# Harakat, superscript alef and Quranic marks carry no lexical meaning here
+ARABIC_MARKS = "".join(
+    chr(c) for c in list(range(0x064B, 0x0660)) + [0x0670] + list(range(0x06D6, 0x06EE))
+)
+TATWEEL = "ـ"
+ARABIC_INDIC_DIGITS = {chr(0x0660 + d): str(d) for d in range(10)}
+EXTENDED_DIGITS = {chr(0x06F0 + d): str(d) for d in range(10)}  # Persian
+
+
+def _presentation_forms():
+    folded = {}
+    for start, stop in ((0xFB50, 0xFDFF), (0xFE70, 0xFEFF)):
+        for code in range(start, stop + 1):
+            char = chr(code)
+            base = unicodedata.normalize("NFKC", char)
+            if base != char:
+                folded[char] = base
+    return folded
+
+
+# Presentation forms back to base letters (the lam-alef ligatures become two
+# letters), marks and tatweel dropped, Arabic-Indic digits to ASCII
+FOLD_TABLE = str.maketrans(
+    {
+        **_presentation_forms(),
+        **{mark: None for mark in ARABIC_MARKS},
+        TATWEEL: None,
+        **ARABIC_INDIC_DIGITS,
+        **EXTENDED_DIGITS,
+    }
+)
+
+# Applied after NFKC by retrieval.fold_text: marks, tatweel and digits as in
+# FOLD_TABLE, plus the spelling variants search should not distinguish
+SEARCH_FOLD_TABLE = str.maketrans(
+    {
+        **{mark: None for mark in ARABIC_MARKS},
+        TATWEEL: None,
+        "أ": "ا",
+        "إ": "ا",
+        "آ": "ا",
+        "ٱ": "ا",
+        "ى": "ي",
+        "ة": "ه",
+        **ARABIC_INDIC_DIGITS,
+        **EXTENDED_DIGITS,
+    }
+)
+
+_RTL = re.compile("[֐-ࣿיִ-﷿ﹰ-﻿]")
+# Reshaping turns lam + alef, and the unjoined word Allah, into single
+# glyphs that bidi then moves as a unit; stand-in ligatures keep that order
+# without reshaping everything. Leftmost match wins, as in arabic_reshaper.
+_LIGATURE_RE = re.compile("(الله)|ل([اأإآ])")
+_LAM_ALEF = {"ا": "ﻻ", "أ": "ﻷ", "إ": "ﻹ", "آ": "ﻵ"}
+_ALLAH = "ﷲ"
+
+
+def _joining_sets():
+    from arabic_reshaper import default_reshaper
+
+    letters = default_reshaper.letters
+    joins_next = {c for c, forms in letters.items() if forms[1] or forms[2]}
+    joins_previous = {c for c, forms in letters.items() if forms[2] or forms[3]}
+    return frozenset(joins_next), frozenset(joins_previous)
+
+
+_JOINS_NEXT, _JOINS_PREVIOUS = _joining_sets()
+
+
+def _ligature(match) -> str:
+    if match.group(2):
+        return _LAM_ALEF[match.group(2)]
+    # The Allah ligature only has an isolated form
+    text, start, end = match.string, match.start(), match.end()
+    joined = (start and text[start - 1] in _JOINS_NEXT) or (
+        end < len(text) and text[end] in _JOINS_PREVIOUS
+    )
+    return match.group() if joined else _ALLAH
+
+
+def fold(text: str) -> str:
+    """Base letters, no marks or tatweel, ASCII digits."""
+    return text.translate(FOLD_TABLE)
+
+
+_STRONG = ("L", "R", "AL")
+# Invisible stand-ins for the last strong character of the previous lines
+# (private use is L; U+0800 and U+08A0 are unused R and AL letters here)
+_CONTEXT_MARKS = {"L": "\ue000", "R": "\u0800", "AL": "\u08a0"}
+
+
+def _first_strong(text: str):
+    for char in text:
+        kind = unicodedata.bidirectional(char)
+        if kind in _STRONG:
+            return kind
+    return None
+
+
+def _last_strong(text: str):
+    return _first_strong(reversed(text))
+
+
+@lru_cache(maxsize=65536)
+def _reorder_line(line: str, base_dir: str, context) -> str:
+    from bidi.algorithm import get_display
+
+    protected = _LIGATURE_RE.sub(_ligature, line)
+    if context is None:
+        return get_display(protected, base_dir=base_dir).translate(FOLD_TABLE)
+    mark = _CONTEXT_MARKS[context]
+    display = get_display(mark + protected, base_dir=base_dir)
+    return display.replace(mark, "").translate(FOLD_TABLE)
+
+
+def visual_order(text: str) -> str:
+    """Display-order text with base letters, without reshaping.
+
+    Produces ``fold(legacy_fix(text))``. Text with no right-to-left
+    characters is only folded. Otherwise python-bidi's whole-page pass is
+    replayed line by line: the base direction comes from the page's first
+    strong character, and each line is prefixed with a marker standing
+    for the last strong character before it, because digits resolve
+    against that context. Each distinct (line, direction, context) is
+    reordered once; headers, footers and table labels repeat across pages
+    and hit the cache.
+    """
+    if not _RTL.search(text):
+        return text.translate(FOLD_TABLE)
+    base_dir = "R" if _first_strong(text) in ("R", "AL") else "L"
+    lines = []
+    context = None
+    for line in text.split("\n"):
+        lines.append(_reorder_line(line, base_dir, context))
+        context = _last_strong(line) or context
+    return "\n".join(lines)
+
+
+def legacy_fix(text: str) -> str:
+    """The original per-page fix-up: reshape into presentation forms, then bidi."""
+    import arabic_reshaper
+    from bidi.algorithm import get_display
+
+    return get_display(arabic_reshaper.reshape(text))
+
+
+def current_mode() -> str:
+    """Normalization mode from FRE_TEXT_MODE ("visual" unless set)."""
+    mode = os.getenv("FRE_TEXT_MODE", DEFAULT_MODE)
+    if mode not in MODES:
+        raise ValueError(f"FRE_TEXT_MODE must be one of {MODES}, got {mode!r}")
+    return mode
+
+
+def normalize_text(text: str, mode: str = None) -> str:
+    """Fix up extracted PDF text (or a keyword) for display-order matching.
+
+    Args:
+        text: Text as extracted by PyPDF2 (logical order)
+        mode: "visual" (folded base letters, cached run-level reorder) or
+            "legacy" (arabic_reshaper + python-bidi, presentation forms);
+            defaults to current_mode()
+
+    Returns:
+        Text in display order; both modes produce the same order and fold
+        to the same string
+    """
+    if not text:
+        return ""
+    mode = mode or current_mode()
+    if mode == "legacy":
+        return legacy_fix(text)
+    if mode == "visual":
+        return visual_order(text)
+    raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
@@ -0,0 +1,396 @@
+import re
+from bisect import bisect_right
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from metrics import metrics
+from retrieval import fold_text
+from schemas import RevenueResult
+
+# Below this confidence the revenue task falls back to the LLM
+FAST_PATH_CONFIDENCE = 0.75
+# Without a unit header a reading may be off by 1,000x, so it stays below
+# FAST_PATH_CONFIDENCE however many chunks agree
+UNSCALED_CONFIDENCE = 0.7
+
+
+def _visual(word: str) -> str:
+    # The lam-alef ligature is a single glyph, so it keeps its inner order
+    # when a word is reversed for display
+    return "لا".join(part[::-1] for part in word.split("لا")[::-1])
+
+
+def _both_directions(words):
+    # Page text is in visual order, so Arabic words can appear reversed
+    return sorted({w for word in words for w in (word, _visual(word))}, key=len)[::-1]
+
+
+_REVENUE_WORDS = _both_directions(
+    [
+        "total revenue",
+        "revenues",
+        "revenue",
+        "net sales",
+        "sales",
+        "turnover",
+        # Folded forms (alef variants unified) of the Arabic labels
+        "اجمالي الايرادات",
+        "الايرادات",
+        "ايرادات",
+        "المبيعات",
+        "مبيعات",
+    ]
+)
+_EXCLUDE_WORDS = _both_directions(
+    ["cost of", "تكلفه", "تكاليف", "other revenue", "ايرادات اخرى"]
+)
+_STRONG_WORDS = _both_directions(["total", "اجمالي"])
+# Table headings of figures that belong to another company
+_OTHER_ENTITY_WORDS = _both_directions(
+    [
+        "associate",
+        "joint venture",
+        "summarized financial information",
+        "summarised financial information",
+        "شركه زميله",
+        "شركات زميله",
+        "مشروع مشترك",
+        "مشاريع مشتركه",
+    ]
+)
+_REVENUE_RE = re.compile("|".join(re.escape(w) for w in _REVENUE_WORDS))
+_EXCLUDE_RE = re.compile("|".join(re.escape(w) for w in _EXCLUDE_WORDS))
+_OTHER_ENTITY_RE = re.compile("|".join(re.escape(w) for w in _OTHER_ENTITY_WORDS))
+# Title lines (unit, currency, table name) read above a year header
+HEADING_LINES = 3
+
+_SCALES = [
+    (
+        1_000_000_000,
+        _both_directions(["billion", "billions", "bn", "مليار", "مليارات"]),
+    ),
+    (1_000_000, _both_directions(["million", "millions", "mn", "مليون", "ملايين"])),
+    (
+        1_000,
+        _both_directions(
+            [
+                "thousand",
+                "thousands",
+                "'000",
+                "'000s",
+                "000s",
+                "(000)",
+                "الف",
+                "بالالاف",
+                "الاف",
+            ]
+        ),
+    ),
+]
+_CURRENCIES = [
+    ("SAR", _both_directions(["sar", "sr", "ريال", "لاير", "ر.س"])),
+    ("USD", _both_directions(["usd", "us$", "دولار"])),
+    ("EUR", _both_directions(["eur", "euro", "يورو"])),
+    ("CHF", _both_directions(["chf"])),
+    ("AED", _both_directions(["aed", "درهم"])),
+]
+_CURRENCY_RE = [
+    (code, re.compile(r"(?<!\w)(?:%s)(?!\w)" % "|".join(re.escape(w) for w in words)))
+    for code, words in _CURRENCIES
+]
+# A unit may follow the currency directly, as in SAR'000
+_SCALE_PREFIX = "|".join(
+    ["(?<!\\w)"] + [f"(?<={re.escape(w)})" for _, words in _CURRENCIES for w in words]
+)
+_SCALE_RE = [
+    (
+        factor,
+        re.compile(
+            r"(?:%s)(?:%s)(?!\w)"
+            % (_SCALE_PREFIX, "|".join(re.escape(w) for w in words))
+        ),
+    )
+    for factor, words in _SCALES
+]
+
+_ARABIC_LETTER = re.compile("[\u0600-\u06ff]")
+# Arabic thousands and decimal separators, as in ١٬٢٣٤٫٥
+_SEPARATORS = str.maketrans({"\u066c": ",", "\u066b": "."})
+# Reordering splits grouped digits in RTL lines: 12,345,678 -> "678, 12,345"
+_SPLIT_GROUPS = re.compile(r"(?<![\d,])(\d{3}),\s+(\d{1,3}(?:,\d{3})+)(?![\d,])")
+_YEAR_RE = re.compile(r"(?<![\d,.])(19[89]\d|20[0-4]\d)(?![\d,])")
+# (1,234.5) or )1,234.5( -- bidi reordering can mirror the parentheses
+_AMOUNT_RE = re.compile(
+    r"(?P<open>[()])?\s?(?P<sign>-)?"
+    r"(?P<number>\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+\.\d+|\d{4,})"
+    r"\s?(?P<close>[()])?"
+)
+
+
+class RevenueExtraction(NamedTuple):
+    revenue: Optional[float]
+    currency: Optional[str]
+    period: Optional[str]
+    comparative_period: Optional[str]
+    comparative_revenue: Optional[float]
+    values: Dict[str, float]
+    source_text: str
+    page: Optional[int]
+    confidence: float
+    method: Optional[str]
+
+
+EMPTY_RESULT = RevenueExtraction(None, None, None, None, None, {}, "", None, 0.0, None)
+
+
+def _is_rtl(line: str) -> bool:
+    return bool(_ARABIC_LETTER.search(line))
+
+
+def _years(line: str) -> List[str]:
+    """Years in ``line``, left to right as displayed."""
+    return [m.group(1) for m in _YEAR_RE.finditer(line)]
+
+
+def _amounts(line: str, rtl: Optional[bool] = None) -> List[Tuple[float, int]]:
+    """``(value, position)`` for every monetary-looking number in ``line``.
+
+    Returned left to right as displayed, like _years(), so a header and the
+    rows below it line up column by column whatever the table direction.
+    ``rtl`` (default: the line has Arabic letters) undoes the digit group
+    splitting bidi reordering causes in right-to-left rows.
+    """
+    if _is_rtl(line) if rtl is None else rtl:
+        line = _SPLIT_GROUPS.sub(lambda m: f"{m.group(2)},{m.group(1)}", line)
+    found = []
+    for match in _AMOUNT_RE.finditer(line):
+        number = match.group("number")
+        around = line[max(0, match.start() - 2) : match.end() + 2]
+        if _YEAR_RE.fullmatch(number) or "%" in around:
+            continue
+        value = float(number.replace(",", ""))
+        if match.group("sign") or (match.group("open") and match.group("close")):
+            value = -value
+        found.append((value, match.start("number")))
+    return found
+
+
+def _nearest(patterns, text: str, position: int):
+    """Label of the pattern occurring closest before ``position`` (or after)."""
+    best = None
+    for label, pattern in patterns:
+        for match in pattern.finditer(text):
+            distance = position - match.start()
+            # Prefer headers above the row over mentions further down
+            rank = distance if distance >= 0 else len(text) - distance
+            if best is None or rank < best[0]:
+                best = (rank, label)
+    return best[1] if best else None
+
+
+def _heading(lines: List[str], header_line: int) -> str:
+    """A table's year header plus the title lines directly above it.
+
+    Stops at the rows of the previous table, so units and table names
+    printed elsewhere in the chunk never apply.
+    """
+    block = [lines[header_line]]
+    for line in reversed(lines[max(0, header_line - HEADING_LINES) : header_line]):
+        if _amounts(line):
+            break
+        block.insert(0, line)
+    return "\n".join(block)
+
+
+def _table_candidate(
+    line: str, years: List[str], rtl: bool
+) -> Optional[Dict[str, float]]:
+    amounts = [value for value, _ in _amounts(line, rtl)]
+    if len(amounts) < len(years):
+        return None
+    # Drop note references and similar small leading/trailing integers
+    if len(amounts) > len(years):
+        amounts = [a for a in amounts if abs(a) >= 100] or amounts
+    if len(amounts) != len(years):
+        return None
+    return dict(zip(years, amounts))
+
+
+def _prose_candidate(line: str) -> Dict[str, float]:
+    years = [(m.group(1), m.start()) for m in _YEAR_RE.finditer(line)]
+    if not years:
+        return {}
+    values = {}
+    for value, position in _amounts(line):
+        year = min(years, key=lambda item: abs(item[1] - position))[0]
+        values.setdefault(year, value)
+    return values
+
+
+def _offsets(lines: List[str]) -> List[int]:
+    offsets = []
+    position = 0
+    for line in lines:
+        offsets.append(position)
+        position += len(line) + 1
+    return offsets
+
+
+def _page_at(doc, position: int) -> Optional[int]:
+    """Page holding character ``position`` of the chunk text."""
+    starts = doc.metadata.get("page_starts")
+    if not starts:
+        return doc.metadata.get("page")
+    index = bisect_right([offset for offset, _ in starts], position) - 1
+    return starts[max(0, index)][1]
+
+
+def _candidates(doc) -> List[dict]:
+    raw_lines = doc.page_content.split("\n")
+    raw_offsets = _offsets(raw_lines)
+    text = fold_text(doc.page_content.translate(_SEPARATORS))
+    lines = text.split("\n")
+    offsets = _offsets(lines)
+
+    # Column headers may be on one line or split one year per line
+    header: List[str] = []
+    header_line = 0
+    stacked = False
+    collecting = False
+    found = []
+    for i, line in enumerate(lines):
+        has_amounts = bool(_amounts(line))
+        if not has_amounts:
+            years = _years(line)
+            if years:
+                if not collecting:
+                    header_line = i
+                stacked = collecting
+                header = header + years if collecting else years
+                collecting = True
+            continue
+        if collecting:
+            header = list(dict.fromkeys(header))
+            collecting = False
+        if not _REVENUE_RE.search(line) or _EXCLUDE_RE.search(line):
+            continue
+
+        # The labelled row sets the table direction: a digits-only header
+        # line carries none of its own
+        rtl = _is_rtl(line)
+        method = None
+        values = None
+        # Units come from the row itself or its own table's heading only
+        heading = line
+        if len(header) >= 2:
+            heading = _heading(lines, header_line)
+            if _OTHER_ENTITY_RE.search(heading):
+                continue
+            # A header split one year per line lists the years in reading
+            # order, right to left for an Arabic table
+            columns = header[::-1] if stacked and rtl else header
+            values = _table_candidate(line, columns, rtl)
+            method = "table" if values else None
+        if not values:
+            heading = line
+            values = _prose_candidate(line)
+            method = "prose" if values else None
+        if not values:
+            continue
+
+        found.append(
+            {
+                "values": values,
+                "method": method,
+                "scale": _nearest(_SCALE_RE, heading, len(heading)) or 1,
+                "currency": _nearest(_CURRENCY_RE, heading, len(heading))
+                or _nearest(_CURRENCY_RE, text, offsets[i]),
+                "source_text": (raw_lines[i] if i < len(raw_lines) else line).strip(),
+                "page": _page_at(doc, raw_offsets[min(i, len(raw_offsets) - 1)]),
+                "strong": any(word in line for word in _STRONG_WORDS),
+            }
+        )
+    return found
+
+
+def _score(candidate: dict, agreement: int) -> float:
+    latest = candidate["values"][max(candidate["values"])]
+    score = 0.4 if candidate["method"] == "table" else 0.2
+    score += 0.1 if candidate["strong"] else 0.05
+    score += 0.15 if candidate["currency"] else 0.0
+    score += 0.05 if candidate["scale"] != 1 else 0.0
+    score += 0.1 if len(candidate["values"]) >= 2 else 0.0
+    # Other chunks reading the same figure
+    score += min(0.2, 0.1 * (agreement - 1))
+    if latest <= 0:
+        score -= 0.3
+    if candidate["scale"] == 1:
+        score = min(score, UNSCALED_CONFIDENCE)
+    return max(0.0, min(1.0, round(score, 3)))
+
+
+@metrics.timed("numeric_extract")
+def extract_revenue(documents: Sequence) -> RevenueExtraction:
+    """Deterministically read the latest revenue figure from keyword chunks.
+
+    Rows around revenue keywords are parsed into a year -> value map, either
+    from an income-statement style table (a header line of years followed
+    by labelled rows) or from prose pairing each amount with the nearest
+    year. Arabic-Indic digits and separators, parenthesised negatives and
+    "billion"/"million"/"thousand" units are handled; a unit only applies
+    when it is on the row or in the title lines directly above its table's
+    year header, and tables headed as another entity's figures
+    (associates, joint ventures) are skipped. Page text is in
+    display order, so header years and row amounts are both paired left
+    to right as displayed, for Arabic and English tables alike.
+
+    Args:
+        documents: Chunks produced by split_pages / load_and_split_pdf
+
+    Returns:
+        The most credible reading with a confidence in [0, 1]; callers
+        should only trust it above FAST_PATH_CONFIDENCE
+    """
+    candidates = [c for doc in documents for c in _candidates(doc)]
+    if not candidates:
+        return EMPTY_RESULT
+
+    def latest(candidate):
+        year = max(candidate["values"])
+        return year, candidate["values"][year] * candidate["scale"]
+
+    agreement = Counter(latest(c) for c in candidates)
+    best = max(
+        candidates,
+        key=lambda c: (_score(c, agreement[latest(c)]), latest(c)[0]),
+    )
+
+    values = {year: value * best["scale"] for year, value in best["values"].items()}
+    years = sorted(values, reverse=True)
+    return RevenueExtraction(
+        revenue=values[years[0]],
+        currency=best["currency"],
+        period=years[0],
+        comparative_period=years[1] if len(years) > 1 else None,
+        comparative_revenue=values[years[1]] if len(years) > 1 else None,
+        values=values,
+        source_text=best["source_text"],
+        page=best["page"],
+        confidence=_score(best, agreement[latest(best)]),
+        method=best["method"],
+    )
+
+
+def to_result(extraction: RevenueExtraction) -> RevenueResult:
+    """The fast-path reading in the same shape as a parsed LLM answer."""
+    comparative = None
+    if extraction.comparative_period is not None:
+        comparative = {extraction.comparative_period: extraction.comparative_revenue}
+    return RevenueResult(
+        revenue=extraction.revenue,
+        currency=extraction.currency,
+        period=extraction.period,
+        source_text=extraction.source_text or None,
+        location=f"page {extraction.page}" if extraction.page else None,
+        comparative_period=comparative,
+    )
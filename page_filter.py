@@ -0,0 +1,427 @@
+import json
+import os
+import re
+import unicodedata
+from collections import defaultdict
+from statistics import median
+from typing import Dict, List, NamedTuple, Optional
+
+from PyPDF2 import PdfReader
+from PyPDF2.generic import IndirectObject
+
+try:
+    # Private helper behind extract_text(); not part of PyPDF2's API
+    from PyPDF2._cmap import build_char_map
+except ImportError:  # pages are sampled with extract_text() instead
+    build_char_map = None
+
+from keyword_registry import outline_keyword_set, stream_form, stream_keyword_set
+from metrics import metrics
+from normalization import fold
+from text_cache import PageTextCache
+
+FALLBACKS = ("full", "head")
+
+# Bump whenever the page scoring changes so saved selections are rebuilt
+SELECTION_VERSION = "2"
+
+# One content-stream token: dictionary delimiters, hex string, literal
+# string, name, array delimiter or operator. Numbers (most of a page's
+# drawing) are never needed and are skipped by the regex engine.
+_TOKEN = re.compile(
+    rb"(<<|>>)|<([0-9A-Fa-f\s]*)>|\(((?:\\.|[^\\)])*)\)|/([^\s/\[\]()<>{}%]*)"
+    rb"|([\[\]])|([A-Za-z'\"*][A-Za-z0-9*]*)"
+)
+_ESCAPE = re.compile(rb"\\([0-7]{1,3}|\r\n|.)", re.DOTALL)
+_ESCAPES = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b", b"f": b"\f"}
+_INLINE_IMAGE_END = re.compile(rb"\sEI(?=\s|$)")
+_SHOW_TEXT = {b"Tj", b"TJ", b"'", b'"'}
+# Nested form XObjects followed when sampling a page
+_MAX_FORM_DEPTH = 3
+# Pages after an outline entry that inherit (a decaying share of) its score
+_SECTION_SPAN = 10
+_SECTION_DECAY = 0.95
+
+
+class PageSelection(NamedTuple):
+    # 0-based page indices to extract, sorted; None means every page
+    pages: Optional[List[int]]
+    page_count: int
+    scores: Dict[int, float]
+    reason: str
+
+
+def _outline_entries(reader: PdfReader):
+    """``(title, 0-based page)`` for every bookmark, nested ones included."""
+    try:
+        outline = reader.outline
+    except Exception:
+        return []
+    entries = []
+    stack = [outline]
+    while stack:
+        for item in stack.pop():
+            if isinstance(item, list):
+                stack.append(item)
+                continue
+            try:
+                page = reader.get_destination_page_number(item)
+            except Exception:
+                continue
+            if page is not None and page >= 0:
+                entries.append((str(item.title), page))
+    return entries
+
+
+def _match_weight(keywords, text: str) -> float:
+    text = unicodedata.normalize("NFC", text).lower()
+    return sum(
+        keywords.weights[(category, lang, phrase)]
+        for category, lang, phrase, _, _ in keywords.matcher.finditer(text)
+    )
+
+
+def _outline_scores(reader: PdfReader, keywords, page_count: int) -> Dict[int, float]:
+    entries = _outline_entries(reader)
+    starts = sorted({page for _, page in entries})
+    scores: Dict[int, float] = defaultdict(float)
+    for title, page in entries:
+        weight = _match_weight(keywords, title)
+        if not weight:
+            continue
+        # The section runs until the next bookmarked page
+        following = [start for start in starts if start > page]
+        end = min(following[0] if following else page_count, page + _SECTION_SPAN)
+        for offset, target in enumerate(range(page, max(end, page + 1))):
+            scores[target] += weight * _SECTION_DECAY**offset
+    return scores
+
+
+def _unescape(match) -> bytes:
+    escaped = match.group(1)
+    if escaped[:1].isdigit():
+        return bytes((int(escaped, 8) & 0xFF,))
+    if escaped in (b"\n", b"\r\n", b"\r"):
+        return b""
+    return _ESCAPES.get(escaped, escaped)
+
+
+def _resources(obj):
+    # /Resources can be inherited from the page tree
+    while obj is not None:
+        if "/Resources" in obj:
+            return obj["/Resources"].get_object()
+        obj = obj.get("/Parent")
+        obj = obj.get_object() if obj is not None else None
+    return None
+
+
+def _shared_key(kind: str, ref):
+    return kind, ref.idnum if isinstance(ref, IndirectObject) else id(ref)
+
+
+def _font_map(shared: dict, resources, name: str):
+    """``(encoding, ToUnicode map)`` of font ``name``, built once per font.
+
+    ``shared`` lives as long as the document, so fonts used on many pages
+    are only parsed the first time.
+    """
+    try:
+        ref = resources["/Font"].raw_get(name)
+    except (KeyError, TypeError, AttributeError):
+        return None
+    key = _shared_key("font", ref)
+    if key not in shared:
+        if build_char_map is None:
+            return None
+        try:
+            _, _, encoding, char_map, _ = build_char_map(
+                name, 200.0, {"/Resources": resources}
+            )
+            shared[key] = (encoding, char_map)
+        except Exception:
+            shared[key] = None
+    return shared[key]
+
+
+def _decode(raw: bytes, font) -> str:
+    """Unicode text of a shown string, decoded as PyPDF2's extract_text does."""
+    encoding, char_map = font
+    if isinstance(encoding, str):
+        try:
+            text = raw.decode(encoding, "surrogatepass")
+        except Exception:
+            alternative = "utf-16-be" if encoding == "charmap" else "charmap"
+            text = raw.decode(alternative, "surrogatepass")
+    else:
+        text = "".join(encoding.get(byte) or chr(byte) for byte in raw)
+    return "".join(char_map.get(char, char) for char in text)
+
+
+def _stream_text(data: bytes, resources, shared: dict, depth: int = 0):
+    """Text drawn by a content stream, and its text-operator count.
+
+    Decoding the strings through each font's ToUnicode map and concatenating
+    them is far cheaper than extract_text(), which also tracks positions to
+    place spaces and line breaks. The glyphs come out in drawing (display)
+    order with arbitrary breaks, so the text is only good for matching in
+    keyword_registry.stream_form.
+    """
+    parts = []
+    operators = 0
+    operands = []
+    arrays = []
+    dict_depth = 0
+    font = None
+    saved_fonts = []
+    position = 0
+    while True:
+        match = _TOKEN.search(data, position)
+        if match is None:
+            break
+        position = match.end()
+        delimiter, hex_string, literal, name, bracket, operator = match.groups()
+        if delimiter is not None:
+            dict_depth += 1 if delimiter == b"<<" else -1
+        elif dict_depth > 0:
+            # Marked-content properties, not drawn text
+            continue
+        elif hex_string is not None:
+            digits = re.sub(rb"\s", b"", hex_string)
+            if len(digits) % 2:
+                digits += b"0"
+            (arrays[-1] if arrays else operands).append(bytes.fromhex(digits.decode()))
+        elif literal is not None:
+            (arrays[-1] if arrays else operands).append(_ESCAPE.sub(_unescape, literal))
+        elif name is not None:
+            operands.append(name.decode("latin-1"))
+        elif bracket is not None:
+            if bracket == b"[":
+                arrays.append([])
+            elif arrays:
+                array = arrays.pop()
+                (arrays[-1] if arrays else operands).append(array)
+        else:
+            if operator in _SHOW_TEXT:
+                operators += 1
+                if font is not None and operands:
+                    shown = operands[-1]
+                    for raw in shown if isinstance(shown, list) else [shown]:
+                        if isinstance(raw, bytes):
+                            parts.append(_decode(raw, font))
+            elif operator == b"Tf" and operands:
+                font = _font_map(shared, resources, "/" + str(operands[-1]))
+            elif operator == b"q":
+                saved_fonts.append(font)
+            elif operator == b"Q":
+                if saved_fonts:
+                    font = saved_fonts.pop()
+            elif operator == b"Do" and operands and depth < _MAX_FORM_DEPTH:
+                text, count = _form_text(
+                    resources, "/" + str(operands[-1]), shared, depth
+                )
+                parts.append(text)
+                operators += count
+            elif operator == b"BI":
+                # Skip the inline image's binary data
+                end = _INLINE_IMAGE_END.search(data, position)
+                position = end.end() if end else len(data)
+            operands = []
+            arrays = []
+    return "".join(parts), operators
+
+
+def _form_text(resources, name: str, shared: dict, depth: int):
+    """Text drawn by a form XObject, decoded once per document.
+
+    Forms without fonts of their own (logos, rules, charts) are skipped
+    unread.
+    """
+    try:
+        ref = resources["/XObject"].raw_get(name)
+    except (KeyError, TypeError, AttributeError):
+        return "", 0
+    key = _shared_key("form", ref)
+    if key not in shared:
+        shared[key] = "", 0
+        try:
+            form = ref.get_object()
+            form_resources = form.get("/Resources")
+            form_resources = (
+                resources if form_resources is None else form_resources.get_object()
+            )
+            if form.get("/Subtype") == "/Form" and "/Font" in form_resources:
+                shared[key] = _stream_text(
+                    form.get_data(), form_resources, shared, depth + 1
+                )
+        except Exception:
+            pass
+    return shared[key]
+
+
+def _stream_sample(page, shared: dict):
+    """Text-operator count and decoded text of a page's content stream."""
+    try:
+        contents = page["/Contents"].get_object() if "/Contents" in page else None
+        if contents is None:
+            return 0, ""
+        if isinstance(contents, list):
+            # Several streams drawn as one
+            data = b"\n".join(part.get_object().get_data() for part in contents)
+        else:
+            data = contents.get_data()
+    except Exception:
+        return 0, ""
+    text, operators = _stream_text(data, _resources(page) or {}, shared)
+    if build_char_map is None:
+        # Fonts cannot be decoded here: extract the (logical order) text
+        # and bring it into the stream keywords' display order
+        try:
+            text = stream_form(page.extract_text())
+        except Exception:
+            text = ""
+    return operators, text
+
+
+def _stream_hits(keywords, text: str):
+    """Summed keyword weight of a page sample, and whether a task keyword hit.
+
+    Section-title words ("financial statements") recur all through a
+    report and only rank pages; a task keyword hit means the page must be
+    kept.
+    """
+    text = "".join(fold(unicodedata.normalize("NFC", text)).lower().split())
+    weight = 0.0
+    required = False
+    for category, lang, phrase, _, _ in keywords.matcher.finditer(text):
+        weight += keywords.weights[(category, lang, phrase)]
+        required = required or category.startswith("text:")
+    return weight, required
+
+
+def _load_selection(path: str, params: str) -> Optional[PageSelection]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            saved = json.load(f)[params]
+    except (FileNotFoundError, KeyError, ValueError):
+        return None
+    # Keeps the selections as recent as their page cache entry
+    os.utime(path)
+    scores = {int(index): score for index, score in saved["scores"].items()}
+    return PageSelection(saved["pages"], saved["page_count"], scores, saved["reason"])
+
+
+def _save_selection(path: str, params: str, selection: PageSelection) -> None:
+    try:
+        with open(path, encoding="utf-8") as f:
+            saved = json.load(f)
+    except (FileNotFoundError, ValueError):
+        saved = {}
+    saved[params] = selection._asdict()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(saved, f)
+    os.replace(tmp_path, path)
+
+
+@metrics.timed("prefilter")
+def select_pages(
+    pdf_path: str,
+    task: str,
+    top_n: int = 16,
+    neighbors: int = 1,
+    fallback: str = "full",
+    cache: Optional[PageTextCache] = None,
+) -> PageSelection:
+    """Pick the pages worth extracting before running the full extraction.
+
+    Pages are scored from bookmark titles matching the task's section
+    keywords (each hit also covers the following pages of its section) and
+    from keyword hits in the text of each page's content stream, decoded
+    through the fonts' ToUnicode maps without laying it out. Every page
+    whose content stream holds a task keyword is kept, plus the ``top_n``
+    best pages, each with ``neighbors`` pages on either side;
+    text-operator density breaks ties, so table-heavy pages win.
+    benchmarks/check_prefilter.py checks that no page a full scan finds a
+    keyword on is dropped. PyPDF2 versions without the private font helper
+    this relies on sample pages with extract_text() instead, which finds
+    the same pages several times slower.
+
+    With a page text ``cache``, a PDF whose full text is cached is read in
+    full (no ranking needed), and selections are saved next to the cached
+    pages under the PDF's content hash, so warm runs skip the
+    content-stream scan.
+
+    Args:
+        pdf_path: Path to the PDF file
+        task: '1' for revenue, '2' for IPO
+        top_n: Number of best-scoring pages to keep
+        neighbors: Pages kept on each side of a selected page
+        fallback: What to extract when nothing scores: "full" (every
+            page) or "head" (the first ``top_n`` pages)
+        cache: Optional page text cache shared with extract_pages
+
+    Returns:
+        The selection; ``pages`` is None when every page should be read
+    """
+    if fallback not in FALLBACKS:
+        raise ValueError(f"fallback must be one of {FALLBACKS}, got {fallback!r}")
+
+    saved_path = params = None
+    if cache is not None:
+        key = cache.key_for(pdf_path)
+        pages = cache.get(key)
+        if pages is not None:
+            return PageSelection(None, len(pages), {}, "cached")
+        saved_path = cache.sidecar_path(key, "selections")
+        params = f"{SELECTION_VERSION}:{task}:{top_n}:{neighbors}:{fallback}"
+        selection = _load_selection(saved_path, params)
+        if selection is not None:
+            return selection
+
+    selection = _select(pdf_path, task, top_n, neighbors, fallback)
+    if saved_path is not None:
+        _save_selection(saved_path, params, selection)
+        cache.evict()
+    return selection
+
+
+def _select(pdf_path, task, top_n, neighbors, fallback) -> PageSelection:
+    reader = PdfReader(pdf_path)
+    page_count = len(reader.pages)
+    if page_count <= top_n + 2 * neighbors * top_n:
+        return PageSelection(None, page_count, {}, "small")
+
+    scores = _outline_scores(reader, outline_keyword_set(task), page_count)
+    keywords = stream_keyword_set(task)
+    shared = {}
+    density = []
+    hit_pages = []
+    for index, page in enumerate(reader.pages):
+        operators, sample = _stream_sample(page, shared)
+        density.append(operators)
+        if sample:
+            weight, required = _stream_hits(keywords, sample)
+            if weight:
+                scores[index] += weight
+            if required:
+                hit_pages.append(index)
+
+    if not scores:
+        if fallback == "full":
+            return PageSelection(None, page_count, {}, "fallback-full")
+        head = list(range(min(top_n, page_count)))
+        return PageSelection(head, page_count, {}, "fallback-head")
+
+    typical = median(density) or 1
+    ranked = sorted(
+        scores,
+        key=lambda index: (scores[index], density[index] / typical),
+        reverse=True,
+    )
+    selected = set()
+    for index in set(ranked[:top_n]) | set(hit_pages):
+        selected.update(
+            range(max(0, index - neighbors), min(page_count, index + neighbors + 1))
+        )
+    return PageSelection(sorted(selected), page_count, dict(scores), "scored")
@@ -0,0 +1,199 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Any, List, NamedTuple, Optional, Sequence, Tuple
+
+from llm_report import QA_MODEL_NAME, QA_TEMPERATURE, count_tokens, prompt_tokens
+from metrics import metrics
+
+try:
+    import anthropic
+except ImportError:  # only needed to recognise the client's own errors
+    anthropic = None
+
+RETRYABLE_STATUS = {408, 409, 429}
+RETRYABLE_ERRORS = (asyncio.TimeoutError, ConnectionError)
+if anthropic is not None:
+    # Raised without a status code when the request never got a response
+    RETRYABLE_ERRORS += (anthropic.APIConnectionError, anthropic.APITimeoutError)
+
+
+class QAResult(NamedTuple):
+    answer: Optional[str]
+    error: Optional[BaseException]
+    attempts: int
+    latency: float
+
+
+class TokenBucket:
+    """Asyncio token bucket refilled continuously at ``rate_per_minute``."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0):
+        # A request larger than the bucket would wait forever; let it drain
+        # the whole bucket instead.
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+def status_code(error: BaseException) -> Optional[int]:
+    """HTTP status carried by an API client exception, if any."""
+    for candidate in (error, getattr(error, "response", None)):
+        code = getattr(candidate, "status_code", None) or getattr(
+            candidate, "status", None
+        )
+        if isinstance(code, int):
+            return code
+    return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Rate limits, server errors, timeouts and dropped connections are worth retrying.
+
+    Connection failures and timeouts from the anthropic client carry no
+    status code and do not derive from the builtin ConnectionError, so they
+    are matched by type.
+    """
+    code = status_code(error)
+    if code is not None:
+        return code in RETRYABLE_STATUS or code >= 500
+    return isinstance(error, RETRYABLE_ERRORS)
+
+
+class AsyncQAExecutor:
+    """Run many QA chain calls concurrently under rate limits.
+
+    Concurrency is capped by a semaphore, requests and prompt tokens per
+    minute are metered by token buckets, and retryable failures (429, 5xx,
+    connection errors) are retried with jittered exponential backoff.
+    Failures are returned as exceptions on the result rather than
+    flattened into an answer string. With a ``response_cache``, cached
+    answers are returned without touching the limits (``bypass_cache``
+    skips the lookup but still stores fresh answers). Per-call
+    ``callbacks`` (e.g. schemas.streaming_handler) see streamed tokens.
+    """
+
+    def __init__(
+        self,
+        chain,
+        max_concurrency: int = 8,
+        requests_per_minute: float = 50,
+        tokens_per_minute: float = 40000,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        response_cache=None,
+        bypass_cache: bool = False,
+    ):
+        self.chain = chain
+        self.response_cache = response_cache
+        self.bypass_cache = bypass_cache
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._loop_state = None
+
+    def _limits(self):
+        # Asyncio primitives are bound to the loop they are first used on
+        loop = asyncio.get_running_loop()
+        if self._loop_state is None or self._loop_state[0] is not loop:
+            self._loop_state = (
+                loop,
+                asyncio.Semaphore(self.max_concurrency),
+                TokenBucket(self.requests_per_minute),
+                TokenBucket(self.tokens_per_minute),
+            )
+        return self._loop_state[1:]
+
+    async def ask(
+        self, docs: Sequence[Any], query: str, callbacks: Optional[list] = None
+    ) -> QAResult:
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = self.response_cache.key_for(
+                QA_MODEL_NAME, QA_TEMPERATURE, query, docs
+            )
+            if not self.bypass_cache:
+                cached = self.response_cache.get(cache_key)
+                if cached is not None:
+                    metrics.incr("llm_cache_hits")
+                    return QAResult(cached, None, 0, 0.0)
+
+        semaphore, requests, tokens = self._limits()
+        sent = prompt_tokens(query, docs)
+
+        start = time.perf_counter()
+        attempt = 0
+        async with semaphore:
+            while True:
+                attempt += 1
+                await requests.acquire()
+                await tokens.acquire(sent)
+                metrics.incr("llm_calls")
+                metrics.incr("tokens_sent", sent)
+                try:
+                    with metrics.stage("llm"):
+                        answer = await self.chain.arun(
+                            input_documents=list(docs),
+                            question=query,
+                            callbacks=callbacks,
+                        )
+                    metrics.incr("tokens_received", count_tokens(answer))
+                    if cache_key is not None:
+                        self.response_cache.put(cache_key, answer)
+                    return QAResult(answer, None, attempt, time.perf_counter() - start)
+                except Exception as e:
+                    if attempt > self.max_retries or not is_retryable(e):
+                        return QAResult(None, e, attempt, time.perf_counter() - start)
+                    delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+                    await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
+    async def ask_many(self, requests: List[Tuple[Sequence[Any], str]]):
+        """Answer every ``(docs, query)`` pair; results keep the input order."""
+        return await asyncio.gather(
+            *(self.ask(docs, query) for docs, query in requests)
+        )
+
+    def run(self, requests: List[Tuple[Sequence[Any], str]]) -> List[QAResult]:
+        """Synchronous wrapper around ask_many()."""
+        return asyncio.run(self.ask_many(requests))
+
+
+class BackgroundLoop:
+    """An event loop on a daemon thread, for submitting coroutines from threads."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name="qa-loop", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
@@ -483,6 +483,40 @@ Quality checks:
 - Confirm alignment with regulatory requirements
 """
 
+# Short retrieval queries per (language, task). The prompts above are long
+# instructions for the LLM; embedding them for similarity search is slow and
+# MiniLM truncates them anyway, so retrieval runs these compact sub-queries
+# instead and only the LLM sees the full prompt.
+retrieval_queries = {
+    ("English", "1"): [
+        "total revenue for the year",
+        "consolidated statement of income revenue",
+        "summary of financial information",
+        "revenue from contracts with customers",
+        "financial highlights revenue growth",
+    ],
+    ("Arabic", "1"): [
+        "إجمالي الإيرادات للسنة",
+        "ملخص المعلومات المالية",
+        "قائمة الدخل الموحدة الإيرادات",
+        "الإيرادات من العقود مع العملاء",
+    ],
+    ("English", "2"): [
+        "offer price per share",
+        "number of offer shares",
+        "offering period subscription dates",
+        "use of proceeds",
+        "total offer size",
+    ],
+    ("Arabic", "2"): [
+        "سعر الطرح للسهم",
+        "عدد أسهم الطرح",
+        "فترة الطرح والاكتتاب",
+        "استخدام متحصلات الطرح",
+        "إجمالي قيمة الطرح",
+    ],
+}
+
 
 def get_query(language: str, task: str):
     if language == "Arabic":
@@ -495,3 +529,7 @@ def get_query(language: str, task: str):
             return english_revenue_query
         else:
             return english_ipo_query
+
+
+def get_retrieval_queries(language: str, task: str):
+    return retrieval_queries.get((language, "1" if task == "1" else "2"))
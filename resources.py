@@ -0,0 +1,49 @@
+import os
+import threading
+from typing import Any, Callable, Hashable
+
+
+class ResourceRegistry:
+    """Process-wide cache of expensive, long-lived objects.
+
+    Each resource is built by its factory the first time it is requested
+    and the same instance is returned afterwards. Construction happens
+    under a lock, so concurrent callers never load a model twice.
+    """
+
+    def __init__(self):
+        self._instances = {}
+        self._lock = threading.RLock()
+
+    def get(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        try:
+            return self._instances[key]
+        except KeyError:
+            pass
+        with self._lock:
+            if key not in self._instances:
+                self._instances[key] = factory()
+            return self._instances[key]
+
+
+registry = ResourceRegistry()
+
+# tiktoken downloads its BPE files on first use and caches them here (in a
+# temp dir by default), so later runs and benchmarks work offline
+DEFAULT_TIKTOKEN_DIR = os.path.join(".cache", "tiktoken")
+
+
+def get_encoding(name: str = "cl100k_base"):
+    """Shared tiktoken encoding, loaded on first use.
+
+    The BPE file is read from TIKTOKEN_CACHE_DIR (default: .cache/tiktoken)
+    and only downloaded when it is not there yet.
+    """
+
+    def load():
+        os.environ.setdefault("TIKTOKEN_CACHE_DIR", DEFAULT_TIKTOKEN_DIR)
+        import tiktoken
+
+        return tiktoken.get_encoding(name)
+
+    return registry.get(("encoding", name), load)
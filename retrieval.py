@@ -0,0 +1,193 @@
+import hashlib
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from extraction import fix_arabic
+from normalization import SEARCH_FOLD_TABLE
+
+_TOKEN = re.compile(r"\w+")
+
+
+def fold_text(text: str) -> str:
+    """Fold text for matching.
+
+    NFKC folds presentation forms back to base letters, then diacritics and
+    tatweel are dropped, alef/yeh/teh marbuta variants are unified,
+    Arabic-Indic digits become ASCII and everything is lowercased.
+    """
+    return unicodedata.normalize("NFKC", text).translate(SEARCH_FOLD_TABLE).lower()
+
+
+def tokenize(text: str) -> List[str]:
+    """Arabic-aware search tokens of the folded text."""
+    return _TOKEN.findall(fold_text(text))
+
+
+def _doc_id(doc) -> str:
+    key = doc.metadata.get("doc_key", doc.metadata.get("source", ""))
+    digest = hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+    return f"{key}:{digest}"
+
+
+def _matches(doc, filter: Optional[dict]) -> bool:
+    return not filter or all(doc.metadata.get(k) == v for k, v in filter.items())
+
+
+class LexicalIndex:
+    """BM25 over a fixed set of chunks with a precomputed inverted index."""
+
+    def __init__(self, documents: Sequence, k1: float = 1.5, b: float = 0.75):
+        self.documents = list(documents)
+        self.k1 = k1
+        self.b = b
+
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.lengths = []
+        for i, doc in enumerate(self.documents):
+            counts = Counter(tokenize(doc.page_content))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((i, tf))
+
+        total = len(self.documents)
+        self.avg_length = (sum(self.lengths) / total) if total else 0.0
+        self.idf = {
+            term: math.log(1 + (total - len(posting) + 0.5) / (len(posting) + 0.5))
+            for term, posting in self.postings.items()
+        }
+
+    def search(
+        self, query: str, k: int = 10, filter: Optional[dict] = None
+    ) -> List[Tuple[object, float]]:
+        """Top ``k`` ``(document, bm25 score)`` pairs for ``query``."""
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self.postings[term]:
+                norm = 1 - self.b + self.b * self.lengths[i] / (self.avg_length or 1)
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        results = []
+        for i, score in ranked:
+            if _matches(self.documents[i], filter):
+                results.append((self.documents[i], score))
+                if len(results) >= k:
+                    break
+        return results
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[object]], k: int = 60
+) -> List[Tuple[object, float]]:
+    """Fuse several ranked document lists; returns ``(doc, score)`` best first."""
+    scores: Dict[str, float] = defaultdict(float)
+    docs = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            doc_id = _doc_id(doc)
+            docs.setdefault(doc_id, doc)
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    ordered = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return [(docs[doc_id], score) for doc_id, score in ordered]
+
+
+class HybridRetriever:
+    """FAISS similarity search fused with BM25 through reciprocal rank fusion.
+
+    Exposes the same search methods ``ask_question`` uses on a vector
+    store, so it can be passed anywhere a ``docsearch`` is expected.
+    Queries are run through ``query_transform`` (the page text fix-up by
+    default) so they tokenize the same way as the indexed chunks. With
+    ``embeddings``, search_many() embeds all sub-queries in one call.
+    """
+
+    def __init__(
+        self,
+        docsearch,
+        documents: Sequence,
+        rrf_k: int = 60,
+        query_transform: Optional[Callable[[str], str]] = fix_arabic,
+        embeddings=None,
+    ):
+        self.docsearch = docsearch
+        self.embeddings = embeddings
+        self.lexical = LexicalIndex(documents)
+        self.rrf_k = rrf_k
+        self.query_transform = query_transform
+
+    def similarity_search_with_relevance_scores(self, query: str, k: int = 4, **kwargs):
+        vector_hits = self.docsearch.similarity_search_with_relevance_scores(
+            query, k=k, **kwargs
+        )
+        lexical_query = self.query_transform(query) if self.query_transform else query
+        lexical_hits = self.lexical.search(
+            lexical_query, k=k, filter=kwargs.get("filter")
+        )
+        fused = reciprocal_rank_fusion(
+            [[doc for doc, _ in vector_hits], [doc for doc, _ in lexical_hits]],
+            k=self.rrf_k,
+        )
+        return fused[:k]
+
+    def search_many(self, queries: Sequence[str], k: int = 4, **kwargs):
+        """Fused ``(doc, score)`` results for several short queries at once."""
+        if self.embeddings is not None:
+            vectors = self.embeddings.embed_documents(list(queries))
+            vector_rankings = [
+                [
+                    doc
+                    for doc, _ in self.docsearch.similarity_search_with_score_by_vector(
+                        vector, k=k, **kwargs
+                    )
+                ]
+                for vector in vectors
+            ]
+        else:
+            vector_rankings = [
+                self.docsearch.similarity_search(query, k=k, **kwargs)
+                for query in queries
+            ]
+        lexical_rankings = [
+            [
+                doc
+                for doc, _ in self.lexical.search(
+                    self.query_transform(query) if self.query_transform else query,
+                    k=k,
+                    filter=kwargs.get("filter"),
+                )
+            ]
+            for query in queries
+        ]
+        fused = reciprocal_rank_fusion(vector_rankings + lexical_rankings, k=self.rrf_k)
+        return fused[:k]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs):
+        return [
+            doc
+            for doc, _ in self.similarity_search_with_relevance_scores(
+                query, k=k, **kwargs
+            )
+        ]
+
+
+def multi_query_search(
+    docsearch, queries: Sequence[str], k: int = 4, search_kwargs: Optional[dict] = None
+) -> List[Tuple[object, float]]:
+    """Run several retrieval queries and fuse their rankings.
+
+    Uses the retriever's batched ``search_many`` when it has one, otherwise
+    one similarity search per query.
+    """
+    search_kwargs = search_kwargs or {}
+    if hasattr(docsearch, "search_many"):
+        return docsearch.search_many(queries, k=k, **search_kwargs)
+    rankings = [
+        docsearch.similarity_search(query, k=k, **search_kwargs) for query in queries
+    ]
+    return reciprocal_rank_fusion(rankings)[:k]
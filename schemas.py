@@ -0,0 +1,285 @@
+import json
+import re
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+_NUMBER = re.compile(r"[-+]?\d[\d,]*(?:\.\d+)?")
+_SCALES = {"thousand": 1e3, "million": 1e6, "billion": 1e9, "mn": 1e6, "bn": 1e9}
+
+
+def as_number(value) -> Optional[float]:
+    """Numbers the model writes as strings ("1,234.5", "(300)", "2.1 million").
+
+    Booleans are rejected rather than read as 0/1.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"expected a number, got {value!r}")
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        raise ValueError(f"expected a number, got {type(value).__name__}")
+    text = value.strip().lower()
+    if not text or text in {"null", "n/a", "none", "-"}:
+        return None
+    match = _NUMBER.search(text)
+    if match is None:
+        raise ValueError(f"no number in {value!r}")
+    number = float(match.group().replace(",", ""))
+    for word, factor in _SCALES.items():
+        if re.search(rf"\b{word}\b", text[match.end() :]):
+            number *= factor
+            break
+    if text.startswith("(") and text.endswith(")"):
+        number = -number
+    return number
+
+
+def as_text(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value).strip() or None
+
+
+def as_list(value) -> Optional[List[Any]]:
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return value
+    if isinstance(value, str):
+        return [part.strip() for part in value.split(",") if part.strip()]
+    return [value]
+
+
+def as_any(value):
+    return value
+
+
+class RevenueResult(NamedTuple):
+    revenue: Optional[float] = None
+    currency: Optional[str] = None
+    period: Optional[str] = None
+    source_text: Optional[str] = None
+    location: Optional[str] = None
+    data_freshness: Optional[str] = None
+    audit_status: Optional[str] = None
+    reporting_standard: Optional[str] = None
+    comparative_period: Optional[Any] = None
+    segment_breakdown: Optional[Any] = None
+    geographic_breakdown: Optional[Any] = None
+    revenue_growth: Optional[float] = None
+    revenue_quality: Optional[str] = None
+    revenue_risks: Optional[str] = None
+
+
+class IPOResult(NamedTuple):
+    offer_price: Optional[float] = None
+    currency: Optional[str] = None
+    shares_offered: Optional[float] = None
+    offer_size: Optional[float] = None
+    percentage_offered: Optional[float] = None
+    price_range: Optional[str] = None
+    offering_period_start: Optional[str] = None
+    offering_period_end: Optional[str] = None
+    listing_date: Optional[str] = None
+    use_of_proceeds: Optional[str] = None
+    underwriters: Optional[List[Any]] = None
+    financial_advisors: Optional[List[Any]] = None
+    receiving_agents: Optional[List[Any]] = None
+    source_text: Optional[str] = None
+    location: Optional[str] = None
+
+
+# Field order matters: the model is asked to emit the headline figure first
+# so consumers can act on it before the rest has streamed in.
+SCHEMAS: Dict[str, Tuple[type, Dict[str, Callable]]] = {
+    "1": (
+        RevenueResult,
+        {
+            "revenue": as_number,
+            "currency": as_text,
+            "period": as_text,
+            "source_text": as_text,
+            "location": as_text,
+            "data_freshness": as_text,
+            "audit_status": as_text,
+            "reporting_standard": as_text,
+            "comparative_period": as_any,
+            "segment_breakdown": as_any,
+            "geographic_breakdown": as_any,
+            "revenue_growth": as_number,
+            "revenue_quality": as_text,
+            "revenue_risks": as_text,
+        },
+    ),
+    "2": (
+        IPOResult,
+        {
+            "offer_price": as_number,
+            "currency": as_text,
+            "shares_offered": as_number,
+            "offer_size": as_number,
+            "percentage_offered": as_number,
+            "price_range": as_text,
+            "offering_period_start": as_text,
+            "offering_period_end": as_text,
+            "listing_date": as_text,
+            "use_of_proceeds": as_text,
+            "underwriters": as_list,
+            "financial_advisors": as_list,
+            "receiving_agents": as_list,
+            "source_text": as_text,
+            "location": as_text,
+        },
+    ),
+}
+
+
+def _schema(task: str):
+    return SCHEMAS["1" if task == "1" else "2"]
+
+
+def output_instructions(task: str) -> str:
+    """Suffix for a task prompt asking for a single flat JSON object."""
+    _, fields = _schema(task)
+    keys = ", ".join(f'"{name}"' for name in fields)
+    return (
+        "\n\nRespond with a single JSON object and nothing else. Use exactly "
+        f"these keys, in this order: {keys}. Monetary amounts and percentages "
+        "are JSON numbers (full value, decimal fractions for percentages); "
+        "use null for anything not found. Dates are YYYY-MM-DD strings."
+    )
+
+
+class StreamingJSONParser:
+    """Incrementally parse a streamed flat JSON object into validated fields.
+
+    ``feed`` accepts arbitrary text chunks and yields ``(field, value)`` as
+    soon as each top-level value is complete; nested objects and arrays
+    are emitted whole once closed. Each character is scanned once and only
+    the value being read is kept between chunks, so parsing costs
+    O(total length) regardless of chunk size. Text before
+    the opening brace (a markdown fence, a preamble) is skipped, unknown
+    keys are ignored and values that fail validation are collected in
+    ``errors`` instead of aborting the stream.
+    """
+
+    def __init__(self, task: str):
+        self.model, self.fields = _schema(task)
+        self.values: Dict[str, Any] = {}
+        self.errors: Dict[str, str] = {}
+        self.done = False
+        # Text of the current token from earlier chunks; only the token
+        # being read is kept, never the whole stream
+        self._parts: List[str] = []
+        self._chunk = ""
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._token_start: Optional[int] = None
+        self._key: Optional[str] = None
+
+    def feed(self, chunk: str) -> Iterator[Tuple[str, Any]]:
+        self._chunk = chunk
+        for pos, char in enumerate(chunk):
+            if self.done:
+                return
+            if self._depth == 0:
+                if char == "{":
+                    self._depth = 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        yield from self._close_token(pos + 1)
+            elif char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._token_start is None:
+                    self._token_start = pos
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 2 and self._token_start is None:
+                    self._token_start = pos
+            elif char in "}]":
+                if self._depth == 1:
+                    yield from self._close_token(pos)
+                    self.done = True
+                self._depth -= 1
+                if self._depth == 1:
+                    yield from self._close_token(pos + 1)
+            elif self._depth == 1:
+                if char == ",":
+                    yield from self._close_token(pos)
+                elif char == ":":
+                    self._token_start = None
+                    self._parts = []
+                elif not char.isspace() and self._token_start is None:
+                    self._token_start = pos
+        if self._token_start is not None and not self.done:
+            # The token runs on into the next chunk
+            self._parts.append(chunk[self._token_start :])
+            self._token_start = 0
+
+    def _close_token(self, end: int) -> Iterator[Tuple[str, Any]]:
+        start, self._token_start = self._token_start, None
+        if start is None:
+            return
+        raw = ("".join(self._parts) + self._chunk[start:end]).strip()
+        self._parts = []
+        if self._key is None:
+            if raw.startswith('"'):
+                self._key = json.loads(raw)
+            return
+        key, self._key = self._key, None
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            self.errors[key] = f"invalid JSON value {raw[:40]!r}"
+            return
+        if key not in self.fields:
+            return
+        try:
+            value = self.fields[key](value)
+        except (TypeError, ValueError) as e:
+            self.errors[key] = str(e)
+            return
+        self.values[key] = value
+        yield key, value
+
+    def result(self):
+        """The typed model built from the fields seen so far."""
+        return self.model(**self.values)
+
+
+def parse_result(task: str, text: str):
+    """Parse a complete answer; returns ``(typed result, field errors)``."""
+    parser = StreamingJSONParser(task)
+    for _ in parser.feed(text):
+        pass
+    return parser.result(), parser.errors
+
+
+def streaming_handler(task: str, on_field: Optional[Callable[[str, Any], None]] = None):
+    """LangChain callback handler feeding streamed tokens to a parser.
+
+    The parser is exposed as ``handler.parser``; ``on_field`` is called
+    with each validated field as soon as it completes.
+    """
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class FieldStreamHandler(BaseCallbackHandler):
+        def __init__(self):
+            self.parser = StreamingJSONParser(task)
+
+        def on_llm_new_token(self, token: str, **kwargs):
+            for field, value in self.parser.feed(token):
+                if on_field is not None:
+                    on_field(field, value)
+
+    return FieldStreamHandler()
@@ -0,0 +1,658 @@
+"""Long-running extraction service: warm models behind a local HTTP API.
+
+Usage:
+    python service.py [--port 8080 | --socket /tmp/fre.sock] [--root data]
+        [--workers 2] [--queue-size 16] [--deadline 120] [--prefilter]
+        [--save-interval 30] [--save-every 8]
+
+The embedding model, tokenizer, keyword matchers and QA chain are loaded
+once at startup. Per-document work is cached as before: page text on
+disk, chunks in the FAISS store and LLM answers in the response cache.
+New chunks are written to the FAISS store in the background, every
+``--save-interval`` seconds or once ``--save-every`` documents are
+waiting, and at shutdown, so indexing a PDF never waits for the whole
+store to be rewritten.
+The prefilter's page selection and each document's hybrid retriever are
+also kept in memory, so a repeated request for a known document only
+hashes the file, retrieves and reads the cached answer.
+
+Endpoints (JSON bodies and responses):
+    POST   /jobs       {"file": "data/x.pdf", "task": "revenue" | "ipo",
+                        "deadline": seconds, "wait": true}
+                       202 with the job id, or the finished job when
+                       "wait" is set; 429 when the queue is full, 503 when
+                       the deadline cannot be met at the current backlog
+    GET    /jobs/<id>  state (queued, running, done, failed, cancelled,
+                       expired) and, once done, the result
+    DELETE /jobs/<id>  cancel a queued or running job
+    GET    /health     queue depth, workers and average job time
+    GET    /metrics    Prometheus text format (see metrics.py)
+
+Cancellation and deadlines are checked between pipeline steps; a step
+that has started (an LLM call, say) runs to completion and its result is
+discarded. Only PDFs under ``--root`` (default: data) are served.
+"""
+
+import argparse
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from extraction import extract_pages, extractor_version, fix_arabic, open_page_cache
+from keyword_registry import keyword_set
+from language import detect_document_language
+from llm_report import (
+    embedding_model_key,
+    ask_question,
+    initialize_embeddings,
+    initialize_qa_chain,
+    split_pages,
+)
+from metrics import metrics
+from numeric_extractor import FAST_PATH_CONFIDENCE, extract_revenue, to_result
+from page_filter import select_pages
+from queries import get_query, get_retrieval_queries
+from resources import get_encoding
+from retrieval import HybridRetriever
+from schemas import parse_result
+
+TASKS = {"revenue": "1", "ipo": "2"}
+# Requests may only name PDFs below this directory
+DEFAULT_ROOT = "data"
+# HTTP status for each finished state
+_STATUS = {"done": 200, "failed": 500, "cancelled": 409, "expired": 504}
+
+
+class Rejected(Exception):
+    """A request turned away by admission control."""
+
+    def __init__(self, status: int, reason: str, retry_after: Optional[float] = None):
+        super().__init__(reason)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, file: str, task: str, deadline: float):
+        self.id = uuid.uuid4().hex
+        self.file = file
+        self.task = task
+        self.created = time.monotonic()
+        self.deadline = self.created + deadline
+        self.state = "queued"
+        self.result = None
+        self.answer = None
+        self.error = None
+        self.timings = {}
+        self.cancel_requested = False
+        self._lock = threading.RLock()
+        self._finished = threading.Event()
+
+    def check(self):
+        """Raise if the job was cancelled or ran out of time."""
+        if self.cancel_requested:
+            raise JobCancelled()
+        if time.monotonic() > self.deadline:
+            raise DeadlineExceeded()
+
+    @contextmanager
+    def step(self, name: str):
+        """Check, then time the block as ``name`` in this job's timings."""
+        self.check()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round(time.perf_counter() - start, 4)
+
+    def begin(self) -> bool:
+        """Mark a queued job running; False if it already has an outcome."""
+        with self._lock:
+            if self._finished.is_set():
+                return False
+            self.state = "running"
+            return True
+
+    def cancel(self) -> None:
+        """Ask the worker to stop; a job still queued is cancelled at once.
+
+        A queued job stays in the queue and the worker drops it on arrival.
+        """
+        with self._lock:
+            self.cancel_requested = True
+            if self.state == "queued":
+                self.finish("cancelled")
+
+    def finish(self, state: str, error: Optional[str] = None) -> bool:
+        """Record the outcome; the first caller wins, later ones return False.
+
+        A worker and a timed-out waiter (or a DELETE) can race to finish the
+        same job.
+        """
+        with self._lock:
+            if self._finished.is_set():
+                return False
+            self.state = state
+            self.error = error
+            self._finished.set()
+            return True
+
+    @property
+    def finished(self) -> bool:
+        return self._finished.is_set()
+
+    def wait(self, timeout: Optional[float]) -> bool:
+        return self._finished.wait(timeout)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "file": self.file,
+            "task": self.task,
+            "state": self.state,
+            "result": self.result,
+            "answer": self.answer,
+            "error": self.error,
+            "timings": self.timings,
+            "age_seconds": round(time.monotonic() - self.created, 3),
+        }
+
+
+class ExtractionService:
+    """Queue of extraction jobs served by warm worker threads.
+
+    Admission control rejects a request when the queue is full, or when
+    the backlog ahead of it (at the recent average job time) would already
+    overrun its deadline. Finished jobs are kept for ``retain`` lookups.
+    Documents added to the vector store are saved by a background thread
+    every ``save_interval`` seconds, sooner once ``save_every`` are
+    waiting, and by stop().
+    """
+
+    def __init__(
+        self,
+        root: str = DEFAULT_ROOT,
+        workers: int = 2,
+        queue_size: int = 16,
+        default_deadline: float = 120.0,
+        max_deadline: float = 600.0,
+        prefilter: bool = False,
+        top_pages: int = 16,
+        fast_path: bool = True,
+        retain: int = 1000,
+        cache_size: int = 256,
+        save_interval: float = 30.0,
+        save_every: int = 8,
+    ):
+        from embedding_cache import CachedEmbeddings
+        from response_cache import ResponseCache
+        from vector_store import PersistentVectorStore
+
+        self.root = os.path.realpath(root)
+        if not os.path.isdir(self.root):
+            raise ValueError(f"service root {root!r} is not a directory")
+        self.workers = workers
+        self.default_deadline = default_deadline
+        self.max_deadline = max_deadline
+        self.prefilter = prefilter
+        self.top_pages = top_pages
+        self.fast_path = fast_path
+        self.retain = retain
+        self.cache_size = cache_size
+        self.save_interval = save_interval
+        self.save_every = save_every
+
+        self.page_cache = open_page_cache()
+        self.embeddings = CachedEmbeddings(
+            initialize_embeddings(None), embedding_model_key()
+        )
+        self.store = PersistentVectorStore(self.embeddings, embedding_model_key())
+        self.response_cache = ResponseCache()
+        self.chain = initialize_qa_chain()
+        # FAISS is not safe for concurrent add/search
+        self._store_lock = threading.Lock()
+        # Documents added since the store was last saved
+        self._unsaved = 0
+        self._save_now = threading.Event()
+        self._stopping = threading.Event()
+        self._saver = None
+        # (file hash, task) -> selected pages; doc_key -> HybridRetriever
+        self._selections = OrderedDict()
+        self._retrievers = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._jobs = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._running = 0
+        self._average = None
+        self._threads = []
+
+    # ---- lifecycle ----
+
+    def warm(self):
+        """Load everything a first request would otherwise wait for."""
+        with metrics.stage("warm"):
+            get_encoding()
+            for choice in TASKS.values():
+                keyword_set(choice, transform=fix_arabic)
+            # The model is only really loaded by the first encode
+            self.embeddings.base.embed_query("warm up")
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self._saver = threading.Thread(
+            target=self._save_loop, name="store-saver", daemon=True
+        )
+        self._saver.start()
+
+    def stop(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        if self._saver is not None:
+            self._stopping.set()
+            self._save_now.set()
+            self._saver.join()
+        self._save_store()
+
+    def _save_loop(self):
+        while not self._stopping.is_set():
+            self._save_now.wait(self.save_interval)
+            self._save_now.clear()
+            self._save_store()
+
+    def _save_store(self):
+        with self._store_lock:
+            if self._unsaved:
+                self.store.save()
+                self._unsaved = 0
+
+    # ---- API ----
+
+    def submit(self, file: str, task: str, deadline: Optional[float] = None) -> Job:
+        """Queue a job or raise Rejected."""
+        if task not in TASKS:
+            raise Rejected(400, f"task must be one of {sorted(TASKS)}")
+        path = self._resolve(file)
+        if deadline is None:
+            deadline = self.default_deadline
+        deadline = min(deadline, self.max_deadline)
+        if deadline <= 0:
+            raise Rejected(400, "deadline must be positive")
+
+        backlog = self._queue.qsize() + self._running
+        if self._average is not None:
+            expected = (backlog // self.workers + 1) * self._average
+            if expected > deadline:
+                metrics.incr("service_rejected")
+                raise Rejected(
+                    503,
+                    f"expected wait {expected:.1f}s exceeds deadline {deadline:.1f}s",
+                    retry_after=expected - deadline,
+                )
+
+        job = Job(path, task, deadline)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            metrics.incr("service_rejected")
+            raise Rejected(429, "queue full", retry_after=self._average or 1.0)
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+            self._trim_jobs()
+        metrics.incr("service_accepted")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def health(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "queue_size": self._queue.maxsize,
+            "running": self._running,
+            "workers": self.workers,
+            "unsaved_documents": self._unsaved,
+            "average_job_seconds": (
+                round(self._average, 3) if self._average is not None else None
+            ),
+        }
+
+    # ---- workers ----
+
+    def _resolve(self, file: str) -> str:
+        path = os.path.realpath(file)
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise Rejected(403, "file is outside the service root")
+        if not path.lower().endswith(".pdf") or not os.path.isfile(path):
+            raise Rejected(404, f"no PDF at {file}")
+        return path
+
+    def _trim_jobs(self):
+        while len(self._jobs) > self.retain:
+            oldest = next(iter(self._jobs))
+            if not self._jobs[oldest].finished:
+                break
+            del self._jobs[oldest]
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            if not job.begin():
+                continue
+            with self._jobs_lock:
+                self._running += 1
+            start = time.perf_counter()
+            try:
+                with metrics.stage("service_job"):
+                    self._process(job)
+                job.finish("done")
+            except JobCancelled:
+                job.finish("cancelled")
+            except DeadlineExceeded:
+                if job.finish("expired", "deadline exceeded"):
+                    metrics.incr("service_expired")
+            except Exception as e:
+                job.finish("failed", str(e))
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._jobs_lock:
+                    self._running -= 1
+                    # Moving average of recent jobs drives admission control
+                    self._average = (
+                        elapsed
+                        if self._average is None
+                        else 0.8 * self._average + 0.2 * elapsed
+                    )
+
+    def _cached(self, cache: OrderedDict, key, factory):
+        with self._cache_lock:
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+        # Built outside the lock; two workers racing on a new key both build
+        value = factory()
+        with self._cache_lock:
+            cache[key] = value
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return value
+
+    def _process(self, job: Job):
+        choice = TASKS[job.task]
+        with job.step("pages"):
+            file_hash = self.page_cache.key_for(job.file)
+            page_numbers = None
+            if self.prefilter:
+                page_numbers = self._cached(
+                    self._selections,
+                    (file_hash, choice, self.top_pages),
+                    lambda: select_pages(
+                        job.file, choice, top_n=self.top_pages, cache=self.page_cache
+                    ).pages,
+                )
+            pages = extract_pages(
+                job.file, cache=self.page_cache, page_numbers=page_numbers
+            )
+            language = detect_document_language(pages).language
+        query = get_query(language=language, task=choice)
+        if query is None:
+            raise ValueError(f"no query for language {language!r}")
+
+        docs = None
+        if self.fast_path and choice == "1":
+            with job.step("numeric"):
+                docs = split_pages(pages, job.file, choice=choice, verbose=False)
+                reading = extract_revenue(docs)
+            if reading.confidence >= FAST_PATH_CONFIDENCE:
+                job.result = to_result(reading)._asdict()
+                return
+
+        doc_key = self.store.document_key(
+            file_hash,
+            choice=choice,
+            window_chars=1500,
+            extractor=extractor_version(),
+            pages=page_numbers,
+        )
+        with job.step("index"):
+            if doc_key not in self.store:
+                if docs is None:
+                    docs = split_pages(pages, job.file, choice=choice, verbose=False)
+                # Embed outside the lock; add_documents then hits the cache
+                self.embeddings.embed_documents([doc.page_content for doc in docs])
+                with self._store_lock:
+                    if self.store.add_documents(doc_key, docs, save=False):
+                        self._unsaved += 1
+                        if self._unsaved >= self.save_every:
+                            self._save_now.set()
+            retriever = self._cached(
+                self._retrievers, doc_key, lambda: self._retriever(doc_key)
+            )
+
+        with job.step("answer"):
+            answer = ask_question(
+                retriever,
+                self.chain,
+                query,
+                response_cache=self.response_cache,
+                retrieval_queries=get_retrieval_queries(language=language, task=choice),
+                task=choice,
+            )
+        job.check()
+        if answer.startswith("Error:"):
+            raise RuntimeError(answer[len("Error:") :].strip())
+        result, errors = parse_result(choice, answer)
+        job.answer = answer
+        job.result = result._asdict()
+        if errors:
+            job.error = f"invalid fields: {errors}"
+
+    def _retriever(self, doc_key: str) -> HybridRetriever:
+        # The per-document index is a private copy, searched without the lock
+        with self._store_lock:
+            index = self.store.document_index(doc_key)
+            documents = self.store.documents(doc_key)
+        return HybridRetriever(index, documents, embeddings=self.embeddings)
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    service: ExtractionService = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, payload, headers=None, content_type=None):
+        if content_type is None:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            content_type = "application/json"
+        else:
+            body = payload.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _job_id(self) -> Optional[str]:
+        parts = self.path.strip("/").split("/")
+        return parts[1] if len(parts) == 2 and parts[0] == "jobs" else None
+
+    def _send_job(self, job: Job):
+        status = _STATUS.get(job.state, 202)
+        self._send(status, job.to_dict())
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, self.service.health())
+        elif self.path == "/metrics":
+            self._send(
+                200, metrics.prometheus(), content_type="text/plain; version=0.0.4"
+            )
+        elif self._job_id():
+            job = self.service.get(self._job_id())
+            if job is None:
+                self._send(404, {"error": "unknown job"})
+            else:
+                self._send_job(job)
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/jobs":
+            self._send(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            job = self.service.submit(
+                request.get("file", ""),
+                request.get("task", "revenue"),
+                request.get("deadline"),
+            )
+        except Rejected as e:
+            headers = {}
+            if e.retry_after is not None:
+                headers["Retry-After"] = str(max(1, round(e.retry_after)))
+            self._send(e.status, {"error": str(e)}, headers)
+            return
+        except (ValueError, TypeError) as e:
+            self._send(400, {"error": f"bad request: {e}"})
+            return
+
+        if request.get("wait"):
+            job.wait(max(0.0, job.deadline - time.monotonic()))
+            if not job.finished:
+                # Stop the worker (if one has it) and report the expiry,
+                # unless the worker finished first
+                job.cancel_requested = True
+                if job.finish("expired", "deadline exceeded"):
+                    metrics.incr("service_expired")
+            self._send_job(job)
+        else:
+            self._send(202, {"id": job.id, "state": job.state})
+
+    def do_DELETE(self):
+        job_id = self._job_id()
+        job = self.service.cancel(job_id) if job_id else None
+        if job is None:
+            self._send(404, {"error": "unknown job"})
+        else:
+            self._send(200, {"id": job.id, "state": job.state})
+
+
+class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        return request, ("local", 0)
+
+
+def make_server(
+    service: ExtractionService, host="127.0.0.1", port=8080, socket_path=None
+):
+    """HTTP server bound to ``host:port``, or to a Unix socket if given."""
+    handler = type("BoundServiceHandler", (ServiceHandler,), {"service": service})
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        return UnixHTTPServer(socket_path, handler)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--socket", help="serve on this Unix socket instead")
+    parser.add_argument(
+        "--root",
+        default=DEFAULT_ROOT,
+        help=f"only serve PDFs under this directory (default: {DEFAULT_ROOT})",
+    )
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--queue-size", type=int, default=16)
+    parser.add_argument("--deadline", type=float, default=120.0)
+    parser.add_argument("--max-deadline", type=float, default=600.0)
+    parser.add_argument("--top-pages", type=int, default=16)
+    parser.add_argument("--prefilter", action="store_true")
+    parser.add_argument("--no-fast-path", action="store_true")
+    parser.add_argument(
+        "--save-interval",
+        type=float,
+        default=30.0,
+        help="seconds between saves of newly indexed documents (default: 30)",
+    )
+    parser.add_argument(
+        "--save-every",
+        type=int,
+        default=8,
+        help="save sooner once this many documents are unsaved (default: 8)",
+    )
+    args = parser.parse_args(argv)
+
+    service = ExtractionService(
+        root=args.root,
+        workers=args.workers,
+        queue_size=args.queue_size,
+        default_deadline=args.deadline,
+        max_deadline=args.max_deadline,
+        prefilter=args.prefilter,
+        top_pages=args.top_pages,
+        fast_path=not args.no_fast_path,
+        save_interval=args.save_interval,
+        save_every=args.save_every,
+    )
+    start = time.perf_counter()
+    service.warm()
+    service.start()
+    server = make_server(service, args.host, args.port, args.socket)
+    where = args.socket or f"http://{args.host}:{args.port}"
+    print(f"Ready in {time.perf_counter() - start:.1f}s on {where}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+from typing import Iterable, List, Optional, Tuple
+
+# (category, lang, keyword, start, end) as yielded by KeywordMatcher.finditer
+Hit = Tuple[str, str, str, int, int]
+
+
+def _window(hit: Hit, window_chars: int, text_len: int) -> Tuple[int, int]:
+    _, _, _, start, end = hit
+    return max(0, start - window_chars), min(text_len, end + window_chars)
+
+
+def _clip(start: int, end: int, hit: Hit, max_span_chars: Optional[int]):
+    """Shrink ``[start, end)`` to ``max_span_chars`` around the hit itself."""
+    if not max_span_chars or end - start <= max_span_chars:
+        return start, end
+    _, _, _, hit_start, hit_end = hit
+    slack = max(0, max_span_chars - (hit_end - hit_start))
+    new_start = max(start, hit_start - slack // 2)
+    new_end = min(end, new_start + max(max_span_chars, hit_end - hit_start))
+    return new_start, new_end
+
+
+def hit_windows(hits: Iterable[Hit], window_chars: int, text_len: int) -> List[dict]:
+    """One span per hit, without merging (the historical behaviour)."""
+    spans = []
+    for hit in hits:
+        start, end = _window(hit, window_chars, text_len)
+        spans.append({"start": start, "end": end, "matches": [hit[:3] + (hit[3],)]})
+    return spans
+
+
+def merge_windows(
+    hits: Iterable[Hit],
+    window_chars: int,
+    text_len: int,
+    max_span_chars: Optional[int] = None,
+) -> List[dict]:
+    """Merge overlapping or adjacent keyword windows into context spans.
+
+    Args:
+        hits: Keyword hits, in any order
+        window_chars: Number of characters to include around each hit
+        text_len: Length of the text the hits point into
+        max_span_chars: Optional cap on the length of a merged span; a hit
+            that would push a span past it starts a new span where the
+            previous one ends (spans never overlap), and single windows
+            longer than the cap are trimmed around their hit
+
+    Returns:
+        List of ``{"start", "end", "matches"}`` dicts ordered by position,
+        where ``matches`` keeps every contributing
+        ``(category, lang, keyword, position)``
+    """
+    spans = []
+    current = None
+    for hit in sorted(hits, key=lambda h: (h[3], h[4])):
+        start, end = _clip(*_window(hit, window_chars, text_len), hit, max_span_chars)
+        match = hit[:3] + (hit[3],)
+        if current is not None and start <= current["end"]:
+            new_end = max(current["end"], end)
+            if not max_span_chars or new_end - current["start"] <= max_span_chars:
+                current["end"] = new_end
+                current["matches"].append(match)
+                continue
+            if hit[4] <= current["end"]:
+                # The hit is already in the span, only its extra context is cut
+                current["matches"].append(match)
+                continue
+            # Pick up where the capped span stops so no text is sent twice
+            start = max(start, current["end"])
+        current = {"start": start, "end": end, "matches": [match]}
+        spans.append(current)
+    return spans
+
+
+def unique(values: Iterable[str]) -> List[str]:
+    """Distinct values in first-seen order."""
+    return list(dict.fromkeys(values))
@@ -0,0 +1,129 @@
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+from typing import List, Optional
+
+DEFAULT_CACHE_DIR = os.path.join(".cache", "pages")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+_MAGIC = b"FREPAGE1"
+_HEADER = struct.Struct("<8sI")
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    """SHA-256 hex digest of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PageTextCache:
+    """On-disk cache of processed page texts keyed by PDF content hash.
+
+    Each entry is one file: a small header, an array of ``page_count + 1``
+    little-endian uint64 byte offsets, and the UTF-8 encoded pages back to
+    back. Entries are read through ``mmap`` so a hit never touches PyPDF2.
+    The directory is kept under ``max_bytes`` by evicting the least
+    recently used entries (access time is tracked through the file mtime).
+    Other modules can keep small files next to an entry (sidecar_path());
+    they count towards its size and are evicted with it.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        version: str = "",
+    ):
+        self.cache_dir = cache_dir or os.getenv("FRE_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes
+        self.version = version
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key_for(self, pdf_path: str) -> str:
+        return file_sha256(pdf_path)
+
+    def _path(self, key: str) -> str:
+        suffix = f"-v{self.version}" if self.version else ""
+        return os.path.join(self.cache_dir, f"{key}{suffix}.pages")
+
+    def sidecar_path(self, key: str, name: str) -> str:
+        """Path of a file stored with, and evicted with, the entry ``key``."""
+        return os.path.join(self.cache_dir, f"{key}.{name}")
+
+    def get(self, key: str) -> Optional[List[str]]:
+        """Return the cached pages for ``key`` or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f, mmap.mmap(
+                f.fileno(), 0, access=mmap.ACCESS_READ
+            ) as data:
+                magic, page_count = _HEADER.unpack_from(data, 0)
+                if magic != _MAGIC:
+                    return None
+                offsets = struct.unpack_from(f"<{page_count + 1}Q", data, _HEADER.size)
+                base = _HEADER.size + 8 * (page_count + 1)
+                pages = [
+                    data[base + offsets[i] : base + offsets[i + 1]].decode("utf-8")
+                    for i in range(page_count)
+                ]
+        except (FileNotFoundError, ValueError, struct.error):
+            return None
+        os.utime(path)
+        return pages
+
+    def put(self, key: str, pages: List[str]) -> None:
+        """Store ``pages`` under ``key`` and evict old entries if needed."""
+        encoded = [page.encode("utf-8") for page in pages]
+        offsets = [0]
+        for blob in encoded:
+            offsets.append(offsets[-1] + len(blob))
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, len(encoded)))
+                f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+                for blob in encoded:
+                    f.write(blob)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self) -> None:
+        """Drop least recently used entries until the cache fits.
+
+        An entry is every file named after one key: its pages (of any
+        extractor version) and its sidecars. It is as recent as its most
+        recently used file.
+        """
+        entries = {}
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_file() or entry.name.endswith(".tmp"):
+                continue
+            # <key>[-v<version>].pages or <key>.<sidecar>
+            key = entry.name.split(".", 1)[0].split("-v", 1)[0]
+            stat = entry.stat()
+            used, size, paths = entries.get(key, (0.0, 0, []))
+            entries[key] = (
+                max(used, stat.st_mtime),
+                size + stat.st_size,
+                paths + [entry.path],
+            )
+
+        total = sum(size for _, size, _ in entries.values())
+        for _, size, paths in sorted(entries.values()):
+            if total <= self.max_bytes:
+                break
+            for path in paths:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
@@ -0,0 +1,303 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import List, Optional
+
+import faiss
+import numpy as np
+from langchain.schema import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from context_packer import doc_tokens
+from metrics import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: one writer per store directory
+    fcntl = None
+
+DEFAULT_STORE_DIR = os.path.join(".cache", "faiss")
+
+
+def chunking_key(**params) -> str:
+    """Short stable hash of the parameters that shaped the chunks."""
+    encoded = json.dumps(params, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+class PersistentVectorStore:
+    """FAISS index persisted on disk and shared by every processed PDF.
+
+    One store exists per embedding model. Each PDF is added once under a
+    document key built from its content hash and the chunking parameters;
+    adding a key that is already indexed is a no-op, so repeat runs skip
+    embedding entirely and new PDFs are merged into the existing index
+    instead of rebuilding it. The manifest records the index positions of
+    every document's chunks, so reading or searching one document costs
+    the same however large the store grows. Every chunk's token count is
+    stored in its metadata, so packing retrieved chunks needs no tokenizer.
+
+    Processes may share the store (the service next to a batch run). Every
+    read-modify-write of the files holds a lock on the store directory,
+    and documents another process saved in the meantime are loaded and
+    merged before writing. The index and the manifest are written to temp
+    files and renamed into place, and a manifest that does not match the
+    index (after a crash between the renames) is rebuilt from the docstore.
+    """
+
+    def __init__(self, embeddings, model_name: str, store_dir: Optional[str] = None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        root = store_dir or os.getenv("FRE_FAISS_DIR", DEFAULT_STORE_DIR)
+        self.path = os.path.join(root, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+        self._manifest_path = os.path.join(self.path, "manifest.json")
+        self.index = None
+        self.manifest = {}
+        # Keys added since the last save, and the manifest file they were
+        # added on top of
+        self._unsaved: List[str] = []
+        self._stamp = None
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0
+        with self._file_lock():
+            self._load()
+
+    @contextmanager
+    def _file_lock(self):
+        # Reentrant: _load and save() nest inside add_documents
+        with self._thread_lock:
+            if self._lock_depth or fcntl is None:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+            os.makedirs(self.path, exist_ok=True)
+            with open(os.path.join(self.path, "lock"), "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _disk_stamp(self):
+        try:
+            stat = os.stat(self._manifest_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        self._stamp = self._disk_stamp()
+        if self._stamp is None:
+            return
+        with open(self._manifest_path, encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.index = FAISS.load_local(
+            self.path, self.embeddings, allow_dangerous_deserialization=True
+        )
+        indexed = sum(
+            len(entry.get("positions", ())) for entry in self.manifest.values()
+        )
+        if indexed != self.index.index.ntotal or any(
+            "positions" not in entry for entry in self.manifest.values()
+        ):
+            self._record_positions()
+        self._record_token_counts()
+
+    def _record_positions(self):
+        # Manifests written before positions were kept, or out of step with
+        # the index after a crash: one scan of the docstore, then saved
+        positions = defaultdict(list)
+        sources = {}
+        docstore_ids = self.index.index_to_docstore_id
+        for position in sorted(docstore_ids):
+            doc = self.index.docstore.search(docstore_ids[position])
+            if isinstance(doc, Document):
+                doc_key = doc.metadata.get("doc_key")
+                positions[doc_key].append(position)
+                sources.setdefault(doc_key, doc.metadata.get("source"))
+        # Documents that produced no chunks have nothing in the docstore
+        empty = {k: e for k, e in self.manifest.items() if not e.get("chunks")}
+        self.manifest = {
+            doc_key: {
+                "source": sources[doc_key],
+                "chunks": len(doc_positions),
+                "positions": doc_positions,
+            }
+            for doc_key, doc_positions in positions.items()
+            if doc_key is not None
+        }
+        for doc_key, entry in empty.items():
+            self.manifest.setdefault(doc_key, dict(entry, positions=[]))
+        self._write()
+
+    def _record_token_counts(self):
+        # Stores written before chunks carried their count: one pass, then saved
+        stale = [
+            doc
+            for doc_key in self.manifest
+            for doc in self.documents(doc_key)
+            if "token_count" not in doc.metadata
+        ]
+        for doc in stale:
+            doc_tokens(doc)
+        if stale:
+            self._write()
+
+    def _sync(self):
+        """Load what other processes saved; keep this process's unsaved keys."""
+        if self._disk_stamp() == self._stamp:
+            return
+        pending = [
+            (doc_key, self.documents(doc_key), self._vectors(doc_key))
+            for doc_key in self._unsaved
+        ]
+        self.index = None
+        self.manifest = {}
+        self._load()
+        self._unsaved = []
+        for doc_key, docs, vectors in pending:
+            if doc_key not in self.manifest:
+                self._index(doc_key, docs, vectors)
+
+    @metrics.timed("faiss_save")
+    def save(self):
+        """Write the index, docstore and manifest to disk."""
+        with self._file_lock():
+            self._sync()
+            if self.index is not None:
+                self._write()
+            self._unsaved = []
+
+    def _write(self):
+        # Temp files renamed into place: readers never see a partial file,
+        # and the manifest goes last so a crash leaves it behind the index
+        os.makedirs(self.path, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=self.path, prefix=".save-")
+        try:
+            self.index.save_local(staging)
+            with open(
+                os.path.join(staging, "manifest.json"), "w", encoding="utf-8"
+            ) as f:
+                json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+            for name in ("index.faiss", "index.pkl", "manifest.json"):
+                os.replace(os.path.join(staging, name), os.path.join(self.path, name))
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        self._stamp = self._disk_stamp()
+
+    @staticmethod
+    def document_key(pdf_hash: str, **chunk_params) -> str:
+        return f"{pdf_hash}:{chunking_key(**chunk_params)}"
+
+    def __contains__(self, doc_key: str) -> bool:
+        return doc_key in self.manifest
+
+    def add_documents(
+        self, doc_key: str, docs: List[Document], save: bool = True
+    ) -> bool:
+        """Embed and index ``docs`` under ``doc_key`` unless already present.
+
+        Args:
+            doc_key: Key from document_key()
+            docs: Chunks of one PDF
+            save: Persist the store right away; batch callers can pass False
+                and call save() once at the end
+
+        Returns:
+            True if the documents were embedded, False if they were cached
+        """
+        if doc_key in self.manifest:
+            return False
+
+        for doc in docs:
+            doc.metadata["doc_key"] = doc_key
+            # Saved with the docstore for context_packer
+            doc_tokens(doc)
+        # Embedding (through the embeddings cache) runs before taking the
+        # lock, so other processes are not held up by it
+        with metrics.stage("faiss_build"):
+            vectors = self.embeddings.embed_documents(
+                [doc.page_content for doc in docs]
+            )
+            with self._file_lock():
+                self._sync()
+                if doc_key in self.manifest:
+                    return False
+                self._index(doc_key, docs, vectors)
+                self._unsaved.append(doc_key)
+                if save:
+                    self.save()
+        return True
+
+    def _index(self, doc_key: str, docs: List[Document], vectors):
+        pairs = list(zip([doc.page_content for doc in docs], vectors))
+        metadatas = [doc.metadata for doc in docs]
+        ids = [doc.id for doc in docs] if all(doc.id for doc in docs) else None
+        if self.index is None:
+            start = 0
+            self.index = FAISS.from_embeddings(
+                pairs, self.embeddings, metadatas=metadatas, ids=ids
+            )
+        else:
+            start = self.index.index.ntotal
+            self.index.add_embeddings(pairs, metadatas=metadatas, ids=ids)
+        self.manifest[doc_key] = {
+            "source": docs[0].metadata.get("source") if docs else None,
+            "chunks": len(docs),
+            # FAISS appends, so the new chunks take the next positions
+            "positions": list(range(start, start + len(docs))),
+        }
+
+    def _vectors(self, doc_key: str) -> List[List[float]]:
+        shared = self.index.index
+        return [shared.reconstruct(p).tolist() for p in self._positions(doc_key)]
+
+    def _positions(self, doc_key: str) -> List[int]:
+        if self.index is None or doc_key not in self.manifest:
+            return []
+        return self.manifest[doc_key]["positions"]
+
+    def documents(self, doc_key: str) -> List[Document]:
+        """Every stored chunk that belongs to ``doc_key``, in index order."""
+        docstore_ids = self.index.index_to_docstore_id if self.index else {}
+        return [
+            self.index.docstore.search(docstore_ids[position])
+            for position in self._positions(doc_key)
+        ]
+
+    def document_index(self, doc_key: str) -> Optional[FAISS]:
+        """In-memory FAISS index over the chunks of ``doc_key`` only.
+
+        The vectors are copied out of the shared index, not re-embedded, so
+        searches need no filter and never visit other documents' chunks.
+        Returns None when ``doc_key`` has no chunks.
+        """
+        positions = self._positions(doc_key)
+        if not positions:
+            return None
+        shared = self.index.index
+        vectors = np.vstack([shared.reconstruct(position) for position in positions])
+        index = faiss.IndexFlat(shared.d, shared.metric_type)
+        index.add(vectors)
+        docstore_ids = [self.index.index_to_docstore_id[p] for p in positions]
+        return FAISS(
+            self.embeddings,
+            index,
+            InMemoryDocstore({i: self.index.docstore.search(i) for i in docstore_ids}),
+            dict(enumerate(docstore_ids)),
+            relevance_score_fn=self.index.override_relevance_score_fn,
+            normalize_L2=self.index._normalize_L2,
+            distance_strategy=self.index.distance_strategy,
+        )